@@ -0,0 +1,47 @@
+"""add image digest
+
+Revision ID: 3f9c2a7d1b64
+Revises: c52e9f1a7d08
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2a7d1b64'
+down_revision: Union[str, None] = 'c52e9f1a7d08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Tables are created by the server with create_all, so on a fresh database
+# they don't exist yet and only columns missing in existing tables are added.
+COLUMNS = [
+    ('images', sa.Column('size', sa.BigInteger(), nullable=True)),
+    ('images', sa.Column('sha256', sa.String(), nullable=True)),
+]
+
+
+def get_existing_columns(table: str) -> Union[set, None]:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return None
+
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    for table, column in COLUMNS:
+        existing_columns = get_existing_columns(table)
+        if existing_columns is not None and column.name not in existing_columns:
+            op.add_column(table, column)
+
+
+def downgrade() -> None:
+    for table, column in reversed(COLUMNS):
+        existing_columns = get_existing_columns(table)
+        if existing_columns is not None and column.name in existing_columns:
+            op.drop_column(table, column.name)
@@ -0,0 +1,99 @@
+"""
+Serial read path on a pty stand-in for device console.
+
+Stand-in device prints `--size` bytes of boot log followed by u-boot
+prompt '=> ' and stays silent, as a device waiting for input does.
+
+- legacy: byte-at-a-time reading until port timeout
+- bulk: read_from_serial with terminator '=> '
+
+Run from lab_3/src:
+    python -m benchmarks.serial_reader --size 262144 --timeout 1
+"""
+import argparse
+import os
+import threading
+import time
+
+# Settings are loaded on import of the package, database and broker are not used
+for name, value in {
+    "POSTGRESQL_USER": "bench",
+    "POSTGRESQL_PASSWORD": "bench",
+    "POSTGRESQL_SERVER": "localhost",
+    "POSTGRESQL_PORT": "5432",
+    "POSTGRESQL_DB": "bench",
+    "CELERY_BROKER_URL": "memory://",
+    "CELERY_RESULT_BACKEND": "redis://localhost:6379/0",
+}.items():
+    os.environ.setdefault(name, value)
+
+import serial  # noqa: E402
+
+from src.fastapi_celery.device_rs232.serial_module import read_from_serial  # noqa: E402
+
+PROMPT = b"=> "
+BOOT_LOG_LINE = b"[    1.234567] imx-sdma 30bd0000.dma-controller: loaded firmware 4.5\r\n"
+
+
+def legacy_read_from_serial(ser: serial.Serial) -> str:
+    output = b''
+
+    while True:
+        data = ser.read(1)
+        if data:
+            output += data
+        else:
+            break
+
+    return output.decode(errors="ignore")
+
+
+def start_device(master_fd: int, size: int) -> threading.Thread:
+    lines = BOOT_LOG_LINE * (size // len(BOOT_LOG_LINE) + 1)
+
+    def print_boot_log() -> None:
+        view = memoryview(lines[:size] + PROMPT)
+        while view:
+            written = os.write(master_fd, view[:4096])
+            view = view[written:]
+
+    thread = threading.Thread(target=print_boot_log, daemon=True)
+    thread.start()
+    return thread
+
+
+def bench(name: str, size: int, timeout: float, read) -> None:
+    master_fd, slave_fd = os.openpty()
+    ser = serial.Serial(os.ttyname(slave_fd), 115200, timeout=timeout)
+
+    try:
+        start = time.monotonic()
+        start_device(master_fd, size)
+        output = read(ser)
+        elapsed = time.monotonic() - start
+    finally:
+        ser.close()
+        os.close(master_fd)
+        os.close(slave_fd)
+
+    assert output.endswith(PROMPT.decode()), f"{name}: prompt was not read"
+    print(f"{name:<8} {elapsed:8.3f} s {len(output) / elapsed / 1024:10.1f} KiB/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=262144,
+                        help="Size of boot log, bytes")
+    parser.add_argument("--timeout", type=float, default=1,
+                        help="Port timeout (idle gap), s")
+    args = parser.parse_args()
+
+    print(f"{args.size} bytes of output, port timeout {args.timeout} s")
+    bench("legacy", args.size, args.timeout, legacy_read_from_serial)
+    bench("bulk", args.size, args.timeout,
+          lambda ser: read_from_serial(ser, terminator=PROMPT.decode())[0])
+
+
+if __name__ == "__main__":
+    main()
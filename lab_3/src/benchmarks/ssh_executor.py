@@ -0,0 +1,162 @@
+"""
+Throughput of SSH executors of ssh-worker on a local stand-in SSH server.
+
+Stand-in server answers every command after `--latency` seconds,
+which models network bound commands on devices.
+
+- prefork: `--processes` worker processes, each runs one command
+  at a time over its own connection (as Celery prefork pool does)
+- asyncio: `--threads` task threads share AsyncSshExecutor
+  (as Celery threads pool does with EXECUTOR = "asyncio")
+
+Run from lab_3/src:
+    python -m benchmarks.ssh_executor --commands 1000 --latency 0.2
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Settings are loaded on import of the package, database and broker are not used
+for name, value in {
+    "POSTGRESQL_USER": "bench",
+    "POSTGRESQL_PASSWORD": "bench",
+    "POSTGRESQL_SERVER": "localhost",
+    "POSTGRESQL_PORT": "5432",
+    "POSTGRESQL_DB": "bench",
+    "CELERY_BROKER_URL": "memory://",
+    "CELERY_RESULT_BACKEND": "redis://localhost:6379/0",
+}.items():
+    os.environ.setdefault(name, value)
+
+import asyncssh  # noqa: E402
+import paramiko  # noqa: E402
+
+from src.fastapi_celery.device_ssh.async_executor import AsyncSshExecutor  # noqa: E402
+from src.fastapi_celery.device_ssh.ssh_module import execute_command  # noqa: E402
+
+HOST = "127.0.0.1"
+USERNAME = "root"
+PASSWORD = "bench"
+COMMAND = "uptime"
+CMD_TIMEOUT_S = 30
+
+
+class StandInServer(asyncssh.SSHServer):
+    def begin_auth(self, username: str) -> bool:
+        return True
+
+    def password_auth_supported(self) -> bool:
+        return True
+
+    def validate_password(self, username: str, password: str) -> bool:
+        return password == PASSWORD
+
+
+def start_server(port: int, latency_s: float, ready: threading.Event) -> None:
+    async def handle(process: asyncssh.SSHServerProcess) -> None:
+        await asyncio.sleep(latency_s)
+        process.stdout.write(f"{process.command}: ok\n")
+        process.exit(0)
+
+    async def serve() -> None:
+        await asyncssh.create_server(
+            StandInServer, HOST, port,
+            server_host_keys=[asyncssh.generate_private_key("ssh-ed25519")],
+            process_factory=handle)
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+_client: paramiko.SSHClient = None
+
+
+def prefork_worker_init(port: int) -> None:
+    global _client
+    _client = paramiko.SSHClient()
+    _client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    _client.connect(HOST, port=port, username=USERNAME,
+                    password=PASSWORD, look_for_keys=False, allow_agent=False)
+
+
+def prefork_run(_: int) -> int:
+    return execute_command(_client, COMMAND, CMD_TIMEOUT_S).retcode
+
+
+def bench_prefork(port: int, commands: int, processes: int) -> float:
+    with multiprocessing.Pool(processes, initializer=prefork_worker_init, initargs=(port,)) as pool:
+        # Connections are opened before measurement as in warmed up pool
+        pool.map(prefork_run, range(processes))
+
+        start = time.monotonic()
+        retcodes = pool.map(prefork_run, range(commands), chunksize=1)
+        elapsed = time.monotonic() - start
+
+    assert all(retcode == 0 for retcode in retcodes)
+    return elapsed
+
+
+def bench_asyncio(port: int, commands: int, threads: int, sessions_per_host: int) -> float:
+    executor = AsyncSshExecutor(
+        max_sessions=threads, sessions_per_host=sessions_per_host,
+        idle_timeout_s=300, keepalive_s=0)
+
+    def run(_: int) -> int:
+        return executor.execute(
+            hostname=HOST, port=port, username=USERNAME, image_type="release",
+            password_getter=lambda: PASSWORD, command=COMMAND,
+            cmd_timeout=CMD_TIMEOUT_S).retcode
+
+    try:
+        with ThreadPoolExecutor(threads) as pool:
+            run(0)
+
+            start = time.monotonic()
+            retcodes = list(pool.map(run, range(commands)))
+            elapsed = time.monotonic() - start
+    finally:
+        executor.close()
+
+    assert all(retcode == 0 for retcode in retcodes)
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Response time of stand-in server, s")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="Processes of prefork pool")
+    parser.add_argument("--threads", type=int, default=256,
+                        help="Task threads of asyncio executor")
+    parser.add_argument("--sessions-per-host", type=int, default=256,
+                        help="Channels per connection of asyncio executor")
+    parser.add_argument("--port", type=int, default=8022)
+    args = parser.parse_args()
+
+    ready = threading.Event()
+    threading.Thread(target=start_server, args=(args.port, args.latency, ready),
+                     daemon=True).start()
+    ready.wait()
+
+    results = {
+        f"prefork ({args.processes} processes)": bench_prefork(
+            args.port, args.commands, args.processes),
+        f"asyncio ({args.threads} threads)": bench_asyncio(
+            args.port, args.commands, args.threads, args.sessions_per_host),
+    }
+
+    print(f"{args.commands} commands, server latency {args.latency} s")
+    for name, elapsed in results.items():
+        print(f"{name:<32} {elapsed:8.2f} s {args.commands / elapsed:10.1f} cmd/s")
+
+
+if __name__ == "__main__":
+    main()
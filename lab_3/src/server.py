@@ -9,6 +9,7 @@ from src.fastapi_celery.config import (EnvSettings, ServerSettings,
 from src.fastapi_celery.database import engine
 from src.fastapi_celery.dependencies import Base
 from src.fastapi_celery.device_data.views import router as device_data_router
+from src.fastapi_celery.device_install.views import router as device_install_router
 from src.fastapi_celery.device_reserve.views import \
     router as device_reserve_router
 from src.fastapi_celery.device_rs232.views import router as device_rs232_router
@@ -48,6 +49,7 @@ app.include_router(images_router, prefix='/api', tags=["Image"])
 app.include_router(device_reserve_router, prefix='/api', tags=["Device Reserve"])
 app.include_router(bolid_router, prefix='/api', tags=["Bolid"])
 app.include_router(device_pin_control_router, prefix='/api', tags=["Device Pin Control"])
+app.include_router(device_install_router, prefix='/api', tags=["Device Install"])
 
 
 @app.exception_handler(BaseException)
@@ -8,6 +8,7 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from .bolid.schemas import BolidCreateSchema
 from .device_data.schemas import DeviceCreateSchema
+from .enums import ImageType, SshExecutor
 
 
 def parse_cors(v: Any) -> list[str] | str:
@@ -63,21 +64,90 @@ class Rs232Settings(BaseSettings):
     DEFAULT_BYTESIZE: int = Field(gt=0, examples=[8])
     DEFAULT_PARITY: str = Field(examples=["N"])
     DEFAULT_STOPBITS: int = Field(gt=0, examples=[1])
+    READ_MAX_DEADLINE_S: float = Field(default=300, gt=0, examples=[300])
+    CONSOLE_BUFFER_BYTES: int = Field(default=1048576, gt=0, examples=[1048576])
+    CONSOLE_REOPEN_DELAY_S: float = Field(default=5, gt=0, examples=[5])
+    WORKER_CONCURRENCY: int = Field(default=32, gt=0, examples=[32])
+    PORT_RETRY_DELAY_S: float = Field(default=0.5, gt=0, examples=[0.5])
+    PORT_CLAIM_TTL_S: float = Field(default=30, gt=0, examples=[30])
+    ARCHIVE_FOLDER_PATH: str = Field(default="/rs232_archive")
+    ARCHIVE_SEGMENT_BYTES: int = Field(default=8388608, gt=0, examples=[8388608])
+    ARCHIVE_INDEX_INTERVAL_S: float = Field(default=5, gt=0, examples=[5])
+    ARCHIVE_RETENTION_BYTES: int = Field(default=1073741824, gt=0, examples=[1073741824])
+    ARCHIVE_RETENTION_S: int = Field(default=604800, gt=0, examples=[604800])
+    TRANSFER_FOLDER_PATH: str = Field(default="/u-boot-recovery")
+    TRANSFER_ACK_TIMEOUT_S: float = Field(default=10, gt=0, examples=[10])
+    TRANSFER_MAX_RETRIES: int = Field(default=10, gt=0, examples=[10])
 
 
 class SshSettings(BaseSettings):
     PASSWORD_UPLOADER_BIN_PATH: str
     REQUEST_TYPE: str
     DEV_PASSWORD: str
+    POOL_IDLE_TIMEOUT_S: int = Field(default=300, gt=0, examples=[300])
+    POOL_MAX_PER_HOST: int = Field(default=4, gt=0, examples=[4])
+    POOL_ACQUIRE_TIMEOUT_S: int = Field(default=30, gt=0, examples=[30])
+    POOL_KEEPALIVE_S: int = Field(default=30, ge=0, examples=[30])
+    PASSWORD_CACHE_TTL_S: int = Field(default=3600, gt=0, examples=[3600])
+    PASSWORD_LOCK_TIMEOUT_S: int = Field(default=30, gt=0, examples=[30])
+    FANOUT_CONCURRENCY: int = Field(default=8, gt=0, examples=[8])
+    OUTPUT_CAP_BYTES: int = Field(default=65536, gt=0, examples=[65536])
+    OUTPUT_STREAM_CAP_BYTES: int = Field(default=1048576, gt=0, examples=[1048576])
+    ARTIFACTS_FOLDER_PATH: str = Field(default="/ssh_artifacts")
+    ARTIFACTS_TTL_S: int = Field(default=86400, gt=0, examples=[86400])
+    TRANSFER_FOLDER_PATH: str = Field(default="/ssh_transfers")
+    TRANSFER_TTL_S: int = Field(default=86400, gt=0, examples=[86400])
+    SFTP_CHUNK_SIZE: int = Field(default=32768, gt=0, examples=[32768])
+    SFTP_MAX_REQUESTS: int = Field(default=64, gt=0, examples=[64])
+    EXECUTOR: SshExecutor = Field(default=SshExecutor.PARAMIKO)
+    ASYNC_MAX_SESSIONS: int = Field(default=256, gt=0, examples=[256])
+    ASYNC_SESSIONS_PER_HOST: int = Field(default=8, gt=0, examples=[8])
+    RESULT_CACHE_MAX_TTL_S: int = Field(default=86400, gt=0, examples=[86400])
 
 
 class ImageSettings(BaseSettings):
     FOLDER_PATH: str
     VALID_EXTS: List[str]
+    UPLOAD_WRITE_SIZE: int = Field(default=1048576, gt=0, examples=[1048576])
 
 
 class BolidSettings(BaseSettings):
     PIN_AMOUNT: int
+    SLAVE_ADDRESS: int = Field(default=1, ge=1, le=247, examples=[1])
+    FIRST_PIN_COIL_ADDRESS: int = Field(default=0, ge=0, examples=[0])
+    RESPONSE_TIMEOUT_S: float = Field(default=0.5, gt=0, examples=[0.5])
+    MAX_RETRIES: int = Field(default=3, gt=0, examples=[3])
+    COALESCE_WINDOW_S: float = Field(default=0.01, ge=0, examples=[0.01])
+    POLL_INTERVAL_S: float = Field(default=5, gt=0, examples=[5])
+    FRESH_READ_TIMEOUT_S: float = Field(default=5, gt=0, examples=[5])
+
+
+class InstallSettings(BaseSettings):
+    WORKER_CONCURRENCY: int = Field(default=16, gt=0, examples=[16])
+    RELOAD_OFF_TIME_S: float = Field(default=3, ge=0, examples=[3])
+    RELOAD_STAGGER_S: float = Field(default=1, ge=0, examples=[1])
+    RELOAD_INRUSH_CONCURRENCY: int = Field(default=4, gt=0, examples=[4])
+    RELOAD_READY_TIMEOUT_S: float = Field(default=180, gt=0, examples=[180])
+    RECOVERY_IMAGE_TYPE: ImageType = Field(default=ImageType.DEV)
+    REMOTE_IMAGE_PATH: str = Field(default="/tmp/image.img")
+    FLASH_COMMAND: str = Field(
+        default="dd if={image_path} of=/dev/mmcblk0 bs=4M conv=fsync")
+    VERIFY_COMMAND: str = Field(
+        default="head -c {size} /dev/mmcblk0 | sha256sum")
+    FLASH_TIMEOUT_S: int = Field(default=900, gt=0, examples=[900])
+    TRANSFER_CONCURRENCY: int = Field(default=4, gt=0, examples=[4])
+    FLASH_DEVICE_PATH: str = Field(default="/dev/mmcblk0")
+    DELTA_BLOCK_SIZE: int = Field(default=1048576, gt=0, examples=[1048576])
+    USB_LOADER_PATH: str = Field(default="/imx_usb_loader/imx_usb")
+    USB_LOADER_CONFIG_PATH: str = Field(default="/imx_usb_loader")
+    USB_RECOVERY_FOLDER_PATH: str = Field(default="/u-boot-recovery")
+    USB_RECOVERY_FILE_NAME: str = Field(default="u-boot.imx")
+    USB_ENUMERATE_TIMEOUT_S: float = Field(default=15, gt=0, examples=[15])
+    USB_LOADER_TIMEOUT_S: float = Field(default=60, gt=0, examples=[60])
+    USB_LOADER_MAX_RETRIES: int = Field(default=3, gt=0, examples=[3])
+    BROADCAST_WINDOW_BYTES: int = Field(default=67108864, gt=0, examples=[67108864])
+    BROADCAST_JOIN_TIMEOUT_S: float = Field(default=120, ge=0, examples=[120])
+    BROADCAST_STALL_TIMEOUT_S: float = Field(default=10, gt=0, examples=[10])
 
 
 class ServerSettings(BaseSettings):
@@ -86,6 +156,8 @@ class ServerSettings(BaseSettings):
     RS232_SETTINGS: Rs232Settings
     SSH_SETTINGS: SshSettings
     IMAGE_SETTINGS: ImageSettings
+    BOLID_SETTINGS: BolidSettings
+    INSTALL_SETTINGS: InstallSettings
     DEVICES: List[DeviceCreateSchema]
     BOLIDS: List[BolidCreateSchema]
 
@@ -20,6 +20,7 @@ class Device(Base):
     https_port: Mapped[int] = mapped_column(Integer, nullable=False)
     ws_port: Mapped[int] = mapped_column(Integer, nullable=False)
     rs232_port: Mapped[str] = mapped_column(String(32), nullable=False)
+    usb_path: Mapped[str] = mapped_column(String(32), nullable=True)
     connection_status: Mapped[DeviceConnectionStatus] = mapped_column(
         nullable=True)
     reservation_status: Mapped[DeviceReservationStatus] = mapped_column(
@@ -23,6 +23,7 @@ class DeviceSchema(BaseModel):
     https_port: int
     ws_port: int
     rs232_port: str
+    usb_path: Optional[str] = Field(default=None)
     output_power_id: str
     output_boot_id: str
     reservation_status: Optional[DeviceReservationStatus] = DeviceReservationStatus.AVAILABLE
@@ -48,6 +49,8 @@ class DeviceCreateSchema(BaseModel):
     https_port: int
     ws_port: int
     rs232_port: str
+    usb_path: Optional[str] = Field(
+        default=None, description="USB port path of serial download of device", examples=["1-1.3"])
     output_power: BolidPinCreateSchema
     output_boot: BolidPinCreateSchema
 
@@ -92,6 +92,7 @@ def create_device(db: Session, device: DeviceCreateSchema) -> DeviceSchema:
         https_port=device.https_port,
         ws_port=device.ws_port,
         rs232_port=device.rs232_port,
+        usb_path=device.usb_path,
         output_boot_id=output_boot_pin.id,
         output_power_id=output_power_pin.id,
         connection_status=DeviceConnectionStatus.UNAVAILABLE,
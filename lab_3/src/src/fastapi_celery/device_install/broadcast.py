@@ -0,0 +1,170 @@
+import logging
+import mmap
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger("ImageBroadcast")
+
+
+class ImageBroadcast:
+    """
+    Image read once from disk and streamed to many sinks.
+
+    Image is mapped to memory, so every sink reads the same pages of
+    page cache instead of reading the file again. Sinks pull chunks at
+    their own pace, but the fastest one is kept within `window_bytes`
+    of the slowest one, so pages read for the first sink are still
+    cached for the last one. Sink which did not move for
+    `stall_timeout_s` while others wait for it is detached and continues
+    alone, so a slow device stalls the others no longer than that.
+
+    Sinks are SFTP uploads of install pipeline in the same process.
+    Serial transfers run in rs232 worker and can't share the mapping,
+    USB loaders share one in-memory copy of recovery file instead.
+    """
+
+    def __init__(self, path: str, sinks: int, window_bytes: int, join_timeout_s: float, stall_timeout_s: float):
+        self.path = path
+        self.window_bytes = window_bytes
+        self.join_timeout_s = join_timeout_s
+        self.stall_timeout_s = stall_timeout_s
+
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        # Empty file can't be mapped
+        self._map: Optional[mmap.mmap] = None
+        if self.size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                self._map.madvise(mmap.MADV_SEQUENTIAL)
+
+        self._expected = sinks
+        self._joined = 0
+        self._started = False
+        # Offsets of sinks which move together
+        self._offsets: Dict["BroadcastReader", int] = {}
+        self._moved_at: Dict["BroadcastReader", float] = {}
+        self._cond = threading.Condition()
+
+        self.detached = 0
+
+    def join(self) -> "BroadcastReader":
+        """
+        Attaches a new sink, waits up to `join_timeout_s` for the other expected sinks.
+
+        Sink which joins after the others moved further than window reads alone.
+        """
+        reader = BroadcastReader(self)
+        deadline = time.monotonic() + self.join_timeout_s
+
+        with self._cond:
+            self._joined += 1
+
+            if self._started and (not self._offsets or min(self._offsets.values()) >= self.window_bytes):
+                reader.detached = True
+                self.detached += 1
+                return reader
+
+            self._offsets[reader] = 0
+            self._moved_at[reader] = time.monotonic()
+            self._cond.notify_all()
+
+            while not self._started and self._joined < self._expected:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+        return reader
+
+    def leave(self) -> None:
+        """Tells that one of expected sinks will not join, e.g. its device failed before transfer."""
+        with self._cond:
+            self._expected -= 1
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def _read(self, reader: "BroadcastReader", offset: int, size: int) -> bytes:
+        end = min(offset + size, self.size)
+        if end <= offset:
+            return b""
+
+        if not reader.detached:
+            self._wait_for_window(reader, end)
+
+        data = self._map[offset:end]
+
+        with self._cond:
+            self._started = True
+            if reader in self._offsets:
+                self._offsets[reader] = end
+                self._moved_at[reader] = time.monotonic()
+                self._cond.notify_all()
+
+        return data
+
+    def _wait_for_window(self, reader: "BroadcastReader", end: int) -> None:
+        with self._cond:
+            while reader in self._offsets:
+                slowest = min(self._offsets, key=self._offsets.get)
+                if end <= self._offsets[slowest] + self.window_bytes:
+                    return
+
+                idle = time.monotonic() - self._moved_at[slowest]
+                if idle >= self.stall_timeout_s:
+                    self._detach_locked(slowest)
+                    continue
+
+                self._cond.wait(self.stall_timeout_s - idle)
+
+    def _detach(self, reader: "BroadcastReader") -> None:
+        with self._cond:
+            self._detach_locked(reader)
+
+    def _detach_locked(self, reader: "BroadcastReader") -> None:
+        if self._offsets.pop(reader, None) is None:
+            return
+
+        self._moved_at.pop(reader, None)
+        self._cond.notify_all()
+
+        if not reader.finished:
+            reader.detached = True
+            self.detached += 1
+            logger.info(f"Sink of {self.path} lagged behind broadcast and was detached")
+
+
+class BroadcastReader:
+    """File-like reader of one sink of broadcast."""
+
+    def __init__(self, broadcast: ImageBroadcast):
+        self.broadcast = broadcast
+        self.size = broadcast.size
+        self.offset = 0
+        self.detached = False
+        self.finished = False
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = self.size - self.offset
+
+        data = self.broadcast._read(self, self.offset, size)
+        self.offset += len(data)
+
+        return data
+
+    def close(self) -> None:
+        self.finished = self.offset >= self.size
+        self.broadcast._detach(self)
+
+    def __enter__(self) -> "BroadcastReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
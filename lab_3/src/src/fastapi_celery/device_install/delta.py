@@ -0,0 +1,126 @@
+import hashlib
+import shlex
+from typing import List, Tuple
+
+import paramiko
+
+from ..config import server_settings
+from ..database import SessionLocal
+from ..device_ssh.ssh_module import execute_command
+from ..exceptions import InstallStageError
+from ..images.service import get_block_hashes, save_block_hashes
+
+# (first block, amount of blocks)
+BlockRun = Tuple[int, int]
+
+
+def compute_block_hashes(path: str, block_size: int) -> List[bytes]:
+    """Sha256 of every block of file, the last block is hashed as is without padding."""
+    hashes = []
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+
+    with open(path, "rb", buffering=0) as file:
+        while read := file.readinto(view):
+            hashes.append(hashlib.sha256(view[:read]).digest())
+
+    return hashes
+
+
+def get_image_block_hashes(image_id: str, path: str, block_size: int) -> List[bytes]:
+    """Block hashes of image, they are calculated once and cached in database."""
+    db = SessionLocal()
+    try:
+        hashes = get_block_hashes(db, image_id, block_size)
+        if hashes is None:
+            hashes = compute_block_hashes(path, block_size)
+            save_block_hashes(db, image_id, block_size, hashes)
+    finally:
+        db.close()
+
+    return hashes
+
+
+def get_manifest_command(device_path: str, block_size: int, size: int) -> str:
+    """Shell command which prints sha256 of every block of the first `size` bytes of device, one per line."""
+    device_path = shlex.quote(device_path)
+    full_blocks, tail = divmod(size, block_size)
+
+    command = (f"i=0; while [ $i -lt {full_blocks} ]; do "
+               f"dd if={device_path} bs={block_size} skip=$i count=1 2>/dev/null | sha256sum; "
+               f"i=$((i+1)); done")
+    if tail:
+        command += (f"; dd if={device_path} bs={block_size} skip={full_blocks} count=1 2>/dev/null"
+                    f" | head -c {tail} | sha256sum")
+
+    return command
+
+
+def read_device_manifest(ssh_client: paramiko.SSHClient, device_path: str, block_size: int, size: int) -> List[bytes]:
+    """Block hashes of data on device, read by device itself, so only hashes cross network."""
+    result = execute_command(
+        ssh_client, get_manifest_command(device_path, block_size, size),
+        server_settings.INSTALL_SETTINGS.FLASH_TIMEOUT_S)
+
+    if result.retcode != 0:
+        raise InstallStageError(
+            f"Failed to read block hashes of {device_path}: {result.stderr}")
+
+    try:
+        return [bytes.fromhex(line.split()[0]) for line in result.stdout.splitlines() if line.strip()]
+    except ValueError:
+        raise InstallStageError(
+            f"Unexpected output of block hashes of {device_path}")
+
+
+def get_changed_runs(image_hashes: List[bytes], device_hashes: List[bytes]) -> List[BlockRun]:
+    """Runs of adjacent blocks which differ on device, blocks missing on device are changed."""
+    runs: List[BlockRun] = []
+
+    for number, block_hash in enumerate(image_hashes):
+        if number < len(device_hashes) and device_hashes[number] == block_hash:
+            continue
+
+        if runs and runs[-1][0] + runs[-1][1] == number:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((number, 1))
+
+    return runs
+
+
+def write_blocks(
+    ssh_client: paramiko.SSHClient,
+    local_path: str,
+    device_path: str,
+    block_size: int,
+    runs: List[BlockRun]
+) -> int:
+    """
+    Writes runs of blocks of image in place on device, returns amount of written bytes.
+
+    Device is opened over SFTP without truncation, blocks outside of runs stay as is.
+    """
+    chunk_size = server_settings.SSH_SETTINGS.SFTP_CHUNK_SIZE
+    written = 0
+
+    with ssh_client.open_sftp() as sftp, \
+            open(local_path, "rb") as local_file, \
+            sftp.open(device_path, "r+b", bufsize=chunk_size) as device_file:
+        device_file.set_pipelined(True)
+
+        for first_block, blocks in runs:
+            local_file.seek(first_block * block_size)
+            device_file.seek(first_block * block_size)
+            remaining = blocks * block_size
+
+            while remaining > 0:
+                data = local_file.read(min(chunk_size, remaining))
+                if not data:
+                    break
+
+                device_file.write(data)
+                written += len(data)
+                remaining -= len(data)
+
+    return written
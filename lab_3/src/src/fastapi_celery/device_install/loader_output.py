@@ -0,0 +1,97 @@
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Optional
+
+from celery.result import AsyncResult
+from celery.utils.log import get_task_logger
+from redis.exceptions import RedisError
+
+from ..redis_client import async_redis_client, redis_client
+from .worker import install_worker
+
+logger = get_task_logger("UsbLoaderOutput")
+
+LOADER_OUTPUT_KEY = "usb_recovery:output:{task_id}"
+# Approximate amount of chunks kept in stream of one task
+OUTPUT_STREAM_MAXLEN: int = 10000
+EOF_EVENT = "eof"
+
+KEEPALIVE_INTERVAL_MS: int = 15000
+
+
+class LoaderOutputPublisher:
+    """
+    Publishes output of USB loaders of all devices of task to one redis stream.
+
+    Publishing errors are logged and never break recovery.
+    """
+
+    def __init__(self, task_id: str):
+        self.key = LOADER_OUTPUT_KEY.format(task_id=task_id)
+        self.expire_s = install_worker.conf.result_expires
+        self.enabled = True
+
+    def publish(self, hostname: str, attempt: int, text: str) -> None:
+        self._add({"event": "output", "hostname": hostname,
+                   "attempt": str(attempt), "data": text})
+
+    def close(self) -> None:
+        self._add({"event": EOF_EVENT})
+
+    def _add(self, fields: Dict[str, str]) -> None:
+        if not self.enabled:
+            return
+
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            pipeline.xadd(self.key, fields,
+                          maxlen=OUTPUT_STREAM_MAXLEN, approximate=True)
+            pipeline.expire(self.key, self.expire_s)
+            pipeline.execute()
+        except RedisError as exc:
+            logger.warning(
+                f"Failed to publish output to {self.key}, streaming disabled. Exception: {str(exc)}")
+            self.enabled = False
+
+
+def format_event(event_id: str, event: str, payload: dict) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+async def read_loader_events(task_id: str, offset: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Yields Server-Sent Events with output of loaders of the task starting after `offset`.
+
+    Generator ends after the end of output was read or
+    if task is finished and has no output stream (e.g. it expired).
+    """
+    key = LOADER_OUTPUT_KEY.format(task_id=task_id)
+    last_id = offset or "0-0"
+
+    while True:
+        response = await async_redis_client.xread(
+            {key: last_id}, count=100, block=KEEPALIVE_INTERVAL_MS)
+
+        if not response:
+            if not await async_redis_client.exists(key):
+                task = AsyncResult(task_id, app=install_worker)
+                if await asyncio.to_thread(task.ready):
+                    return
+
+            yield ": keep-alive\n\n"
+            continue
+
+        for _, entries in response:
+            for entry_id, fields in entries:
+                last_id = entry_id.decode()
+                event = fields[b"event"].decode()
+
+                if event == EOF_EVENT:
+                    yield format_event(last_id, event, {})
+                    return
+
+                yield format_event(last_id, event, {
+                    "hostname": fields[b"hostname"].decode(),
+                    "attempt": int(fields[b"attempt"]),
+                    "data": fields[b"data"].decode()
+                })
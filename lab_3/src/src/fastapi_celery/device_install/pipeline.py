@@ -0,0 +1,412 @@
+import logging
+import shlex
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import paramiko
+
+from ..config import server_settings
+from ..device_ssh.connection_pool import ssh_pool
+from ..device_ssh.schemas import SshResult
+from ..device_ssh.sftp_module import (upload_file, upload_stream,
+                                      verify_remote_sha256)
+from ..device_ssh.ssh_module import execute_command
+from ..device_ssh.ssh_password import get_password
+from ..enums import InstallStage, SshUser
+from ..exceptions import InstallStageError
+from .broadcast import ImageBroadcast
+from .delta import (get_changed_runs, get_image_block_hashes,
+                    read_device_manifest, write_blocks)
+from .reload import SSH_PORT, set_pins, wait_for_ssh
+from .schemas import DeviceInstallResult, InstallStageResult, InstallTarget
+
+logger = logging.getLogger("DeviceInstall")
+
+StageCallback = Callable[[str, InstallStage], None]
+DoneCallback = Callable[[DeviceInstallResult], None]
+
+
+class StageLimits:
+    """
+    Slots of stages which use resources shared by devices.
+
+    Devices draw inrush current from the same supply on power-on and
+    uploads share uplink of server and disk with images, so only a
+    bounded amount of devices pass these stages at once. Limits are
+    shared by all install tasks of worker process.
+    """
+
+    def __init__(self, power_concurrency: int, transfer_concurrency: int):
+        power = threading.BoundedSemaphore(power_concurrency)
+
+        self._semaphores = {
+            InstallStage.POWER_CYCLE: power,
+            InstallStage.REBOOT: power,
+            InstallStage.TRANSFER: threading.BoundedSemaphore(transfer_concurrency)
+        }
+
+    @contextmanager
+    def slot(self, stage: InstallStage) -> Iterator[float]:
+        """Holds slot of stage for the block, yields time spent waiting for it."""
+        semaphore = self._semaphores.get(stage)
+        if semaphore is None:
+            yield 0.0
+            return
+
+        start = time.monotonic()
+        with semaphore:
+            yield time.monotonic() - start
+
+
+class DeviceInstall:
+    """
+    Installation of image on one device as a sequence of stages.
+
+    Device is booted to recovery by boot pin, image is uploaded over
+    SFTP and written by FLASH_COMMAND, written data is read back by
+    VERIFY_COMMAND, then device is rebooted from flash. A failed stage
+    stops the pipeline and boot pin is released, so device does not
+    stay in recovery.
+
+    Devices of broadcast read image from shared reader and take no
+    transfer slot, the file is read from disk once for all of them.
+
+    Delta install compares block hashes of image with block hashes of
+    FLASH_DEVICE_PATH calculated by device and writes only changed blocks
+    in place, then verifies hashes of all blocks again.
+    """
+
+    def __init__(
+        self,
+        target: InstallTarget,
+        limits: StageLimits,
+        off_time_s: float,
+        stagger_s: float,
+        ready_timeout_s: float,
+        on_stage: Optional[StageCallback] = None,
+        broadcast: Optional[ImageBroadcast] = None,
+        delta: bool = False
+    ):
+        self.target = target
+        self.limits = limits
+        self.off_time_s = off_time_s
+        self.stagger_s = stagger_s
+        self.ready_timeout_s = ready_timeout_s
+        self.on_stage = on_stage
+        self.broadcast = broadcast
+        self.delta = delta
+        self.settings = server_settings.INSTALL_SETTINGS
+
+        self._waited = 0.0
+        self._sha256: Optional[str] = None
+        self._size = 0
+        # Joined is counted by broadcast, shared tells that device read image with others
+        self._joined = False
+        self._shared = False
+        self._detached = False
+        self._transferred: Optional[int] = None
+        self._image_hashes: List[bytes] = []
+        self._changed_blocks: Optional[int] = None
+
+    def run(self) -> DeviceInstallResult:
+        start = time.monotonic()
+        stages: List[InstallStageResult] = []
+        steps = [
+            (InstallStage.BOOT_PIN_ON, self.boot_pin_on),
+            (InstallStage.POWER_CYCLE, self.power_cycle),
+            (InstallStage.TRANSFER, self.transfer),
+            (InstallStage.VERIFY, self.verify),
+            (InstallStage.BOOT_PIN_OFF, self.boot_pin_off),
+            (InstallStage.REBOOT, self.reboot)
+        ]
+
+        for stage, step in steps:
+            if self.on_stage is not None:
+                self.on_stage(self.target.hostname, stage)
+
+            stage_start = time.monotonic()
+            self._waited = 0.0
+            error = None
+
+            try:
+                step()
+            except Exception as exc:
+                error = str(exc)
+
+            stages.append(InstallStageResult(
+                stage=stage, duration_s=time.monotonic() - stage_start, waited_s=self._waited))
+
+            if error is not None:
+                logger.warning(
+                    f"Install on {self.target.hostname} failed at {stage}: {error}")
+                self._release_boot_pin()
+                if self.broadcast is not None and not self._joined:
+                    self.broadcast.leave()
+
+                return self._create_result(start, stages, stage, error)
+
+        logger.info(
+            f"Installed image {self.target.image.id} on {self.target.hostname} in {time.monotonic() - start:.1f} s")
+
+        return self._create_result(start, stages)
+
+    def boot_pin_on(self) -> None:
+        set_pins([(self.target.boot_pin, True)])
+
+    def power_cycle(self) -> None:
+        self._power_cycle(InstallStage.POWER_CYCLE)
+
+    def transfer(self) -> None:
+        local_path = get_image_path(self.target)
+        if not local_path.is_file():
+            raise InstallStageError(f"Image file {local_path} is not found")
+
+        remote_path = self.settings.REMOTE_IMAGE_PATH
+
+        with self._connection() as ssh_client:
+            if self.delta:
+                self._transfer_delta(ssh_client, local_path)
+                return
+
+            if self.broadcast is not None:
+                upload = self._upload_broadcast(ssh_client, remote_path)
+            else:
+                with self._slot(InstallStage.TRANSFER):
+                    upload = upload_file(ssh_client, str(local_path), remote_path)
+
+            self._sha256 = upload["sha256"]
+            self._size = upload["size_bytes"]
+            self._transferred = upload["size_bytes"] - upload["resumed_from"]
+
+            # Damage in transit is told apart from damage on flash
+            verify_remote_sha256(ssh_client, remote_path, self._sha256)
+
+            self._execute(ssh_client, self.settings.FLASH_COMMAND.format(
+                image_path=shlex.quote(remote_path)))
+
+    def verify(self) -> None:
+        if self.delta:
+            self._verify_delta()
+            return
+
+        with self._connection() as ssh_client:
+            result = self._execute(
+                ssh_client, self.settings.VERIFY_COMMAND.format(size=self._size))
+
+        flashed_sha256 = result.stdout.split()[0] if result.stdout else None
+        if flashed_sha256 != self._sha256:
+            raise InstallStageError(
+                f"Checksum of flashed data {flashed_sha256} differs from checksum of image {self._sha256}")
+
+    def boot_pin_off(self) -> None:
+        set_pins([(self.target.boot_pin, False)])
+
+    def reboot(self) -> None:
+        self._power_cycle(InstallStage.REBOOT)
+
+    def _power_cycle(self, stage: InstallStage) -> None:
+        with self._slot(stage):
+            set_pins([(self.target.power_pin, False)])
+            time.sleep(self.off_time_s)
+            set_pins([(self.target.power_pin, True)])
+            # Slot is held until inrush of device is over
+            time.sleep(self.stagger_s)
+
+        # Connections to the previous boot are dead
+        ssh_pool.invalidate_host(self.target.ip)
+
+        if not wait_for_ssh(self.target.ip, self.ready_timeout_s):
+            raise InstallStageError(
+                f"Device {self.target.hostname} did not boot in {self.ready_timeout_s} s")
+
+    def _create_result(
+        self,
+        start: float,
+        stages: List[InstallStageResult],
+        failed_stage: Optional[InstallStage] = None,
+        error: Optional[str] = None
+    ) -> DeviceInstallResult:
+        return DeviceInstallResult(
+            hostname=self.target.hostname,
+            image_id=self.target.image.id,
+            success=error is None,
+            stages=stages,
+            failed_stage=failed_stage,
+            error=error,
+            broadcast=self._shared,
+            broadcast_detached=self._detached,
+            transferred_bytes=self._transferred,
+            changed_blocks=self._changed_blocks,
+            total_blocks=len(self._image_hashes) if self.delta else None,
+            execution_time_s=time.monotonic() - start
+        )
+
+    def _transfer_delta(self, ssh_client: paramiko.SSHClient, local_path: Path) -> None:
+        block_size = self.settings.DELTA_BLOCK_SIZE
+        device_path = self.settings.FLASH_DEVICE_PATH
+
+        self._size = local_path.stat().st_size
+        self._image_hashes = get_image_block_hashes(
+            self.target.image.id, str(local_path), block_size)
+
+        device_hashes = read_device_manifest(ssh_client, device_path, block_size, self._size)
+        runs = get_changed_runs(self._image_hashes, device_hashes)
+        self._changed_blocks = sum(blocks for _, blocks in runs)
+
+        with self._slot(InstallStage.TRANSFER):
+            self._transferred = write_blocks(
+                ssh_client, str(local_path), device_path, block_size, runs)
+
+        self._execute(ssh_client, "sync")
+        logger.info(
+            f"Delta install on {self.target.hostname}: {self._changed_blocks} of "
+            f"{len(self._image_hashes)} blocks changed")
+
+    def _verify_delta(self) -> None:
+        device_path = self.settings.FLASH_DEVICE_PATH
+
+        with self._connection() as ssh_client:
+            device_hashes = read_device_manifest(
+                ssh_client, device_path, self.settings.DELTA_BLOCK_SIZE, self._size)
+
+        runs = get_changed_runs(self._image_hashes, device_hashes)
+        if runs:
+            raise InstallStageError(
+                f"{sum(blocks for _, blocks in runs)} blocks of {device_path} differ from image after write")
+
+    def _upload_broadcast(self, ssh_client: paramiko.SSHClient, remote_path: str) -> dict:
+        self._joined = True
+
+        with self.broadcast.join() as reader:
+            # Device joined after others moved further than window reads alone from the start
+            self._shared = not reader.detached
+            try:
+                return upload_stream(ssh_client, reader, reader.size, remote_path)
+            finally:
+                self._detached = reader.detached
+
+    @contextmanager
+    def _slot(self, stage: InstallStage) -> Iterator[None]:
+        with self.limits.slot(stage) as waited:
+            self._waited += waited
+            yield
+
+    def _connection(self):
+        image_type = self.settings.RECOVERY_IMAGE_TYPE
+
+        return ssh_pool.connection(
+            hostname=self.target.ip,
+            port=SSH_PORT,
+            username=SshUser.ROOT,
+            image_type=image_type,
+            password_getter=lambda: get_password(
+                SshUser.ROOT, image_type, self.target.device_type)
+        )
+
+    def _execute(self, ssh_client: paramiko.SSHClient, command: str) -> SshResult:
+        result = execute_command(ssh_client, command, self.settings.FLASH_TIMEOUT_S)
+
+        if result.retcode != 0:
+            raise InstallStageError(
+                f"Command '{command}' failed with code {result.retcode}: {result.stderr}")
+
+        return result
+
+    def _release_boot_pin(self) -> None:
+        try:
+            set_pins([(self.target.boot_pin, False)])
+        except Exception as exc:
+            logger.warning(
+                f"Failed to release boot pin of {self.target.hostname}: {exc}")
+
+
+def install_devices(
+    targets: List[InstallTarget],
+    off_time_s: float,
+    stagger_s: float,
+    ready_timeout_s: float,
+    broadcast: bool = False,
+    delta: bool = False,
+    on_stage: Optional[StageCallback] = None,
+    on_done: Optional[DoneCallback] = None
+) -> List[DeviceInstallResult]:
+    """
+    Runs pipelines of all devices at once, stages with shared resources are bounded by `stage_limits`.
+
+    With `broadcast` devices with images of the same build and size get
+    one shared reader of image.
+    """
+    broadcasts = create_broadcasts(targets) if broadcast else {}
+
+    def install(target: InstallTarget) -> DeviceInstallResult:
+        result = DeviceInstall(
+            target, stage_limits, off_time_s, stagger_s, ready_timeout_s, on_stage,
+            broadcasts.get(target.hostname), delta).run()
+
+        if on_done is not None:
+            on_done(result)
+
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="install") as executor:
+            return list(executor.map(install, targets))
+    finally:
+        for image_broadcast in set(broadcasts.values()):
+            image_broadcast.close()
+
+
+def get_image_path(target: InstallTarget) -> Path:
+    return Path(server_settings.IMAGE_SETTINGS.FOLDER_PATH) / target.image.filename
+
+
+def create_broadcasts(targets: List[InstallTarget]) -> Dict[str, ImageBroadcast]:
+    """
+    Broadcasts by hostname for devices which share image.
+
+    Images uploaded for every device are separate files, so images are
+    the same if they have the same sha256. Images uploaded before it was
+    stored are the same if they are of the same build (type, version and
+    commit) and size. The file of the first device of group is read.
+    """
+    settings = server_settings.INSTALL_SETTINGS
+    groups: Dict[Tuple, List[InstallTarget]] = {}
+
+    for target in targets:
+        path = get_image_path(target)
+        if not path.is_file():
+            continue
+
+        image = target.image
+        if image.sha256 is not None:
+            key = (image.sha256,)
+        else:
+            key = (image.type, image.version, image.commit, path.stat().st_size)
+        groups.setdefault(key, []).append(target)
+
+    broadcasts = {}
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+
+        image_broadcast = ImageBroadcast(
+            str(get_image_path(group[0])),
+            sinks=len(group),
+            window_bytes=settings.BROADCAST_WINDOW_BYTES,
+            join_timeout_s=settings.BROADCAST_JOIN_TIMEOUT_S,
+            stall_timeout_s=settings.BROADCAST_STALL_TIMEOUT_S
+        )
+        for target in group:
+            broadcasts[target.hostname] = image_broadcast
+
+    return broadcasts
+
+
+stage_limits = StageLimits(
+    power_concurrency=server_settings.INSTALL_SETTINGS.RELOAD_INRUSH_CONCURRENCY,
+    transfer_concurrency=server_settings.INSTALL_SETTINGS.TRANSFER_CONCURRENCY
+)
@@ -0,0 +1,169 @@
+import logging
+import re
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from ..device_pin_control.bolid_driver import bolid_driver
+from ..device_rs232.console_bridge import OUTPUT_STREAM_KEY, get_last_id
+from ..enums import ReloadReadyCheck
+from ..redis_client import redis_client
+from .schemas import BolidPinRef, DeviceReloadResult, ReloadTarget
+
+logger = logging.getLogger("DeviceReload")
+
+SSH_PORT: int = 22
+SSH_PROBE_INTERVAL_S: float = 1
+SSH_PROBE_TIMEOUT_S: float = 1
+# Console is read in blocks of this time to check timeout
+CONSOLE_BLOCK_S: float = 1
+# Pattern is searched in new output and this amount of preceding characters
+PATTERN_LOOKBEHIND: int = 4096
+
+ReadyCallback = Callable[[DeviceReloadResult], None]
+
+
+def set_pins(pin_states: List[Tuple[BolidPinRef, bool]]) -> None:
+    """Sets pins of many devices, pins of one bolid are written in one frame."""
+    states_by_bolid: Dict[str, Tuple[BolidPinRef, Dict[int, bool]]] = {}
+
+    for pin, state in pin_states:
+        states_by_bolid.setdefault(pin.bolid.name, (pin, {}))[1][pin.number] = state
+
+    for pin, bolid_pin_states in states_by_bolid.values():
+        bolid_driver.set_pins(pin.bolid, bolid_pin_states)
+
+
+def wait_for_console(port: str, pattern: re.Pattern, since_id: bytes, timeout: float) -> bool:
+    """Waits for pattern in console output published since id."""
+    key = OUTPUT_STREAM_KEY.format(port=port)
+    deadline = time.monotonic() + timeout
+    output = ""
+    last_id = since_id
+
+    while (remaining := deadline - time.monotonic()) > 0:
+        entries = redis_client.xread(
+            {key: last_id}, block=int(min(remaining, CONSOLE_BLOCK_S) * 1000))
+
+        for _, messages in entries:
+            for message_id, fields in messages:
+                last_id = message_id
+                output += fields[b"data"].decode(errors="ignore")
+
+        if entries:
+            if pattern.search(output):
+                return True
+            output = output[-PATTERN_LOOKBEHIND:]
+
+    return False
+
+
+def wait_for_ssh(ip: str, timeout: float) -> bool:
+    """Waits until SSH server of device sends its banner."""
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        probe_start = time.monotonic()
+        try:
+            with socket.create_connection((ip, SSH_PORT), timeout=SSH_PROBE_TIMEOUT_S) as sock:
+                if sock.recv(4).startswith(b"SSH-"):
+                    return True
+        except OSError:
+            pass
+
+        time.sleep(max(SSH_PROBE_INTERVAL_S - (time.monotonic() - probe_start), 0))
+
+    return False
+
+
+def reload_devices(
+    targets: List[ReloadTarget],
+    ready_check: ReloadReadyCheck,
+    ready_pattern: Optional[str],
+    boot_pin_status: Optional[bool],
+    off_time_s: float,
+    stagger_s: float,
+    inrush_concurrency: int,
+    ready_timeout_s: float,
+    on_ready: Optional[ReadyCallback] = None
+) -> List[DeviceReloadResult]:
+    """
+    Power-cycles devices and waits for every device in parallel.
+
+    All devices are powered off at once. They are powered on in groups
+    of `inrush_concurrency` with `stagger_s` between groups, waiting for
+    a device starts right after its power-on. So the total time is the
+    time to ready of the slowest device plus staggering.
+    """
+    start = time.monotonic()
+    pattern = re.compile(ready_pattern) if ready_pattern is not None else None
+
+    set_pins([(target.power_pin, False) for target in targets])
+    if boot_pin_status is not None:
+        set_pins([(target.boot_pin, boot_pin_status) for target in targets])
+
+    time.sleep(off_time_s)
+
+    results: Dict[str, DeviceReloadResult] = {}
+    results_lock = threading.Lock()
+
+    def wait_for_device(target: ReloadTarget, powered_on_at: float, console_id: Optional[bytes]) -> None:
+        try:
+            if ready_check == ReloadReadyCheck.CONSOLE:
+                ready = wait_for_console(
+                    target.rs232_port, pattern, console_id, ready_timeout_s)
+            else:
+                ready = wait_for_ssh(target.ip, ready_timeout_s)
+
+            error = None if ready else f"Device was not ready in {ready_timeout_s} s"
+        except RedisError as exc:
+            ready, error = False, f"Failed to read console: {exc}"
+
+        result = DeviceReloadResult(
+            hostname=target.hostname,
+            ready=ready,
+            powered_on_at_s=powered_on_at - start,
+            time_to_ready_s=time.monotonic() - powered_on_at if ready else None,
+            error=error
+        )
+
+        with results_lock:
+            results[target.hostname] = result
+
+        logger.info(f"Device {target.hostname} ready: {ready}, time to ready: {result.time_to_ready_s}")
+        if on_ready is not None:
+            on_ready(result)
+
+    waiters: List[Future] = []
+    with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="reload") as executor:
+        for group_start in range(0, len(targets), inrush_concurrency):
+            group = targets[group_start:group_start + inrush_concurrency]
+            if group_start:
+                time.sleep(stagger_s)
+
+            # Output printed after power-on is not missed
+            console_ids = ({target.hostname: get_last_id(OUTPUT_STREAM_KEY.format(port=target.rs232_port)) for target in group}
+                           if ready_check == ReloadReadyCheck.CONSOLE else {})
+
+            try:
+                set_pins([(target.power_pin, True) for target in group])
+            except Exception as exc:
+                with results_lock:
+                    for target in group:
+                        results[target.hostname] = DeviceReloadResult(
+                            hostname=target.hostname, ready=False, error=f"Failed to power on: {exc}")
+                continue
+
+            powered_on_at = time.monotonic()
+            for target in group:
+                waiters.append(executor.submit(
+                    wait_for_device, target, powered_on_at, console_ids.get(target.hostname)))
+
+    for waiter in waiters:
+        waiter.result()
+
+    return [results[target.hostname] for target in targets]
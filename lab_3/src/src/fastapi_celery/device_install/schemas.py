@@ -0,0 +1,190 @@
+import re
+from pathlib import Path
+from typing import List, Optional, Union
+
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from ..bolid.schemas import BolidSchema
+from ..enums import DeviceTestStage, DeviceType, InstallStage, ReloadReadyCheck
+from ..images.schemas import ImageSchema
+
+#########################
+# --- Queue Request --- #
+#########################
+
+
+class DevicesRequest(BaseModel):
+    """Devices of reservation or listed devices."""
+    reservation_id: Optional[str] = Field(default=None)
+    hostnames: Optional[List[str]] = Field(default=None, min_length=1)
+
+    @model_validator(mode="after")
+    def check_devices(self):
+        if (self.reservation_id is None) == (self.hostnames is None):
+            raise ValueError(
+                "Exactly one of 'reservation_id' or 'hostnames' must be specified")
+        return self
+
+
+class ReloadRequest(DevicesRequest):
+    ready_check: ReloadReadyCheck = Field(default=ReloadReadyCheck.SSH)
+    ready_pattern: Optional[str] = Field(
+        default=None, description="Regex in console output of booted device", examples=["login:"])
+    boot_pin_status: Optional[bool] = Field(
+        default=None, description="State of boot output during power-on, not changed by default")
+    off_time_s: Optional[float] = Field(default=None, ge=0, examples=[3])
+    stagger_s: Optional[float] = Field(
+        default=None, ge=0, description="Delay between power-on of device groups", examples=[1])
+    inrush_concurrency: Optional[int] = Field(
+        default=None, gt=0, description="Devices powered on at once", examples=[4])
+    ready_timeout_s: Optional[float] = Field(default=None, gt=0, examples=[180])
+
+    @field_validator("ready_pattern")
+    @classmethod
+    def check_ready_pattern(cls, ready_pattern: Optional[str]) -> Optional[str]:
+        if ready_pattern is not None:
+            try:
+                re.compile(ready_pattern)
+            except re.error as exc:
+                raise ValueError(f"Invalid ready pattern regex: {exc}")
+        return ready_pattern
+
+    @model_validator(mode="after")
+    def check_request(self):
+        if self.ready_check == ReloadReadyCheck.CONSOLE and self.ready_pattern is None:
+            raise ValueError(
+                "'ready_pattern' must be specified to wait for console")
+        return self
+
+
+class InstallRequest(DevicesRequest):
+    off_time_s: Optional[float] = Field(default=None, ge=0, examples=[3])
+    ready_timeout_s: Optional[float] = Field(
+        default=None, gt=0, description="Timeout of boot to recovery and of reboot", examples=[180])
+    broadcast: bool = Field(
+        default=False, description="Image of the same build is read once and streamed to all its devices")
+    delta: bool = Field(
+        default=False, description="Only blocks which differ from data on device are transferred and written")
+
+    @model_validator(mode="after")
+    def check_request(self):
+        if self.broadcast and self.delta:
+            raise ValueError(
+                "'broadcast' and 'delta' can't be used together, delta of every device is different")
+        return self
+
+
+class RecoveryRequest(DevicesRequest):
+    file_name: Optional[str] = Field(
+        default=None, description="File in USB_RECOVERY_FOLDER_PATH loaded to RAM of device", examples=["u-boot.imx"])
+    off_time_s: Optional[float] = Field(default=None, ge=0, examples=[3])
+    loader_timeout_s: Optional[float] = Field(default=None, gt=0, examples=[60])
+    max_retries: Optional[int] = Field(
+        default=None, gt=0, description="Attempts per device, device is power-cycled before every attempt", examples=[3])
+
+
+class BolidPinRef(BaseModel):
+    bolid: BolidSchema
+    number: int
+
+
+class ReloadTarget(BaseModel):
+    """Device as passed to install worker, worker does not query database for it"""
+    hostname: str
+    ip: str
+    rs232_port: str
+    power_pin: BolidPinRef
+    boot_pin: BolidPinRef
+    test_stage: Optional[DeviceTestStage] = Field(
+        default=None, description="Test stage restored after reload")
+
+
+class RecoveryTarget(ReloadTarget):
+    usb_path: str
+
+
+class InstallTarget(ReloadTarget):
+    device_type: DeviceType
+    image: ImageSchema
+
+##########################
+# --- Queue Response --- #
+##########################
+
+
+class InstallQueuedResponse(BaseModel):
+    id: str
+    location: Union[Path, str]
+
+#########################
+# --- Worker Result --- #
+#########################
+
+
+class DeviceReloadResult(BaseModel):
+    hostname: str
+    ready: bool
+    powered_on_at_s: Optional[float] = Field(
+        default=None, description="Time of power-on since the start of reload")
+    time_to_ready_s: Optional[float] = Field(
+        default=None, description="Time from power-on to ready")
+    error: Optional[str] = Field(default=None)
+
+
+class ReloadResult(BaseModel):
+    devices: List[DeviceReloadResult]
+    slowest_time_to_ready_s: Optional[float]
+    execution_time_s: Optional[float]
+
+
+class InstallStageResult(BaseModel):
+    stage: InstallStage
+    duration_s: float
+    waited_s: float = Field(
+        default=0, description="Part of duration spent waiting for a free slot of stage")
+
+
+class DeviceInstallResult(BaseModel):
+    hostname: str
+    image_id: str
+    success: bool
+    stages: List[InstallStageResult]
+    failed_stage: Optional[InstallStage] = Field(default=None)
+    broadcast: bool = Field(
+        default=False, description="Image was streamed from read shared with other devices")
+    broadcast_detached: bool = Field(
+        default=False, description="Device lagged behind broadcast and read image alone")
+    transferred_bytes: Optional[int] = Field(default=None)
+    changed_blocks: Optional[int] = Field(
+        default=None, description="Blocks written by delta install")
+    total_blocks: Optional[int] = Field(default=None)
+    error: Optional[str] = Field(default=None)
+    execution_time_s: Optional[float]
+
+
+class InstallResult(BaseModel):
+    devices: List[DeviceInstallResult]
+    execution_time_s: Optional[float]
+
+class DeviceRecoveryResult(BaseModel):
+    hostname: str
+    success: bool
+    attempts: int
+    error: Optional[str] = Field(default=None)
+    execution_time_s: Optional[float]
+
+
+class RecoveryResult(BaseModel):
+    devices: List[DeviceRecoveryResult]
+    execution_time_s: Optional[float]
+
+###############################
+# --- Task State Response --- #
+###############################
+
+
+class InstallTaskResponse(BaseModel):
+    id: str
+    status: str
+    meta: Optional[dict]
+    result: Optional[Union[InstallResult, RecoveryResult, ReloadResult]]
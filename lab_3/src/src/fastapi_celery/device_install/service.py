@@ -1,8 +1,124 @@
+from typing import List, Optional
+
 from sqlalchemy.orm import Session
-from ..enums import PinType
+from ..bolid.schemas import BolidSchema
+from ..device_data.model import Device
+from ..device_data.service import update_test_stage
+from ..device_pin_control.bolid_driver import bolid_driver
+from ..device_pin_control.model import BolidPin
+from ..device_pin_control.service import get_devices_pin_ids, group_pin_states_by_bolid
+from ..device_reserve.service import get_reservation_devices
+from ..enums import DeviceTestStage, PinType
+from ..exceptions import (BolidPinNotFoundError, DeviceHasNoImageError,
+                          DeviceNotFoundError, UsbPathNotFoundError)
+from ..images.schemas import ImageSchema
+from .schemas import (BolidPinRef, InstallRequest, InstallTarget,
+                      RecoveryRequest, RecoveryTarget, ReloadRequest,
+                      ReloadTarget)
 
 def set_device_pin_status(db: Session, hostname: str, pin_type: PinType, pin_status: bool):
-    pass
+    pin_ids = get_devices_pin_ids(db, [hostname], pin_type)
+
+    for bolid_states in group_pin_states_by_bolid(db, {pin_id: pin_status for pin_id in pin_ids}):
+        bolid_driver.set_pins(bolid_states.bolid, bolid_states.pin_states)
 
 def stop_device_autoload():
-    pass
\ No newline at end of file
+    pass
+
+
+def get_pin_ref(bolid_pin: BolidPin) -> BolidPinRef:
+    return BolidPinRef(bolid=BolidSchema.model_validate(bolid_pin.bolid), number=bolid_pin.number)
+
+
+def get_target_devices(db: Session, reservation_id: Optional[str], hostnames: Optional[List[str]]) -> List[Device]:
+    """Devices of reservation or listed devices, every device must have power and boot pins."""
+    if reservation_id is not None:
+        hostnames = [device.hostname for device in get_reservation_devices(
+            db, reservation_id)]
+
+    if not hostnames:
+        raise DeviceNotFoundError("No devices found")
+
+    devices: List[Device] = db.query(Device).filter(
+        Device.hostname.in_(hostnames)).all()
+
+    missing_hostnames = set(hostnames) - {device.hostname for device in devices}
+    if missing_hostnames:
+        raise DeviceNotFoundError(
+            f"Devices with hostnames {sorted(missing_hostnames)} not found")
+
+    for device in devices:
+        if device.output_power is None or device.output_boot is None:
+            raise BolidPinNotFoundError(
+                f"Device {device.hostname} has no power or boot pin")
+
+    return devices
+
+
+def create_reload_target(device: Device) -> ReloadTarget:
+    return ReloadTarget(
+        hostname=device.hostname,
+        ip=device.ip,
+        rs232_port=device.rs232_port,
+        power_pin=get_pin_ref(device.output_power),
+        boot_pin=get_pin_ref(device.output_boot),
+        test_stage=device.test_stage
+    )
+
+
+def create_reload_targets(db: Session, request: ReloadRequest) -> List[ReloadTarget]:
+    """Resolves devices of reload with their pins and marks them as reloading."""
+    devices = get_target_devices(db, request.reservation_id, request.hostnames)
+    targets = [create_reload_target(device) for device in devices]
+
+    for target in targets:
+        update_test_stage(db, target.hostname, DeviceTestStage.RELOADING)
+
+    return targets
+
+
+def create_install_targets(db: Session, request: InstallRequest) -> List[InstallTarget]:
+    """Resolves devices of install with their images and marks them as installing."""
+    devices = get_target_devices(db, request.reservation_id, request.hostnames)
+
+    for device in devices:
+        if device.image is None:
+            raise DeviceHasNoImageError(
+                f"You must upload image for device {device.hostname} before install.")
+
+    targets = [
+        InstallTarget(
+            **create_reload_target(device).model_dump(),
+            device_type=device.type,
+            image=ImageSchema.model_validate(device.image)
+        )
+        for device in devices
+    ]
+
+    for target in targets:
+        update_test_stage(db, target.hostname, DeviceTestStage.INSTALLING_IMAGE)
+
+    return targets
+
+
+def create_recovery_targets(db: Session, request: RecoveryRequest) -> List[RecoveryTarget]:
+    """Resolves devices of USB recovery and marks them as installing."""
+    devices = get_target_devices(db, request.reservation_id, request.hostnames)
+
+    for device in devices:
+        if device.usb_path is None:
+            raise UsbPathNotFoundError(
+                f"Device {device.hostname} has no USB path of serial download")
+
+    targets = [
+        RecoveryTarget(
+            **create_reload_target(device).model_dump(),
+            usb_path=device.usb_path
+        )
+        for device in devices
+    ]
+
+    for target in targets:
+        update_test_stage(db, target.hostname, DeviceTestStage.INSTALLING_IMAGE)
+
+    return targets
@@ -0,0 +1,215 @@
+import datetime
+import threading
+from typing import List
+
+from celery import states
+from celery.utils.log import get_task_logger
+from pydantic import TypeAdapter, ValidationError
+
+from ..database import SessionLocal
+from ..device_data.service import update_test_stage
+from ..enums import DeviceTestStage, InstallStage, ReloadReadyCheck
+from ..exceptions import DeviceNotFoundError, InstallTargetError
+from .loader_output import LoaderOutputPublisher
+from .pipeline import install_devices
+from .reload import reload_devices
+from .schemas import (DeviceInstallResult, DeviceRecoveryResult,
+                      DeviceReloadResult, InstallResult, InstallTarget,
+                      RecoveryResult, RecoveryTarget, ReloadResult,
+                      ReloadTarget)
+from .usb_recovery import recover_devices
+from .worker import install_worker
+
+logger = get_task_logger("InstallTask")
+
+
+def set_test_stage(hostname: str, test_stage: DeviceTestStage) -> None:
+    db = SessionLocal()
+    try:
+        update_test_stage(db, hostname, test_stage)
+    except DeviceNotFoundError as exc:
+        logger.warning(f"Test stage is not updated: {exc}")
+    finally:
+        db.close()
+
+
+def restore_test_stages(targets: List[dict]) -> None:
+    """Restores stages by targets as passed to task, so they are restored even if targets are invalid."""
+    db = SessionLocal()
+    try:
+        for target in targets:
+            try:
+                update_test_stage(db, target["hostname"],
+                                  DeviceTestStage(target.get("test_stage") or DeviceTestStage.NONE))
+            except (DeviceNotFoundError, KeyError, ValueError) as exc:
+                logger.warning(f"Test stage is not restored: {exc}")
+    finally:
+        db.close()
+
+
+def validate_targets(target_type: type, targets: List[dict]) -> list:
+    # Error of pydantic can't be restored from result backend, so it is replaced
+    try:
+        return TypeAdapter(List[target_type]).validate_python(targets)
+    except ValidationError as exc:
+        raise InstallTargetError(f"Invalid targets: {exc}") from exc
+
+
+@install_worker.task(name="device_reload", bind=True, max_retries=0, queue='install_queue')
+def device_reload_task(
+    self,
+    targets: List[dict],
+    ready_check: ReloadReadyCheck,
+    ready_pattern: str,
+    boot_pin_status: bool,
+    off_time_s: float,
+    stagger_s: float,
+    inrush_concurrency: int,
+    ready_timeout_s: float
+) -> ReloadResult:
+    """Power-cycles devices and waits for them in parallel."""
+    self.update_state(state=states.STARTED,
+                      meta={})
+
+    finished: List[DeviceReloadResult] = []
+    finished_lock = threading.Lock()
+
+    def report_device(result: DeviceReloadResult) -> None:
+        with finished_lock:
+            finished.append(result)
+            self.update_state(state=states.STARTED,
+                              meta={'total': len(reload_targets),
+                                    'finished': len(finished),
+                                    'ready': sum(device.ready for device in finished)})
+
+    try:
+        reload_targets = validate_targets(ReloadTarget, targets)
+        start_time = datetime.datetime.now()
+
+        devices = reload_devices(
+            reload_targets, ReloadReadyCheck(ready_check), ready_pattern, boot_pin_status,
+            off_time_s, stagger_s, inrush_concurrency, ready_timeout_s, report_device)
+
+        end_time = datetime.datetime.now()
+        execution_time = (end_time - start_time).total_seconds()
+
+        times_to_ready = [device.time_to_ready_s for device in devices if device.ready]
+        response = ReloadResult(
+            devices=devices,
+            slowest_time_to_ready_s=max(times_to_ready) if times_to_ready else None,
+            execution_time_s=execution_time
+        )
+
+        return response.model_dump()
+    finally:
+        # Devices are not power-cycled again on error, the task fails
+        restore_test_stages(targets)
+
+
+@install_worker.task(name="device_install", bind=True, max_retries=0, queue='install_queue')
+def device_install_task(
+    self,
+    targets: List[dict],
+    off_time_s: float,
+    stagger_s: float,
+    ready_timeout_s: float,
+    broadcast: bool = False,
+    delta: bool = False
+) -> InstallResult:
+    """Installs images on devices, pipelines of devices run concurrently."""
+    self.update_state(state=states.STARTED,
+                      meta={})
+
+    device_stages = {}
+    finished: List[DeviceInstallResult] = []
+    progress_lock = threading.Lock()
+
+    def report_progress() -> None:
+        self.update_state(state=states.STARTED,
+                          meta={'total': len(install_targets),
+                                'finished': len(finished),
+                                'succeeded': sum(device.success for device in finished),
+                                'stages': dict(device_stages)})
+
+    def report_stage(hostname: str, stage: InstallStage) -> None:
+        if stage == InstallStage.REBOOT:
+            set_test_stage(hostname, DeviceTestStage.RELOADING)
+
+        with progress_lock:
+            device_stages[hostname] = stage
+            report_progress()
+
+    def report_device(result: DeviceInstallResult) -> None:
+        with progress_lock:
+            finished.append(result)
+            report_progress()
+
+    try:
+        install_targets = validate_targets(InstallTarget, targets)
+        device_stages.update({target.hostname: None for target in install_targets})
+        start_time = datetime.datetime.now()
+
+        devices = install_devices(
+            install_targets, off_time_s, stagger_s, ready_timeout_s, broadcast, delta,
+            report_stage, report_device)
+
+        end_time = datetime.datetime.now()
+        execution_time = (end_time - start_time).total_seconds()
+
+        response = InstallResult(
+            devices=devices,
+            execution_time_s=execution_time
+        )
+
+        return response.model_dump()
+    finally:
+        # Errors of a device are in its result, other errors fail the task
+        restore_test_stages(targets)
+
+
+@install_worker.task(name="device_recovery", bind=True, max_retries=0, queue='install_queue')
+def device_recovery_task(
+    self,
+    targets: List[dict],
+    file_name: str,
+    off_time_s: float,
+    stagger_s: float,
+    loader_timeout_s: float,
+    max_retries: int
+) -> RecoveryResult:
+    """Loads recovery file to devices over USB serial download, devices are recovered concurrently."""
+    self.update_state(state=states.STARTED,
+                      meta={})
+
+    output = LoaderOutputPublisher(self.request.id)
+    finished: List[DeviceRecoveryResult] = []
+    finished_lock = threading.Lock()
+
+    def report_device(result: DeviceRecoveryResult) -> None:
+        with finished_lock:
+            finished.append(result)
+            self.update_state(state=states.STARTED,
+                              meta={'total': len(recovery_targets),
+                                    'finished': len(finished),
+                                    'succeeded': sum(device.success for device in finished)})
+
+    try:
+        recovery_targets = validate_targets(RecoveryTarget, targets)
+        start_time = datetime.datetime.now()
+
+        devices = recover_devices(
+            recovery_targets, file_name, off_time_s, stagger_s, loader_timeout_s, max_retries,
+            output.publish, report_device)
+
+        end_time = datetime.datetime.now()
+        execution_time = (end_time - start_time).total_seconds()
+
+        response = RecoveryResult(
+            devices=devices,
+            execution_time_s=execution_time
+        )
+
+        return response.model_dump()
+    finally:
+        output.close()
+        restore_test_stages(targets)
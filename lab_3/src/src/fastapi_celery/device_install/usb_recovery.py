@@ -0,0 +1,257 @@
+import logging
+import os
+import selectors
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..config import server_settings
+from ..enums import InstallStage
+from ..exceptions import RecoveryFileNotFoundError
+from .pipeline import stage_limits
+from .reload import set_pins
+from .schemas import DeviceRecoveryResult, RecoveryTarget
+
+logger = logging.getLogger("UsbRecovery")
+
+USB_DEVICES_PATH = Path("/sys/bus/usb/devices")
+USB_POLL_INTERVAL_S: float = 0.2
+READ_CHUNK_SIZE: int = 4096
+
+# Called with hostname, number of attempt and output of loader
+OutputCallback = Callable[[str, int, str], None]
+DoneCallback = Callable[[DeviceRecoveryResult], None]
+
+
+def get_recovery_file(file_name: str) -> Path:
+    """File in USB_RECOVERY_FOLDER_PATH, paths outside of folder are rejected."""
+    folder = Path(server_settings.INSTALL_SETTINGS.USB_RECOVERY_FOLDER_PATH).resolve()
+    path = (folder / file_name).resolve()
+
+    if not path.is_relative_to(folder) or not path.is_file():
+        raise RecoveryFileNotFoundError(
+            f"File {file_name} is not found in {folder}")
+
+    return path
+
+
+def get_usb_address(usb_path: str) -> Optional[Tuple[int, int]]:
+    """Bus and address of device connected to USB port path, address changes on every enumeration."""
+    device = USB_DEVICES_PATH / usb_path
+
+    try:
+        return int((device / "busnum").read_text()), int((device / "devnum").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def wait_for_usb_device(usb_path: str, timeout: float) -> Optional[Tuple[int, int]]:
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        address = get_usb_address(usb_path)
+        if address is not None:
+            return address
+
+        time.sleep(USB_POLL_INTERVAL_S)
+
+    return None
+
+
+def create_memory_file(name: str) -> int:
+    if hasattr(os, "memfd_create"):
+        return os.memfd_create(name, os.MFD_CLOEXEC)
+
+    # Unnamed file in temporary folder, e.g. if libc has no memfd
+    with tempfile.TemporaryFile() as file:
+        return os.dup(file.fileno())
+
+
+class RecoveryFileCache:
+    """
+    Recovery files kept in memory, loaders of all devices read the same copy.
+
+    File is copied to anonymous memory file once and copied again only
+    if it changed on disk. Loader opens the copy by its /proc path.
+    """
+
+    def __init__(self):
+        # Path -> ((mtime, size), descriptor of memory file)
+        self._files: Dict[str, Tuple[Tuple[int, int], int]] = {}
+        self._lock = threading.Lock()
+
+    def get_path(self, path: Path) -> str:
+        stat = path.stat()
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            cached = self._files.get(str(path))
+
+            # Previous copy is not closed, running loaders may still read it
+            if cached is None or cached[0] != version:
+                fd = create_memory_file(path.name)
+                with open(path, "rb") as file:
+                    os.write(fd, file.read())
+
+                cached = (version, fd)
+                self._files[str(path)] = cached
+                logger.info(f"Recovery file {path} ({stat.st_size} bytes) is cached in memory")
+
+        return f"/proc/{os.getpid()}/fd/{cached[1]}"
+
+
+class BusLocks:
+    """Loaders on the same USB bus are run one by one, loaders on different buses run at once."""
+
+    def __init__(self):
+        self._locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, bus: int) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(bus, threading.Lock())
+
+
+def run_loader(bus: int, address: int, file_path: str, timeout: float, on_output: Callable[[str], None]) -> Optional[int]:
+    """Runs imx_usb_loader for one device, returns its exit code or None on timeout."""
+    settings = server_settings.INSTALL_SETTINGS
+    command = [
+        settings.USB_LOADER_PATH,
+        f"--configdir={settings.USB_LOADER_CONFIG_PATH}",
+        f"--bus={bus}",
+        f"--device={address}",
+        file_path
+    ]
+
+    deadline = time.monotonic() + timeout
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ)
+
+        while (remaining := deadline - time.monotonic()) > 0:
+            if not selector.select(remaining):
+                continue
+
+            data = os.read(process.stdout.fileno(), READ_CHUNK_SIZE)
+            if not data:
+                break
+
+            on_output(data.decode(errors="replace"))
+        else:
+            process.kill()
+            process.wait()
+            return None
+
+    try:
+        return process.wait(max(deadline - time.monotonic(), 0))
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+        return None
+
+
+def recover_device(
+    target: RecoveryTarget,
+    file_path: str,
+    off_time_s: float,
+    stagger_s: float,
+    loader_timeout_s: float,
+    max_retries: int,
+    on_output: Optional[OutputCallback] = None
+) -> DeviceRecoveryResult:
+    """
+    Loads recovery file to RAM of device over USB serial download.
+
+    Before every attempt device is put to serial download by boot pin
+    and power-cycled, then loader is run once device enumerates. Boot pin
+    stays on, so device returns to serial download on reset until an
+    image is installed.
+    """
+    settings = server_settings.INSTALL_SETTINGS
+    start = time.monotonic()
+    error = None
+
+    def publish(attempt: int, text: str) -> None:
+        if on_output is not None:
+            on_output(target.hostname, attempt, text)
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            set_pins([(target.boot_pin, True)])
+            with stage_limits.slot(InstallStage.POWER_CYCLE):
+                set_pins([(target.power_pin, False)])
+                time.sleep(off_time_s)
+                set_pins([(target.power_pin, True)])
+                # Slot is held until inrush of device is over
+                time.sleep(stagger_s)
+        except Exception as exc:
+            error = f"Failed to switch pins: {exc}"
+            logger.warning(f"Recovery of {target.hostname}, attempt {attempt}: {error}")
+            continue
+
+        usb_address = wait_for_usb_device(target.usb_path, settings.USB_ENUMERATE_TIMEOUT_S)
+        if usb_address is None:
+            error = f"USB device did not appear at {target.usb_path} in {settings.USB_ENUMERATE_TIMEOUT_S} s"
+            logger.warning(f"Recovery of {target.hostname}, attempt {attempt}: {error}")
+            continue
+
+        bus, address = usb_address
+        with bus_locks.get(bus):
+            retcode = run_loader(bus, address, file_path, loader_timeout_s,
+                                 lambda text: publish(attempt, text))
+
+        if retcode == 0:
+            logger.info(f"Recovered {target.hostname} in {attempt} attempt(s)")
+            return DeviceRecoveryResult(
+                hostname=target.hostname,
+                success=True,
+                attempts=attempt,
+                execution_time_s=time.monotonic() - start
+            )
+
+        error = (f"Loader timed out after {loader_timeout_s} s" if retcode is None
+                 else f"Loader exited with code {retcode}")
+        logger.warning(f"Recovery of {target.hostname}, attempt {attempt}: {error}")
+
+    return DeviceRecoveryResult(
+        hostname=target.hostname,
+        success=False,
+        attempts=max_retries,
+        error=error,
+        execution_time_s=time.monotonic() - start
+    )
+
+
+def recover_devices(
+    targets: List[RecoveryTarget],
+    file_name: str,
+    off_time_s: float,
+    stagger_s: float,
+    loader_timeout_s: float,
+    max_retries: int,
+    on_output: Optional[OutputCallback] = None,
+    on_done: Optional[DoneCallback] = None
+) -> List[DeviceRecoveryResult]:
+    """Recovers all devices at once, loaders are serialized per USB bus."""
+    file_path = recovery_files.get_path(get_recovery_file(file_name))
+
+    def recover(target: RecoveryTarget) -> DeviceRecoveryResult:
+        result = recover_device(
+            target, file_path, off_time_s, stagger_s, loader_timeout_s, max_retries, on_output)
+
+        if on_done is not None:
+            on_done(result)
+
+        return result
+
+    with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="recovery") as executor:
+        return list(executor.map(recover, targets))
+
+
+recovery_files = RecoveryFileCache()
+bus_locks = BusLocks()
@@ -0,0 +1,188 @@
+from typing import Optional
+
+from celery import states
+from celery.result import AsyncResult
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from ..config import server_settings
+from ..database import get_db
+from ..exceptions import (BolidPinNotFoundError, DeviceHasNoImageError,
+                          DeviceNotFoundError, ReservationNotFoundError,
+                          UsbPathNotFoundError)
+from ..task_status import MAX_WAIT_S, get_task_meta, wait_for_task_update
+from .loader_output import read_loader_events
+from .schemas import (InstallQueuedResponse, InstallRequest,
+                      InstallTaskResponse, RecoveryRequest, ReloadRequest)
+from .service import (create_install_targets, create_recovery_targets,
+                      create_reload_targets)
+from .tasks import (device_install_task, device_recovery_task,
+                    device_reload_task, install_worker)
+
+router = APIRouter(prefix="/device_install", tags=["Device Install"])
+
+
+@router.post("/reload", status_code=202, response_model=InstallQueuedResponse)
+def reload(request: ReloadRequest, db: Session = Depends(get_db)) -> InstallQueuedResponse:
+    """
+    Power-cycles devices of reservation or listed devices and waits until they are ready.
+
+    Time to ready of every device is reported in result.
+    """
+    try:
+        targets = create_reload_targets(db, request)
+    except DeviceNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except ReservationNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except BolidPinNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    install_settings = server_settings.INSTALL_SETTINGS
+
+    def or_default(value, default):
+        return default if value is None else value
+
+    task = device_reload_task.delay(
+        targets=[target.model_dump() for target in targets],
+        ready_check=request.ready_check,
+        ready_pattern=request.ready_pattern,
+        boot_pin_status=request.boot_pin_status,
+        off_time_s=or_default(request.off_time_s, install_settings.RELOAD_OFF_TIME_S),
+        stagger_s=or_default(request.stagger_s, install_settings.RELOAD_STAGGER_S),
+        inrush_concurrency=or_default(
+            request.inrush_concurrency, install_settings.RELOAD_INRUSH_CONCURRENCY),
+        ready_timeout_s=or_default(
+            request.ready_timeout_s, install_settings.RELOAD_READY_TIMEOUT_S)
+    )
+
+    response = InstallQueuedResponse(id=task.id, location=f"/queue/{task.id}")
+    return response
+
+
+@router.post("/install", status_code=202, response_model=InstallQueuedResponse)
+def install(request: InstallRequest, db: Session = Depends(get_db)) -> InstallQueuedResponse:
+    """
+    Installs uploaded images on devices of reservation or listed devices.
+
+    Every device passes stages boot pin on, power cycle, transfer, verify,
+    boot pin off and reboot, devices are installed concurrently. Durations
+    of stages of every device are reported in result.
+
+    With `broadcast` devices with images of the same build share one read
+    of image file instead of reading it for every device. With `delta` only
+    blocks which differ from data on device are transferred.
+    """
+    try:
+        targets = create_install_targets(db, request)
+    except DeviceNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except DeviceHasNoImageError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except ReservationNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except BolidPinNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    install_settings = server_settings.INSTALL_SETTINGS
+
+    task = device_install_task.delay(
+        targets=[target.model_dump() for target in targets],
+        off_time_s=install_settings.RELOAD_OFF_TIME_S if request.off_time_s is None else request.off_time_s,
+        stagger_s=install_settings.RELOAD_STAGGER_S,
+        ready_timeout_s=(install_settings.RELOAD_READY_TIMEOUT_S
+                         if request.ready_timeout_s is None else request.ready_timeout_s),
+        broadcast=request.broadcast,
+        delta=request.delta
+    )
+
+    response = InstallQueuedResponse(id=task.id, location=f"/queue/{task.id}")
+    return response
+
+
+@router.post("/recovery", status_code=202, response_model=InstallQueuedResponse)
+def recovery(request: RecoveryRequest, db: Session = Depends(get_db)) -> InstallQueuedResponse:
+    """
+    Loads recovery u-boot to RAM of devices over USB serial download.
+
+    Devices are recovered concurrently, loaders on the same USB bus run one
+    by one. Output of loaders is streamed from `/queue/{task_id}/stream`.
+    """
+    try:
+        targets = create_recovery_targets(db, request)
+    except DeviceNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except UsbPathNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except ReservationNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except BolidPinNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    install_settings = server_settings.INSTALL_SETTINGS
+
+    task = device_recovery_task.delay(
+        targets=[target.model_dump() for target in targets],
+        file_name=request.file_name or install_settings.USB_RECOVERY_FILE_NAME,
+        off_time_s=install_settings.RELOAD_OFF_TIME_S if request.off_time_s is None else request.off_time_s,
+        stagger_s=install_settings.RELOAD_STAGGER_S,
+        loader_timeout_s=request.loader_timeout_s or install_settings.USB_LOADER_TIMEOUT_S,
+        max_retries=request.max_retries or install_settings.USB_LOADER_MAX_RETRIES
+    )
+
+    response = InstallQueuedResponse(id=task.id, location=f"/queue/{task.id}")
+    return response
+
+
+def build_task_response(task_id: str) -> InstallTaskResponse:
+    install_task = AsyncResult(task_id, app=install_worker)
+
+    # Result is either of reload or of install, it is told apart by its fields
+    result = None
+    if install_task.state == states.SUCCESS:
+        result = install_task.result
+
+    install_task_response = InstallTaskResponse(
+        id=task_id,
+        status=install_task.state,
+        meta=get_task_meta(install_task),
+        result=result
+    )
+
+    return install_task_response
+
+
+@router.get("/queue/{task_id}", response_model=InstallTaskResponse)
+async def get_status(
+    task_id: str,
+    wait: Optional[int] = Query(
+        None, ge=0, le=MAX_WAIT_S, description="Long-poll: wait up to `wait` s for update of task"),
+    since: Optional[str] = Query(
+        None, description="Status known by client, long-poll returns once status differs")
+) -> InstallTaskResponse:
+    """URL used to receive updates on Celery tasks."""
+    if wait:
+        await wait_for_task_update(install_worker, task_id, wait, since)
+
+    return build_task_response(task_id)
+
+
+@router.get("/queue/{task_id}/stream")
+async def stream_output(
+    task_id: str,
+    offset: Optional[str] = Query(
+        None, description="ID of the last received event, output is streamed after it"),
+    last_event_id: Optional[str] = Header(None)
+) -> StreamingResponse:
+    """
+    Server-Sent Events with output of USB loaders of recovery task.
+
+    Every event contains hostname and attempt of device, stream ends with 'eof' event.
+    Reconnecting clients resume from the 'Last-Event-ID' header or `offset`.
+    """
+    return StreamingResponse(
+        read_loader_events(task_id, offset or last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
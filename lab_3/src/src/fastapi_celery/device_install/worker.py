@@ -1,11 +1,12 @@
 from celery import Celery
-from ..config import env_settings
+from ..config import env_settings, server_settings
 
 install_worker = Celery('install_worker',
                     broker_connection_retry_on_startup=True,
                     broker=env_settings.CELERY_BROKER_URL,
                     backend=env_settings.CELERY_RESULT_BACKEND,
-                    include=['src.fastapi_celery.device_install.tasks']
+                    include=['src.fastapi_celery.device_install.tasks',
+                             'src.fastapi_celery.device_pin_control.tasks']
                     )
 install_worker.config_from_object('src.fastapi_celery.celeryconfig')
 
@@ -14,5 +15,8 @@ install_worker.conf.update(
     task_serializer='json',
     result_serializer='json',
     accept_content=['json'],
-    timezone='UTC'
+    timezone='UTC',
+    # Sessions with bolids are shared by concurrent tasks of one process
+    worker_pool='threads',
+    worker_concurrency=server_settings.INSTALL_SETTINGS.WORKER_CONCURRENCY
 )
@@ -0,0 +1,387 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import serial
+from redis.exceptions import RedisError
+from serial import SerialException
+
+from ..bolid.schemas import BolidSchema
+from ..config import server_settings
+from ..exceptions import BolidModbusError
+from .coil_shadow import publish_coil_states, reply_refresh, take_refresh_request
+
+logger = logging.getLogger("BolidDriver")
+
+READ_COILS = 0x01
+WRITE_MULTIPLE_COILS = 0x0F
+EXCEPTION_FLAG = 0x80
+# Limit of coils in one write multiple coils request
+MAX_COILS_PER_FRAME: int = 1968
+# Silent interval between RTU frames, in characters
+FRAME_GAP_CHARS: float = 3.5
+# Reader of refresh requests checks for stop of driver at least this often
+REFRESH_REQUEST_WAIT_S: float = 1
+
+
+def _build_crc_table() -> List[int]:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC_TABLE = _build_crc_table()
+
+
+def crc16_modbus(data: bytes) -> int:
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ CRC_TABLE[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def build_frame(slave_address: int, function: int, payload: bytes) -> bytes:
+    frame = bytes([slave_address, function]) + payload
+    return frame + crc16_modbus(frame).to_bytes(2, "little")
+
+
+def pack_coils(values: List[bool]) -> bytes:
+    """Coils are packed LSB first, the first coil is bit 0 of the first byte."""
+    packed = bytearray((len(values) + 7) // 8)
+    for number, value in enumerate(values):
+        if value:
+            packed[number // 8] |= 1 << (number % 8)
+    return bytes(packed)
+
+
+def unpack_coils(packed: bytes, amount: int) -> List[bool]:
+    return [bool(packed[number // 8] >> (number % 8) & 1) for number in range(amount)]
+
+
+def get_coil_address(pin_number: int) -> int:
+    """Pins are numbered from 1."""
+    return server_settings.BOLID_SETTINGS.FIRST_PIN_COIL_ADDRESS + pin_number - 1
+
+
+def get_pin_number(coil_address: int) -> int:
+    return coil_address - server_settings.BOLID_SETTINGS.FIRST_PIN_COIL_ADDRESS + 1
+
+
+class _CoilBatch:
+    def __init__(self):
+        self.changes: Dict[int, bool] = {}
+        self.requests = 0
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+
+
+class BolidSession:
+    """
+    Modbus RTU session with one bolid, port is kept open between requests.
+
+    Concurrent pin changes are collected for COALESCE_WINDOW_S and
+    written as one "write multiple coils" frame. The frame covers range
+    from the lowest to the highest changed coil, coils inside the range
+    which were not changed are written with their known state.
+
+    Known states are the shadow of bolid. It is updated on every write
+    and read, reconciled by periodic read of all coils and published to
+    Redis, so states are served without a bus transaction.
+    """
+
+    def __init__(self, bolid: BolidSchema):
+        self.bolid = bolid
+        self.settings = server_settings.BOLID_SETTINGS
+
+        self._serial: Optional[serial.Serial] = None
+        # Last known state of coil by address
+        self._coils: Dict[int, bool] = {}
+        # Start of the last read of all coils
+        self._refreshed_at = 0.0
+        self._stopped = threading.Event()
+        self._poll_thread: Optional[threading.Thread] = None
+        self._port_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending = _CoilBatch()
+        self._flushing = False
+        self._last_frame_at = 0.0
+        self._frame_gap_s = FRAME_GAP_CHARS * 11 / bolid.baudrate
+
+    def set_coils(self, changes: Dict[int, bool]) -> int:
+        """
+        Sets coils by address, blocks until they are written.
+
+        Returns amount of requests which were written in the same frame.
+        """
+        with self._lock:
+            batch = self._pending
+            batch.changes.update(changes)
+            batch.requests += 1
+
+            leader = not self._flushing
+            self._flushing = True
+
+        if leader:
+            # Changes of other requests are collected meanwhile
+            time.sleep(self.settings.COALESCE_WINDOW_S)
+            self._flush()
+
+        batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+
+        return batch.requests
+
+    def read_coils(self, address: int, amount: int) -> List[bool]:
+        with self._port_lock:
+            values = self._read_coils_locked(address, amount)
+
+        return values
+
+    def refresh(self) -> None:
+        """
+        Reads all coils of bolid in one frame.
+
+        Requests which were waiting for the port while other read
+        started after them share its result instead of a new read.
+        """
+        requested_at = time.time()
+
+        with self._port_lock:
+            if self._refreshed_at >= requested_at:
+                return
+
+            self._refreshed_at = time.time()
+            self._read_coils_locked(get_coil_address(1), self.bolid.pin_capacity)
+
+    def start_polling(self, interval_s: float) -> None:
+        self._poll_thread = threading.Thread(
+            target=self._poll, args=(interval_s,), name=f"bolid-poll-{self.bolid.name}", daemon=True)
+        self._poll_thread.start()
+
+    def close(self) -> None:
+        self._stopped.set()
+        if self._poll_thread is not None:
+            self._poll_thread.join()
+
+        with self._port_lock:
+            self._close_locked()
+
+    def _poll(self, interval_s: float) -> None:
+        while not self._stopped.wait(interval_s):
+            try:
+                self.refresh()
+            except (BolidModbusError, SerialException) as exc:
+                logger.warning(f"Failed to poll coils of bolid {self.bolid.name}: {exc}")
+
+    def _flush(self) -> None:
+        while True:
+            with self._lock:
+                batch = self._pending
+                if not batch.changes:
+                    self._flushing = False
+                    return
+                self._pending = _CoilBatch()
+
+            try:
+                with self._port_lock:
+                    self._write_coils_locked(batch.changes)
+            except Exception as exc:
+                batch.error = exc
+            finally:
+                batch.done.set()
+
+    def _write_coils_locked(self, changes: Dict[int, bool]) -> None:
+        addresses = sorted(changes)
+
+        # Ranges are split by frame limit
+        while addresses:
+            first = addresses[0]
+            in_frame = [address for address in addresses if address < first + MAX_COILS_PER_FRAME]
+            addresses = addresses[len(in_frame):]
+            last = in_frame[-1]
+
+            unknown = [address for address in range(first, last + 1)
+                       if address not in changes and address not in self._coils]
+            if unknown:
+                self._read_coils_locked(unknown[0], unknown[-1] - unknown[0] + 1)
+
+            values = [changes.get(address, self._coils.get(address, False))
+                      for address in range(first, last + 1)]
+
+            payload = (first.to_bytes(2, "big") + len(values).to_bytes(2, "big")
+                       + bytes([(len(values) + 7) // 8]) + pack_coils(values))
+            self._transact(WRITE_MULTIPLE_COILS, payload, response_size=4)
+
+            self._store_coils_locked(first, values)
+
+    def _read_coils_locked(self, address: int, amount: int) -> List[bool]:
+        byte_count = (amount + 7) // 8
+        response = self._transact(
+            READ_COILS, address.to_bytes(2, "big") + amount.to_bytes(2, "big"),
+            response_size=1 + byte_count)
+
+        values = unpack_coils(response[1:], amount)
+        self._store_coils_locked(address, values)
+
+        return values
+
+    def _store_coils_locked(self, address: int, values: List[bool]) -> None:
+        updated_at = time.time()
+        pin_states = {}
+
+        for coil_address, value in enumerate(values, start=address):
+            self._coils[coil_address] = value
+            pin_states[get_pin_number(coil_address)] = (value, updated_at)
+
+        publish_coil_states(self.bolid.name, pin_states)
+
+    def _transact(self, function: int, payload: bytes, response_size: int) -> bytes:
+        """Sends request and returns payload of response, request is repeated on timeout or corrupted response."""
+        request = build_frame(self.settings.SLAVE_ADDRESS, function, payload)
+        last_error = None
+
+        for _ in range(self.settings.MAX_RETRIES):
+            try:
+                ser = self._get_serial_locked()
+
+                gap = self._last_frame_at + self._frame_gap_s - time.monotonic()
+                if gap > 0:
+                    time.sleep(gap)
+
+                ser.reset_input_buffer()
+                ser.write(request)
+
+                header = ser.read(2)
+                if len(header) == 2 and header[1] == function | EXCEPTION_FLAG:
+                    # Slave address, function, exception code and CRC
+                    response = header + ser.read(3)
+                else:
+                    response = header + ser.read(response_size + 2)
+                self._last_frame_at = time.monotonic()
+            except SerialException as exc:
+                last_error = exc
+                self._close_locked()
+                continue
+
+            if len(response) < 5:
+                last_error = "no response"
+                continue
+            if crc16_modbus(response[:-2]) != int.from_bytes(response[-2:], "little"):
+                last_error = "CRC mismatch"
+                continue
+            if response[1] == function | EXCEPTION_FLAG:
+                raise BolidModbusError(
+                    f"Bolid {self.bolid.name} returned exception {response[2]} to function {function}")
+            if response[0] != self.settings.SLAVE_ADDRESS or response[1] != function:
+                last_error = f"unexpected response {response.hex()}"
+                continue
+
+            return response[2:-2]
+
+        raise BolidModbusError(
+            f"Bolid {self.bolid.name} on {self.bolid.port} did not respond to function {function}: {last_error}")
+
+    def _get_serial_locked(self) -> serial.Serial:
+        if self._serial is None:
+            self._serial = serial.Serial(
+                self.bolid.port,
+                self.bolid.baudrate,
+                bytesize=self.bolid.bytesize,
+                parity=self.bolid.parity,
+                stopbits=self.bolid.stopbits,
+                timeout=self.settings.RESPONSE_TIMEOUT_S
+            )
+            logger.info(f"Opened session with bolid {self.bolid.name} on {self.bolid.port}")
+
+        return self._serial
+
+    def _close_locked(self) -> None:
+        if self._serial is not None:
+            self._serial.close()
+            self._serial = None
+
+
+class BolidDriver:
+    """
+    Owner of sessions with bolids, one session per port for the life of worker.
+
+    Reads requested by API are taken from their own Redis queue by a
+    thread of driver, so they don't wait for a free worker thread behind
+    long install tasks.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, BolidSession] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    def get_session(self, bolid: BolidSchema) -> BolidSession:
+        with self._lock:
+            session = self._sessions.get(bolid.port)
+            if session is None:
+                session = BolidSession(bolid)
+                self._sessions[bolid.port] = session
+
+        return session
+
+    def start(self, bolids: Iterable[BolidSchema], poll_interval_s: float) -> None:
+        """Opens sessions with bolids and starts reconciliation of their shadows."""
+        for bolid in bolids:
+            self.get_session(bolid).start_polling(poll_interval_s)
+
+        self._stopped.clear()
+        self._refresh_thread = threading.Thread(
+            target=self._serve_refresh_requests, name="bolid-refresh", daemon=True)
+        self._refresh_thread.start()
+
+    def set_pins(self, bolid: BolidSchema, pin_states: Dict[int, bool]) -> int:
+        """Sets outputs of bolid by pin number, returns amount of requests written in the same frame."""
+        return self.get_session(bolid).set_coils(
+            {get_coil_address(number): state for number, state in pin_states.items()})
+
+    def close_all(self) -> None:
+        self._stopped.set()
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+
+        for session in sessions:
+            session.close()
+
+    def _serve_refresh_requests(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                request = take_refresh_request(REFRESH_REQUEST_WAIT_S)
+            except RedisError as exc:
+                logger.warning(f"Failed to take read request of bolids: {exc}")
+                self._stopped.wait(REFRESH_REQUEST_WAIT_S)
+                continue
+
+            if request is not None:
+                # Bolids are read in parallel, reads of one bolid are shared by its session
+                threading.Thread(target=self._refresh, args=(request,), daemon=True).start()
+
+    def _refresh(self, request: dict) -> None:
+        bolid = BolidSchema(**request["bolid"])
+        error = None
+
+        try:
+            self.get_session(bolid).refresh()
+        except (BolidModbusError, SerialException) as exc:
+            logger.warning(f"Failed to read coils of bolid {bolid.name}: {exc}")
+            error = str(exc)
+
+        reply_refresh(request["request_id"], bolid.name, error)
+
+
+bolid_driver = BolidDriver()
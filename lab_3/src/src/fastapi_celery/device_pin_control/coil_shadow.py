@@ -0,0 +1,111 @@
+import json
+import logging
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from ..redis_client import async_redis_client, redis_client
+
+logger = logging.getLogger("BolidCoilShadow")
+
+COIL_SHADOW_KEY = "bolid:coils:{bolid_name}"
+# Shadow of bolid which is not polled anymore disappears
+COIL_SHADOW_TTL_S: int = 86400
+# Reads of bolids requested by API, served by a thread of install worker
+COIL_REFRESH_KEY = "bolid:coils:refresh"
+COIL_REFRESH_REPLY_KEY = "bolid:coils:refresh:{request_id}"
+# Requests and replies nobody waits for anymore disappear
+COIL_REFRESH_TTL_S: int = 60
+
+# State of pin and wall clock time when it was written or read from bolid
+CoilState = Tuple[bool, float]
+
+
+def publish_coil_states(bolid_name: str, pin_states: Dict[int, CoilState]) -> None:
+    """Stores known states of pins of bolid, API reads them without touching the bus."""
+    if not pin_states:
+        return
+
+    key = COIL_SHADOW_KEY.format(bolid_name=bolid_name)
+    mapping = {number: f"{int(state)}:{updated_at}"
+               for number, (state, updated_at) in pin_states.items()}
+
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.hset(key, mapping=mapping)
+        pipeline.expire(key, COIL_SHADOW_TTL_S)
+        pipeline.execute()
+    except RedisError as exc:
+        logger.debug(f"Failed to publish coils of bolid {bolid_name}: {exc}")
+
+
+def get_coil_states(bolid_names: Iterable[str]) -> Dict[str, Dict[int, CoilState]]:
+    """Known states of pins by bolid name and pin number."""
+    bolid_names = list(bolid_names)
+
+    pipeline = redis_client.pipeline(transaction=False)
+    for bolid_name in bolid_names:
+        pipeline.hgetall(COIL_SHADOW_KEY.format(bolid_name=bolid_name))
+
+    coil_states = {}
+    for bolid_name, raw_states in zip(bolid_names, pipeline.execute()):
+        pin_states = {}
+        for number, raw_state in raw_states.items():
+            state, updated_at = raw_state.decode().split(":")
+            pin_states[int(number)] = (state == "1", float(updated_at))
+
+        coil_states[bolid_name] = pin_states
+
+    return coil_states
+
+
+async def refresh_coil_states(bolids: List[dict], timeout_s: float) -> Dict[str, Optional[str]]:
+    """
+    Requests read of coils of bolids on the bus and waits for it.
+
+    Returns error by bolid name, None if bolid was read. Bolids which
+    were not read in time are missing.
+    """
+    request_id = uuid.uuid4().hex
+    reply_key = COIL_REFRESH_REPLY_KEY.format(request_id=request_id)
+
+    async with async_redis_client.pipeline(transaction=False) as pipeline:
+        for bolid in bolids:
+            pipeline.rpush(COIL_REFRESH_KEY, json.dumps(
+                {"request_id": request_id, "bolid": bolid}))
+        pipeline.expire(COIL_REFRESH_KEY, COIL_REFRESH_TTL_S)
+        await pipeline.execute()
+
+    errors = {}
+    deadline = time.monotonic() + timeout_s
+
+    while len(errors) < len(bolids) and (remaining := deadline - time.monotonic()) > 0:
+        reply = await async_redis_client.blpop([reply_key], timeout=remaining)
+        if reply is None:
+            break
+
+        raw_reply = json.loads(reply[1])
+        errors[raw_reply["bolid_name"]] = raw_reply["error"]
+
+    return errors
+
+
+def take_refresh_request(timeout_s: float) -> Optional[dict]:
+    """Request of read of one bolid, None if there was no request for timeout."""
+    request = redis_client.blpop([COIL_REFRESH_KEY], timeout=timeout_s)
+
+    return json.loads(request[1]) if request is not None else None
+
+
+def reply_refresh(request_id: str, bolid_name: str, error: Optional[str]) -> None:
+    key = COIL_REFRESH_REPLY_KEY.format(request_id=request_id)
+
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.rpush(key, json.dumps({"bolid_name": bolid_name, "error": error}))
+        pipeline.expire(key, COIL_REFRESH_TTL_S)
+        pipeline.execute()
+    except RedisError as exc:
+        logger.debug(f"Failed to reply read of bolid {bolid_name}: {exc}")
@@ -1,5 +1,11 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Union
+
+from datetime import datetime
+from pathlib import Path
+
+from ..bolid.schemas import BolidSchema
+from ..enums import PinType
 
 
 class BolidPinSchema(BaseModel):
@@ -20,3 +26,86 @@ class BolidPinCreateRangeSchema(BaseModel):
     number_from: int
     number_to: int
     bolid_name: str
+
+#########################
+# --- Queue Request --- #
+#########################
+
+
+class PinStateChange(BaseModel):
+    pin_id: str
+    status: bool = Field(description="True turns output on")
+
+
+class PinSetRequest(BaseModel):
+    changes: List[PinStateChange] = Field(min_length=1)
+
+
+class DevicePinSetRequest(BaseModel):
+    hostnames: List[str] = Field(min_length=1)
+    pin_type: PinType
+    status: bool = Field(description="True turns output on")
+
+
+class BolidPinStates(BaseModel):
+    """Changes of one bolid, written in one frame by worker"""
+    bolid: BolidSchema
+    pin_states: Dict[int, bool] = Field(description="State by pin number")
+
+##########################
+# --- Queue Response --- #
+##########################
+
+
+class PinControlQueuedResponse(BaseModel):
+    id: str
+    location: Union[Path, str]
+
+#########################
+# --- Worker Result --- #
+#########################
+
+
+class BolidPinResult(BaseModel):
+    bolid_name: str
+    pins: int
+    coalesced_requests: int = Field(
+        description="Requests written to bolid in the same frame")
+
+
+class PinControlResult(BaseModel):
+    bolids: List[BolidPinResult]
+    execution_time_s: Optional[float]
+
+
+##########################
+# --- State Response --- #
+##########################
+
+
+class PinStateResponse(BaseModel):
+    pin_id: str
+    bolid_name: str
+    number: int
+    status: Optional[bool] = Field(
+        description="Last known state of output, None if bolid was never read")
+    updated_at: Optional[datetime] = Field(
+        description="When state was written to or read from bolid")
+    age_s: Optional[float]
+
+
+class DevicePinStateResponse(BaseModel):
+    hostname: str
+    power: PinStateResponse
+    boot: PinStateResponse
+
+###############################
+# --- Task State Response --- #
+###############################
+
+
+class PinControlTaskResponse(BaseModel):
+    id: str
+    status: str
+    meta: Optional[dict]
+    result: Optional[PinControlResult]
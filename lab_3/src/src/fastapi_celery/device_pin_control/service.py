@@ -1,13 +1,21 @@
+import time
 import uuid
-from typing import List
+from datetime import datetime
+from typing import Dict, List
 
 from sqlalchemy.orm import Session
 
 from ..bolid.model import Bolid
+from ..bolid.schemas import BolidSchema
 from ..bolid.service import get_bolid_by_name
-from ..exceptions import BolidPinNotFoundError, BolidPinLimitExceededError, BolidNotFoundError
+from ..device_data.model import Device
+from ..enums import PinType
+from ..exceptions import (BolidPinNotFoundError, BolidPinLimitExceededError, BolidNotFoundError,
+                          DeviceNotFoundError)
+from .coil_shadow import get_coil_states
 from .model import BolidPin
-from .schemas import BolidPinCreateSchema, BolidPinSchema, BolidPinCreateRangeSchema
+from .schemas import (BolidPinCreateSchema, BolidPinSchema, BolidPinCreateRangeSchema, BolidPinStates,
+                      PinStateResponse)
 
 
 def get_bolid_pins(db: Session) -> List[BolidPinSchema]:
@@ -121,3 +129,63 @@ def delete_bolid_pin(db: Session, bolid_pin_id: str) -> BolidPinSchema:
 def clear_bolid_pin_table(db: Session):
     db.query(BolidPin).delete()
     db.commit()
+
+
+def group_pin_states_by_bolid(db: Session, pin_states: Dict[str, bool]) -> List[BolidPinStates]:
+    """Groups requested states of pins by bolid, states of one bolid are written in one frame."""
+    bolid_pins: List[BolidPin] = db.query(BolidPin).filter(
+        BolidPin.id.in_(pin_states)).all()
+
+    missing_pin_ids = set(pin_states) - {bolid_pin.id for bolid_pin in bolid_pins}
+    if missing_pin_ids:
+        raise BolidPinNotFoundError(
+            f"Bolid pins with IDs {sorted(missing_pin_ids)} not found")
+
+    states_by_bolid: Dict[str, BolidPinStates] = {}
+    for bolid_pin in bolid_pins:
+        bolid_states = states_by_bolid.get(bolid_pin.bolid_name)
+        if bolid_states is None:
+            bolid_states = BolidPinStates(
+                bolid=BolidSchema.model_validate(bolid_pin.bolid), pin_states={})
+            states_by_bolid[bolid_pin.bolid_name] = bolid_states
+
+        bolid_states.pin_states[bolid_pin.number] = pin_states[bolid_pin.id]
+
+    return list(states_by_bolid.values())
+
+
+def get_devices_pin_ids(db: Session, hostnames: List[str], pin_type: PinType) -> List[str]:
+    devices: List[Device] = db.query(Device).filter(
+        Device.hostname.in_(hostnames)).all()
+
+    missing_hostnames = set(hostnames) - {device.hostname for device in devices}
+    if missing_hostnames:
+        raise DeviceNotFoundError(
+            f"Devices with hostnames {sorted(missing_hostnames)} not found")
+
+    if pin_type == PinType.POWER:
+        return [device.output_power_id for device in devices]
+
+    return [device.output_boot_id for device in devices]
+
+
+def get_pin_states(bolid_pins: List[BolidPinSchema]) -> List[PinStateResponse]:
+    """States of pins from shadow of bolids kept by install worker, bus is not used."""
+    coil_states = get_coil_states({bolid_pin.bolid_name for bolid_pin in bolid_pins})
+    now = time.time()
+
+    pin_states = []
+    for bolid_pin in bolid_pins:
+        coil_state = coil_states[bolid_pin.bolid_name].get(bolid_pin.number)
+        status, updated_at = coil_state if coil_state is not None else (None, None)
+
+        pin_states.append(PinStateResponse(
+            pin_id=bolid_pin.id,
+            bolid_name=bolid_pin.bolid_name,
+            number=bolid_pin.number,
+            status=status,
+            updated_at=datetime.fromtimestamp(updated_at) if updated_at is not None else None,
+            age_s=now - updated_at if updated_at is not None else None
+        ))
+
+    return pin_states
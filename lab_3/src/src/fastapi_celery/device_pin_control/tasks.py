@@ -0,0 +1,66 @@
+import datetime
+from typing import List
+
+from celery import states
+from celery.signals import worker_ready, worker_shutdown
+from celery.utils.log import get_task_logger
+from pydantic import TypeAdapter
+from serial import SerialException
+
+from ..bolid.schemas import BolidSchema
+from ..config import server_settings
+from ..device_install.worker import install_worker
+from ..exceptions import BolidModbusError
+from .bolid_driver import bolid_driver
+from .schemas import BolidPinResult, BolidPinStates, PinControlResult
+
+logger = get_task_logger("PinControlTask")
+
+
+@worker_ready.connect
+def start_bolid_sessions(**kwargs):
+    # Shadows of bolids are reconciled with the bus from the worker start
+    bolid_driver.start(
+        (BolidSchema(**bolid.model_dump()) for bolid in server_settings.BOLIDS),
+        server_settings.BOLID_SETTINGS.POLL_INTERVAL_S)
+
+
+@worker_shutdown.connect
+def close_bolid_sessions(**kwargs):
+    bolid_driver.close_all()
+
+
+@install_worker.task(name="pin_control_set", bind=True, max_retries=2, default_retry_delay=1, queue='install_queue')
+def pin_control_set_task(
+    self,
+    bolid_pin_states: List[dict]
+) -> PinControlResult:
+    """Sets outputs of bolids, changes of one bolid are written in one frame."""
+    self.update_state(state=states.STARTED,
+                      meta={})
+
+    try:
+        start_time = datetime.datetime.now()
+
+        bolid_results = []
+        for bolid_states in TypeAdapter(List[BolidPinStates]).validate_python(bolid_pin_states):
+            coalesced_requests = bolid_driver.set_pins(
+                bolid_states.bolid, bolid_states.pin_states)
+
+            bolid_results.append(BolidPinResult(
+                bolid_name=bolid_states.bolid.name,
+                pins=len(bolid_states.pin_states),
+                coalesced_requests=coalesced_requests
+            ))
+
+        end_time = datetime.datetime.now()
+        execution_time = (end_time - start_time).total_seconds()
+
+        response = PinControlResult(
+            bolids=bolid_results, execution_time_s=execution_time)
+
+        return response.model_dump()
+    except (BolidModbusError, SerialException) as e:
+        # Writes are idempotent, bolids already set are written again with the same states
+        raise self.retry(exc=e)
+
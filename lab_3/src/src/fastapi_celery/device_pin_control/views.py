@@ -1,12 +1,23 @@
-from typing import List
+from typing import Iterable, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from celery import states
+from celery.result import AsyncResult
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
+from ..bolid.service import get_bolid_by_name
+from ..config import server_settings
 from ..database import get_db
-from ..exceptions import BolidNotFoundError
+from ..device_data.schemas import DeviceSchema
+from ..device_data.service import get_device
+from ..exceptions import BolidNotFoundError, BolidPinNotFoundError, DeviceNotFoundError
+from ..task_status import MAX_WAIT_S, get_task_meta, wait_for_task_update
 from . import service as bolid_pin_service
-from .schemas import BolidPinSchema
+from .schemas import (BolidPinSchema, DevicePinSetRequest, DevicePinStateResponse,
+                      PinControlQueuedResponse, PinControlResult, PinControlTaskResponse,
+                      PinSetRequest, PinStateResponse)
+from .coil_shadow import refresh_coil_states
+from .tasks import install_worker, pin_control_set_task
 
 router = APIRouter(prefix="/pin_control", tags=["Device Pin Control"])
 
@@ -34,3 +45,131 @@ async def get_pin_by_id(
         return bolid_pin
     except BolidNotFoundError as exc:
         raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+
+async def refresh_bolids(db: Session, bolid_names: Iterable[str]) -> None:
+    """Reads coils of bolids on the bus, shadows are updated by install worker."""
+    bolids = [get_bolid_by_name(db, bolid_name) for bolid_name in sorted(set(bolid_names))]
+
+    errors = await refresh_coil_states(
+        [bolid.model_dump() for bolid in bolids], server_settings.BOLID_SETTINGS.FRESH_READ_TIMEOUT_S)
+
+    not_read = [bolid.name for bolid in bolids if bolid.name not in errors]
+    if not_read:
+        raise HTTPException(
+            status_code=504, detail=f"Bolids were not read in time: {', '.join(not_read)}")
+
+    failed = [error for error in errors.values() if error is not None]
+    if failed:
+        raise HTTPException(
+            status_code=502, detail=f"Failed to read bolids: {'; '.join(failed)}")
+
+
+@router.get('/state', response_model=List[PinStateResponse])
+async def get_pins_state(
+    bolid_name: Optional[str] = None,
+    fresh: bool = Query(
+        False, description="Read states on the bus instead of the shadow"),
+    db: Session = Depends(get_db)
+) -> List[PinStateResponse]:
+    """States of outputs with time when they were known."""
+    bolid_pins = [bolid_pin for bolid_pin in bolid_pin_service.get_bolid_pins(db)
+                  if bolid_name is None or bolid_pin.bolid_name == bolid_name]
+
+    try:
+        if fresh and bolid_pins:
+            await refresh_bolids(db, (bolid_pin.bolid_name for bolid_pin in bolid_pins))
+    except BolidNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    return bolid_pin_service.get_pin_states(bolid_pins)
+
+
+@router.get('/devices/{hostname}/state', response_model=DevicePinStateResponse)
+async def get_device_pins_state(
+    hostname: str,
+    fresh: bool = Query(
+        False, description="Read states on the bus instead of the shadow"),
+    db: Session = Depends(get_db)
+) -> DevicePinStateResponse:
+    """States of power and boot outputs of device."""
+    try:
+        device: DeviceSchema = get_device(db=db, hostname=hostname)
+
+        power_pin = bolid_pin_service.get_bolid_pin_by_id(db, device.output_power_id)
+        boot_pin = bolid_pin_service.get_bolid_pin_by_id(db, device.output_boot_id)
+
+        if fresh:
+            await refresh_bolids(db, (power_pin.bolid_name, boot_pin.bolid_name))
+    except (DeviceNotFoundError, BolidPinNotFoundError, BolidNotFoundError) as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    power_state, boot_state = bolid_pin_service.get_pin_states([power_pin, boot_pin])
+
+    return DevicePinStateResponse(hostname=hostname, power=power_state, boot=boot_state)
+
+
+@router.post('/set', status_code=202, response_model=PinControlQueuedResponse)
+def set_pins(request: PinSetRequest, db: Session = Depends(get_db)) -> PinControlQueuedResponse:
+    """Sets outputs by pin ID, pins of one bolid are written in one frame."""
+    try:
+        bolid_pin_states = bolid_pin_service.group_pin_states_by_bolid(
+            db, {change.pin_id: change.status for change in request.changes})
+    except BolidPinNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    task = pin_control_set_task.delay(
+        bolid_pin_states=[bolid_states.model_dump() for bolid_states in bolid_pin_states])
+
+    response = PinControlQueuedResponse(id=task.id, location=f"/queue/{task.id}")
+    return response
+
+
+@router.post('/devices', status_code=202, response_model=PinControlQueuedResponse)
+def set_devices_pins(request: DevicePinSetRequest, db: Session = Depends(get_db)) -> PinControlQueuedResponse:
+    """Sets power or boot output of devices, e.g. powers all devices with one frame per bolid."""
+    try:
+        pin_ids = bolid_pin_service.get_devices_pin_ids(
+            db, request.hostnames, request.pin_type)
+        bolid_pin_states = bolid_pin_service.group_pin_states_by_bolid(
+            db, {pin_id: request.status for pin_id in pin_ids})
+    except (DeviceNotFoundError, BolidPinNotFoundError) as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    task = pin_control_set_task.delay(
+        bolid_pin_states=[bolid_states.model_dump() for bolid_states in bolid_pin_states])
+
+    response = PinControlQueuedResponse(id=task.id, location=f"/queue/{task.id}")
+    return response
+
+
+def build_task_response(task_id: str) -> PinControlTaskResponse:
+    pin_control_task = AsyncResult(task_id, app=install_worker)
+
+    pin_control_task_response = PinControlTaskResponse(
+        id=task_id,
+        status=pin_control_task.state,
+        meta=get_task_meta(pin_control_task),
+        result=None
+    )
+
+    if pin_control_task.state == states.SUCCESS and pin_control_task.result is not None:
+        pin_control_task_response.result = PinControlResult(
+            **pin_control_task.result)
+
+    return pin_control_task_response
+
+
+@router.get('/queue/{task_id}', response_model=PinControlTaskResponse)
+async def get_status(
+    task_id: str,
+    wait: Optional[int] = Query(
+        None, ge=0, le=MAX_WAIT_S, description="Long-poll: wait up to `wait` s for update of task"),
+    since: Optional[str] = Query(
+        None, description="Status known by client, long-poll returns once status differs")
+) -> PinControlTaskResponse:
+    """URL used to receive updates on Celery tasks."""
+    if wait:
+        await wait_for_task_update(install_worker, task_id, wait, since)
+
+    return build_task_response(task_id)
@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 
 from ..device_data import service as device_data_service
 from ..device_data.model import Device
+from ..device_data.schemas import DeviceSchema
 from ..enums import DeviceReservationStatus, DeviceType
 from ..exceptions import (DeviceNotFoundError, NotEnoughDevicesError,
                           ReservationNotFoundError)
@@ -37,6 +38,20 @@ def get_reservation_by_id(db: Session, reservation_id: str) -> ReservationSchema
     return reservation_schema
 
 
+def get_reservation_devices(db: Session, reservation_id: str) -> List[DeviceSchema]:
+    reservation_db: Reservation = db.query(Reservation).filter(
+        Reservation.id == reservation_id).first()
+
+    if reservation_db is None:
+        raise ReservationNotFoundError(
+            f"Reservation with ID {reservation_id} not found")
+
+    devices_schemas: List[DeviceSchema] = [
+        DeviceSchema.model_validate(device_db) for device_db in reservation_db.devices]
+
+    return devices_schemas
+
+
 def get_reservation_by_device(db: Session, hostname: str) -> ReservationSchema:
     try:
         reservation_db: Reservation = db.query(Reservation).join(Device, Device.reservation_id == Reservation.id).filter(
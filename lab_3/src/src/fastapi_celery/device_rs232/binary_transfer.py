@@ -0,0 +1,299 @@
+import binascii
+import logging
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+
+from ..config import server_settings
+from ..enums import Rs232TransferProtocol
+from ..exceptions import Rs232TransferError
+from .console_manager import ConsoleCursor, SerialConsole
+from .schemas import Rs232TransferResult
+
+logger = logging.getLogger("Rs232BinaryTransfer")
+
+SOH = 0x01
+STX = 0x02
+EOT = 0x04
+ACK = 0x06
+NAK = 0x15
+CAN = 0x18
+CRC_REQUEST = ord("C")
+# Padding of the last block
+CPMEOF = 0x1A
+
+SMALL_BLOCK_SIZE: int = 128
+LARGE_BLOCK_SIZE: int = 1024
+# Errors in a row after which 1K blocks are replaced by 128 byte blocks
+DOWNGRADE_AFTER_ERRORS: int = 2
+# Clean blocks in a row after which 1K blocks are tried again
+UPGRADE_AFTER_BLOCKS: int = 32
+RAW_CHUNK_SIZE: int = 65536
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def get_transfer_file(file_name: str) -> Path:
+    """File in TRANSFER_FOLDER_PATH, paths outside of folder are rejected."""
+    folder = Path(server_settings.RS232_SETTINGS.TRANSFER_FOLDER_PATH).resolve()
+    path = (folder / file_name).resolve()
+
+    if not path.is_relative_to(folder) or not path.is_file():
+        raise Rs232TransferError(
+            f"File {file_name} is not found in {folder}")
+
+    return path
+
+
+def crc16(data) -> int:
+    """CRC-16/XMODEM, polynomial 0x1021 with zero initial value."""
+    return binascii.crc_hqx(data, 0)
+
+
+class ModemSender:
+    """
+    Sender of XMODEM-CRC/YMODEM blocks to console.
+
+    Every block is read from file directly into preallocated packet
+    and retransmitted from it on NAK or timeout. Block size is reduced
+    to 128 bytes after errors in a row and restored after a run of
+    acknowledged blocks.
+    """
+
+    def __init__(
+        self,
+        console: SerialConsole,
+        cursor: ConsoleCursor,
+        block_size: int,
+        ack_timeout: float,
+        max_retries: int
+    ):
+        self.console = console
+        self.cursor = cursor
+        self.max_block_size = block_size
+        self.block_size = block_size
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+
+        self.blocks = 0
+        self.retransmits = 0
+        self._errors_in_row = 0
+        self._clean_in_row = 0
+        # Header, block number, its complement, data and CRC
+        self._packets = {size: bytearray(3 + size + 2)
+                         for size in (SMALL_BLOCK_SIZE, LARGE_BLOCK_SIZE)}
+
+    def wait_for_receiver(self, timeout: float) -> None:
+        """Waits for 'C' of receiver, which requests CRC mode."""
+        deadline = time.monotonic() + timeout
+        previous = b"\n"
+
+        while (remaining := deadline - time.monotonic()) > 0:
+            self.cursor.timeout = remaining
+            byte = self.cursor.read(1)
+
+            # 'C' inside of text printed by receiver is not a request
+            if byte == bytes([CRC_REQUEST]) and not previous.isalnum():
+                return
+            if byte == bytes([CAN]):
+                raise Rs232TransferError("Transfer is cancelled by receiver")
+            if byte:
+                previous = byte
+
+        raise Rs232TransferError(
+            f"Receiver on {self.console.port} did not start in {timeout} s")
+
+    def send_header(self, file_name: str, size: int) -> None:
+        """YMODEM block 0 with name and size of file, empty name ends the batch."""
+        packet = self._packets[SMALL_BLOCK_SIZE]
+        header = f"{file_name}\0{size}".encode() if file_name else b""
+
+        packet[3:3 + SMALL_BLOCK_SIZE] = header.ljust(SMALL_BLOCK_SIZE, b"\0")
+        self._send_packet(packet, SOH, 0, SMALL_BLOCK_SIZE)
+
+    def send_file(self, file: BinaryIO, size: int, on_progress: Optional[ProgressCallback] = None) -> int:
+        """Sends file as blocks numbered from 1, returns amount of sent bytes."""
+        position = 0
+        block_number = 1
+
+        while position < size:
+            block_size = self.block_size
+            packet = self._packets[block_size]
+            view = memoryview(packet)[3:3 + block_size]
+
+            file.seek(position)
+            read = file.readinto(view)
+            if read < block_size:
+                view[read:] = bytes([CPMEOF]) * (block_size - read)
+
+            if self._send_packet(packet, STX if block_size == LARGE_BLOCK_SIZE else SOH,
+                                 block_number, block_size):
+                position += read
+                block_number += 1
+                self.blocks += 1
+
+                if on_progress is not None:
+                    on_progress(position, size)
+
+        return position
+
+    def send_eot(self) -> None:
+        for _ in range(self.max_retries):
+            self.console.write(bytes([EOT]))
+
+            # Receivers answer NAK to the first EOT to be sure it is not noise
+            if self._wait_for_response() == ACK:
+                return
+
+        raise Rs232TransferError("End of transfer was not acknowledged")
+
+    def _send_packet(self, packet: bytearray, header: int, block_number: int, block_size: int) -> bool:
+        """
+        Sends packet until it is acknowledged.
+
+        Returns False if block size was reduced, then block is read again.
+        """
+        packet[0] = header
+        packet[1] = block_number & 0xFF
+        packet[2] = 0xFF - packet[1]
+
+        crc = crc16(memoryview(packet)[3:3 + block_size])
+        packet[3 + block_size] = crc >> 8
+        packet[4 + block_size] = crc & 0xFF
+
+        view = memoryview(packet)[:5 + block_size]
+
+        for _ in range(self.max_retries):
+            self.console.write(view)
+
+            if self._wait_for_response() == ACK:
+                self._errors_in_row = 0
+                self._clean_in_row += 1
+
+                if self._clean_in_row >= UPGRADE_AFTER_BLOCKS and self.block_size < self.max_block_size:
+                    self.block_size = self.max_block_size
+                    self._clean_in_row = 0
+                return True
+
+            # Block is sent again, either as is or with smaller size
+            self.retransmits += 1
+            self._errors_in_row += 1
+            self._clean_in_row = 0
+
+            if header == STX and self._errors_in_row >= DOWNGRADE_AFTER_ERRORS:
+                logger.info(
+                    f"Serial: {self.console.port}. Block {block_number} failed {self._errors_in_row} times, "
+                    f"block size is reduced to {SMALL_BLOCK_SIZE}")
+                self.block_size = SMALL_BLOCK_SIZE
+                self._errors_in_row = 0
+                return False
+
+        raise Rs232TransferError(
+            f"Block {block_number} was not acknowledged after {self.max_retries} attempts")
+
+    def _wait_for_response(self) -> Optional[int]:
+        """Returns ACK, NAK or None on timeout, raises if receiver cancelled transfer."""
+        deadline = time.monotonic() + self.ack_timeout
+
+        while (remaining := deadline - time.monotonic()) > 0:
+            self.cursor.timeout = remaining
+            byte = self.cursor.read(1)
+
+            if not byte:
+                continue
+            if byte[0] in (ACK, NAK):
+                return byte[0]
+            if byte[0] == CAN:
+                # Cancellation is sent twice, single CAN could be noise
+                self.cursor.timeout = 1
+                if self.cursor.read(1) == bytes([CAN]):
+                    raise Rs232TransferError("Transfer is cancelled by receiver")
+
+        return None
+
+
+def send_raw(console: SerialConsole, file: BinaryIO, size: int, on_progress: Optional[ProgressCallback] = None) -> int:
+    """Writes file to port as is, e.g. for receivers without protocol."""
+    buffer = bytearray(RAW_CHUNK_SIZE)
+    view = memoryview(buffer)
+    sent = 0
+
+    while read := file.readinto(view):
+        console.write(view[:read])
+        sent += read
+
+        if on_progress is not None:
+            on_progress(sent, size)
+
+    return sent
+
+
+def transfer_file(
+    console: SerialConsole,
+    file_name: str,
+    protocol: Rs232TransferProtocol,
+    start_command: Optional[str] = None,
+    block_size: Optional[int] = None,
+    handshake_timeout: float = 60,
+    on_progress: Optional[ProgressCallback] = None
+) -> Rs232TransferResult:
+    """
+    Sends file from TRANSFER_FOLDER_PATH to receiver on device.
+
+    `start_command` (e.g. 'loady 0x40480000') is written first, then the sender
+    waits for receiver. Output of device after the transfer can be read from
+    returned offset.
+    """
+    start = time.monotonic()
+    path = get_transfer_file(file_name)
+    size = path.stat().st_size
+
+    # Receiver is waited for since the start command
+    cursor = ConsoleCursor(console)
+    if start_command:
+        console.write(start_command.encode())
+
+    if block_size is None:
+        block_size = LARGE_BLOCK_SIZE if protocol == Rs232TransferProtocol.YMODEM else SMALL_BLOCK_SIZE
+
+    sender = ModemSender(
+        console, cursor, block_size,
+        ack_timeout=server_settings.RS232_SETTINGS.TRANSFER_ACK_TIMEOUT_S,
+        max_retries=server_settings.RS232_SETTINGS.TRANSFER_MAX_RETRIES
+    )
+
+    with open(path, "rb", buffering=0) as file:
+        if protocol == Rs232TransferProtocol.RAW:
+            transferred = send_raw(console, file, size, on_progress)
+
+        else:
+            sender.wait_for_receiver(handshake_timeout)
+
+            if protocol == Rs232TransferProtocol.YMODEM:
+                sender.send_header(path.name, size)
+                # Receiver requests data blocks again
+                sender.wait_for_receiver(sender.ack_timeout)
+
+            transferred = sender.send_file(file, size, on_progress)
+            sender.send_eot()
+
+            if protocol == Rs232TransferProtocol.YMODEM:
+                sender.wait_for_receiver(sender.ack_timeout)
+                sender.send_header("", 0)
+
+    execution_time = time.monotonic() - start
+    logger.info(
+        f"Serial: {console.port}. Sent {path.name} ({transferred} bytes) via {protocol} "
+        f"in {execution_time:.1f} s, {sender.retransmits} retransmits")
+
+    return Rs232TransferResult(
+        protocol=protocol,
+        size_bytes=size,
+        transferred_bytes=transferred,
+        blocks=sender.blocks,
+        retransmits=sender.retransmits,
+        block_size=None if protocol == Rs232TransferProtocol.RAW else sender.block_size,
+        throughput_bps=transferred / execution_time if execution_time else 0,
+        offset=cursor.offset,
+        execution_time_s=execution_time
+    )
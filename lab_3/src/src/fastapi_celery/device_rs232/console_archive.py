@@ -0,0 +1,276 @@
+import logging
+import re
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import IO, Iterator, List, Optional, Tuple
+
+from ..config import server_settings
+from ..exceptions import Rs232ConsoleArchiveNotFoundError
+
+logger = logging.getLogger("SerialConsoleArchive")
+
+SEGMENT_SUFFIX = ".seg.gz"
+INDEX_SUFFIX = ".idx"
+# gzip container, so every segment can be read by zcat
+GZIP_WBITS: int = 31
+COMPRESS_LEVEL: int = 6
+READ_CHUNK_SIZE: int = 65536
+# Retention is also checked by time, silent console never rolls over
+RETENTION_CHECK_INTERVAL_S: float = 60
+
+# (timestamp ms, position in segment file, console offset)
+IndexEntry = Tuple[int, int, int]
+
+
+def get_archive_folder(port: str) -> Path:
+    port_slug = re.sub(r"[^A-Za-z0-9_.-]", "_", port.strip("/"))
+
+    return Path(server_settings.RS232_SETTINGS.ARCHIVE_FOLDER_PATH) / port_slug
+
+
+class ConsoleArchive:
+    """
+    Append-only archive of console output of one port.
+
+    Output is split into segments, each segment is a file of
+    concatenated gzip members. A member is started every
+    `index_interval_s` and its start time, position in file and
+    console offset are appended to the index of segment, so a time
+    range is read by seeking to a member instead of scanning.
+    Oldest segments are removed by size and age of the archive on
+    rollover and every RETENTION_CHECK_INTERVAL_S.
+    """
+
+    def __init__(
+        self,
+        port: str,
+        segment_bytes: int,
+        index_interval_s: float,
+        retention_bytes: int,
+        retention_s: float
+    ):
+        self.port = port
+        self.folder = get_archive_folder(port)
+        self.segment_bytes = segment_bytes
+        self.index_interval_s = index_interval_s
+        self.retention_bytes = retention_bytes
+        self.retention_s = retention_s
+
+        self._segment: Optional[IO[bytes]] = None
+        self._index: Optional[IO[str]] = None
+        self._segment_size = 0
+        self._member = None
+        self._member_started = 0.0
+        self._retention_checked = 0.0
+        self._lock = threading.Lock()
+
+    def append(self, data: bytes, offset: int) -> None:
+        """Archives data received at console offset."""
+        now = time.time()
+
+        with self._lock:
+            if self._segment is None or self._segment_size >= self.segment_bytes:
+                self._rollover_locked(now)
+
+            if self._member is None or now - self._member_started >= self.index_interval_s:
+                self._finish_member_locked()
+                self._start_member_locked(now, offset)
+
+            self._segment.write(self._member.compress(data))
+            self._segment_size += len(data)
+
+            if now - self._retention_checked >= RETENTION_CHECK_INTERVAL_S:
+                self._apply_retention()
+
+    def flush_expired(self) -> None:
+        """
+        Makes output of silent console readable once index interval expired.
+
+        Should be called periodically, it also removes expired segments.
+        """
+        now = time.time()
+
+        with self._lock:
+            if self._member is not None and now - self._member_started >= self.index_interval_s:
+                self._finish_member_locked()
+
+            if now - self._retention_checked >= RETENTION_CHECK_INTERVAL_S:
+                self._apply_retention()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment_locked()
+
+    def _rollover_locked(self, now: float) -> None:
+        self._close_segment_locked()
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+        name = f"{int(now * 1000):013d}"
+
+        self._segment = open(self.folder / f"{name}{SEGMENT_SUFFIX}", "ab")
+        self._index = open(self.folder / f"{name}{INDEX_SUFFIX}", "a")
+        self._segment_size = 0
+
+        self._apply_retention()
+
+    def _start_member_locked(self, now: float, offset: int) -> None:
+        self._member = zlib.compressobj(
+            COMPRESS_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+        self._member_started = now
+
+        self._index.write(
+            f"{int(now * 1000)} {self._segment.tell()} {offset}\n")
+        self._index.flush()
+
+    def _finish_member_locked(self) -> None:
+        if self._member is None:
+            return
+
+        self._segment.write(self._member.flush())
+        self._segment.flush()
+        self._member = None
+
+    def _close_segment_locked(self) -> None:
+        if self._segment is None:
+            return
+
+        self._finish_member_locked()
+        self._segment.close()
+        self._index.close()
+        self._segment = None
+        self._index = None
+
+    def _apply_retention(self) -> None:
+        self._retention_checked = time.time()
+        segments = list_segments(self.folder)
+        # Current segment is never removed
+        removable = segments[:-1]
+
+        total_size = sum(path.stat().st_size for _, path in segments)
+        expire_before = (time.time() - self.retention_s) * 1000
+
+        for number, (start_ms, path) in enumerate(removable):
+            end_ms = segments[number + 1][0]
+            if total_size <= self.retention_bytes and end_ms >= expire_before:
+                break
+
+            total_size -= path.stat().st_size
+            path.unlink(missing_ok=True)
+            path.with_name(path.name.replace(
+                SEGMENT_SUFFIX, INDEX_SUFFIX)).unlink(missing_ok=True)
+
+            logger.info(f"Removed console archive segment {path}")
+
+
+def list_segments(folder: Path) -> List[Tuple[int, Path]]:
+    """Segments of archive sorted by start time (ms)."""
+    segments = []
+
+    for path in folder.glob(f"*{SEGMENT_SUFFIX}"):
+        try:
+            segments.append((int(path.name[:-len(SEGMENT_SUFFIX)]), path))
+        except ValueError:
+            continue
+
+    return sorted(segments)
+
+
+def read_index(segment_path: Path) -> List[IndexEntry]:
+    index_path = segment_path.with_name(
+        segment_path.name.replace(SEGMENT_SUFFIX, INDEX_SUFFIX))
+
+    entries = []
+    with open(index_path) as index_file:
+        for line in index_file:
+            fields = line.split()
+            # Last line could be written partially
+            if len(fields) == 3:
+                entries.append(tuple(int(field) for field in fields))
+
+    return entries
+
+
+def iter_segment_range(segment_path: Path, start_ms: int, end_ms: int, segment_end_ms: float) -> Iterator[bytes]:
+    """Yields raw gzip members of segment which overlap time range."""
+    entries = read_index(segment_path)
+
+    first_position = None
+    last_position = None
+
+    for number, (member_start_ms, position, _) in enumerate(entries):
+        member_end_ms = entries[number + 1][0] if number + 1 < len(entries) else segment_end_ms
+
+        if member_end_ms <= start_ms:
+            continue
+        if member_start_ms > end_ms:
+            last_position = position
+            break
+        if first_position is None:
+            first_position = position
+
+    if first_position is None:
+        return
+
+    with open(segment_path, "rb") as segment_file:
+        segment_file.seek(first_position)
+
+        remaining = None if last_position is None else last_position - first_position
+        while remaining is None or remaining > 0:
+            chunk = segment_file.read(
+                READ_CHUNK_SIZE if remaining is None else min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def decompress_members(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+
+            if decompressor.eof:
+                # Next member of the stream
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+            else:
+                chunk = b""
+
+
+def iter_archive_range(port: str, start: float, end: float, compressed: bool = False) -> Iterator[bytes]:
+    """
+    Yields console output of port between timestamps.
+
+    Range is resolved with precision of index interval.
+    With `compressed` raw gzip members are yielded, they form a valid gzip stream.
+    """
+    folder = get_archive_folder(port)
+    segments = list_segments(folder)
+
+    if not segments:
+        raise Rs232ConsoleArchiveNotFoundError(
+            f"Console archive of port {port} is empty")
+
+    start_ms, end_ms = int(start * 1000), int(end * 1000)
+
+    def iter_raw() -> Iterator[bytes]:
+        for number, (segment_start_ms, path) in enumerate(segments):
+            segment_end_ms = segments[number + 1][0] if number + 1 < len(segments) else float("inf")
+
+            if segment_end_ms <= start_ms or segment_start_ms > end_ms:
+                continue
+
+            try:
+                yield from iter_segment_range(path, start_ms, end_ms, segment_end_ms)
+            except FileNotFoundError:
+                # Segment was removed by retention while reading
+                continue
+
+    return iter_raw() if compressed else decompress_members(iter_raw())
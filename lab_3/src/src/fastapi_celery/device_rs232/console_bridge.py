@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+from redis.exceptions import RedisError
+from serial import SerialException
+
+from ..redis_client import async_redis_client, redis_client
+from .port_scheduler import port_scheduler
+
+if TYPE_CHECKING:
+    from .console_manager import SerialConsole
+
+logger = logging.getLogger("SerialConsoleBridge")
+
+# Console output published by rs232 worker, read by every viewer
+OUTPUT_STREAM_KEY = "rs232_console:output:{port}"
+# Keystrokes of viewers, consumed by rs232 worker
+INPUT_STREAM_KEY = "rs232_console:input:{port}"
+# Notices of rs232 worker to viewers, e.g. about rejected keystrokes
+NOTICE_STREAM_KEY = "rs232_console:notice:{port}"
+OUTPUT_STREAM_MAXLEN: int = 10000
+INPUT_STREAM_MAXLEN: int = 1000
+NOTICE_STREAM_MAXLEN: int = 100
+OUTPUT_CHUNK_BYTES: int = 4096
+# Bounds reaction to stop of bridge and to disconnect of viewer
+BLOCK_TIMEOUT_S: float = 1
+REDIS_RETRY_DELAY_S: float = 1
+
+
+class ConsoleBridge:
+    """
+    Bridge of console owned by rs232 worker to Redis streams.
+
+    Output is published to the output stream as soon as it is captured,
+    keystrokes from the input stream are written to port. Port stays
+    owned by the console, so viewers never open it themselves.
+
+    Keystrokes are written only while port is not held by a task,
+    otherwise they would get into a running transfer or dialog.
+    Such keystrokes are dropped and viewers are notified.
+    """
+
+    def __init__(self, console: "SerialConsole"):
+        self.console = console
+        self.output_key = OUTPUT_STREAM_KEY.format(port=console.port)
+        self.input_key = INPUT_STREAM_KEY.format(port=console.port)
+        self.notice_key = NOTICE_STREAM_KEY.format(port=console.port)
+
+        self._stopped = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._publish_output, name=f"bridge-out-{console.port}",
+                             daemon=True),
+            threading.Thread(target=self._consume_input, name=f"bridge-in-{console.port}",
+                             daemon=True)
+        ]
+
+    def start(self) -> None:
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _publish_output(self) -> None:
+        offset = self.console.end_offset
+
+        while not self._stopped.is_set():
+            if not self.console.wait_for_data(offset, BLOCK_TIMEOUT_S):
+                continue
+
+            data, next_offset, dropped = self.console.read_since(
+                offset, OUTPUT_CHUNK_BYTES)
+
+            try:
+                redis_client.xadd(
+                    self.output_key,
+                    {"data": data, "offset": next_offset - len(data), "dropped": dropped},
+                    maxlen=OUTPUT_STREAM_MAXLEN,
+                    approximate=True
+                )
+            except RedisError as exc:
+                logger.warning(
+                    f"Failed to publish console {self.console.port}: {exc}")
+                self._stopped.wait(REDIS_RETRY_DELAY_S)
+
+            # Output captured while redis was not available is skipped
+            offset = next_offset
+
+    def _consume_input(self) -> None:
+        last_id = None
+
+        while not self._stopped.is_set():
+            try:
+                if last_id is None:
+                    last_id = get_last_id(self.input_key)
+
+                entries = redis_client.xread(
+                    {self.input_key: last_id}, block=int(BLOCK_TIMEOUT_S * 1000))
+            except RedisError as exc:
+                logger.warning(
+                    f"Failed to read input of console {self.console.port}: {exc}")
+                self._stopped.wait(REDIS_RETRY_DELAY_S)
+                continue
+
+            for _, messages in entries:
+                last_id = messages[-1][0]
+                self._write_input(b"".join(fields[b"data"] for _, fields in messages))
+
+    def _write_input(self, data: bytes) -> None:
+        with port_scheduler.try_acquire(self.console.port) as acquired:
+            if not acquired:
+                self._notify(
+                    f"Input of {len(data)} bytes is rejected: port {self.console.port} is busy with a task")
+                return
+
+            try:
+                self.console.write(data)
+            except SerialException as exc:
+                logger.warning(
+                    f"Keystrokes to console {self.console.port} are lost: {exc}")
+
+    def _notify(self, text: str) -> None:
+        try:
+            redis_client.xadd(self.notice_key, {"data": text},
+                              maxlen=NOTICE_STREAM_MAXLEN, approximate=True)
+        except RedisError as exc:
+            logger.warning(
+                f"Failed to notify viewers of console {self.console.port}: {exc}")
+
+
+def get_last_id(key: str) -> bytes:
+    """Id of the last entry of stream, entries after it are new."""
+    entries = redis_client.xrevrange(key, count=1)
+
+    return entries[0][0] if entries else b"0-0"
+
+
+async def attach_websocket(websocket: WebSocket, port: str, history: int = 0) -> None:
+    """
+    Streams console output of port to websocket and sends received frames to port.
+
+    Any amount of websockets can be attached to the same port,
+    `history` last output chunks are sent on attach.
+    Notices of worker are sent as text frames.
+    """
+    output_key = OUTPUT_STREAM_KEY.format(port=port)
+    input_key = INPUT_STREAM_KEY.format(port=port)
+    notice_key = NOTICE_STREAM_KEY.format(port=port)
+
+    async def pump_output() -> None:
+        last_id: Optional[bytes] = None
+
+        if history:
+            entries = await async_redis_client.xrevrange(output_key, count=history)
+            for _, fields in reversed(entries):
+                await websocket.send_bytes(fields[b"data"])
+            if entries:
+                last_id = entries[0][0]
+
+        if last_id is None:
+            entries = await async_redis_client.xrevrange(output_key, count=1)
+            last_id = entries[0][0] if entries else b"0-0"
+
+        # Only notices which appear after attach are sent
+        entries = await async_redis_client.xrevrange(notice_key, count=1)
+        notice_last_id = entries[0][0] if entries else b"0-0"
+
+        while True:
+            entries = await async_redis_client.xread(
+                {output_key: last_id, notice_key: notice_last_id}, block=int(BLOCK_TIMEOUT_S * 1000))
+
+            for key, messages in entries:
+                for message_id, fields in messages:
+                    if key.decode() == notice_key:
+                        notice_last_id = message_id
+                        await websocket.send_text(fields[b"data"].decode())
+                    else:
+                        last_id = message_id
+                        await websocket.send_bytes(fields[b"data"])
+
+    async def pump_input() -> None:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+            data = message.get("bytes") or (message.get("text") or "").encode()
+            if data:
+                await async_redis_client.xadd(
+                    input_key, {"data": data}, maxlen=INPUT_STREAM_MAXLEN, approximate=True)
+
+    pumps = [asyncio.create_task(pump_output()),
+             asyncio.create_task(pump_input())]
+
+    try:
+        done, _ = await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for pump in pumps:
+            pump.cancel()
+
+    for pump in done:
+        exc = pump.exception()
+        if exc is not None and not isinstance(exc, WebSocketDisconnect):
+            raise exc
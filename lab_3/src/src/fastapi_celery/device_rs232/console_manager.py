@@ -0,0 +1,274 @@
+import logging
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+import serial
+from serial import SerialException
+
+from ..config import server_settings
+from .console_archive import ConsoleArchive
+from .console_bridge import ConsoleBridge
+from .serial_module import connect_via_serial
+
+logger = logging.getLogger("SerialConsoleManager")
+
+# Timeout of reader thread, it also bounds reaction time to console stop
+READER_TIMEOUT_S: float = 0.5
+READ_CHUNK_SIZE: int = 4096
+
+
+class SerialConsole:
+    """
+    Port held open for the whole life of worker.
+
+    Background thread continuously captures output into a bounded
+    ring buffer. Every received byte has a monotonic offset, so readers
+    ask for bytes since their offset and never reopen the port.
+    Any amount of readers can consume the same port at once.
+    Captured output is also written to archive of port, if it is given.
+    """
+
+    def __init__(
+        self,
+        port: str,
+        baudrate: Optional[int],
+        buffer_bytes: int,
+        reopen_delay_s: float,
+        archive: Optional[ConsoleArchive] = None
+    ):
+        self.port = port
+        self.baudrate = baudrate or server_settings.RS232_SETTINGS.DEFAULT_BAUDRATE
+        self.buffer_bytes = buffer_bytes
+        self.reopen_delay_s = reopen_delay_s
+        self.archive = archive
+
+        self._serial: Optional[serial.Serial] = None
+        # Offset of the first byte kept in buffer
+        self._start_offset = 0
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        # Held by reader thread while it uses the port
+        self._read_lock = threading.Lock()
+        self._paused = threading.Event()
+        self._stopped = threading.Event()
+        self._opened = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def end_offset(self) -> int:
+        """Offset of the next byte that will be received"""
+        with self._cond:
+            return self._start_offset + len(self._buffer)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._capture, name=f"console-{self.port}",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+        if self.archive is not None:
+            self.archive.close()
+
+    def read_since(self, offset: int, max_bytes: Optional[int] = None) -> Tuple[bytes, int, int]:
+        """
+        Returns received bytes since offset, offset of the next byte
+        and amount of bytes which were dropped from buffer before they were read.
+        """
+        with self._cond:
+            dropped = max(self._start_offset - offset, 0)
+            offset += dropped
+
+            begin = offset - self._start_offset
+            end = len(self._buffer) if max_bytes is None else min(
+                begin + max_bytes, len(self._buffer))
+            data = bytes(self._buffer[begin:end])
+
+        return data, offset + len(data), dropped
+
+    def wait_for_data(self, offset: int, timeout: float) -> bool:
+        """Waits until bytes after offset are received, returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._start_offset + len(self._buffer) > offset, timeout)
+
+    def set_baudrate(self, baudrate: Optional[int]) -> None:
+        if baudrate is None or baudrate == self.baudrate:
+            return
+
+        # Port is reconfigured between reads, reader waits for write lock meanwhile
+        with self._write_lock:
+            self._paused.set()
+            try:
+                with self._read_lock:
+                    self.baudrate = baudrate
+                    if self._opened.is_set():
+                        self._serial.baudrate = baudrate
+            finally:
+                self._paused.clear()
+
+        logger.info(f"Console {self.port} baudrate is changed to {baudrate}")
+
+    def write(self, data: bytes) -> None:
+        if not self._opened.wait(self.reopen_delay_s + READER_TIMEOUT_S):
+            raise SerialException(f"Port {self.port} is not opened")
+
+        with self._write_lock:
+            self._serial.write(data)
+
+        logger.debug(f"Serial: {self.port}. \nWrote:\n'{data}'")
+
+    def _capture(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                with self._read_lock:
+                    self._serial = connect_via_serial(
+                        port=self.port, baudrate=self.baudrate, timeout=READER_TIMEOUT_S)
+                    self._opened.set()
+            except SerialException as exc:
+                logger.warning(
+                    f"Failed to open console {self.port}, retry in {self.reopen_delay_s} s: {exc}")
+                if self.archive is not None:
+                    self.archive.flush_expired()
+                self._stopped.wait(self.reopen_delay_s)
+                continue
+
+            logger.info(f"Console {self.port} is opened")
+
+            try:
+                while not self._stopped.is_set():
+                    with self._read_lock:
+                        data = self._serial.read(
+                            max(min(self._serial.in_waiting, READ_CHUNK_SIZE), 1))
+                    if data:
+                        self._append(data)
+                    elif self.archive is not None:
+                        self.archive.flush_expired()
+
+                    if self._paused.is_set():
+                        with self._write_lock:
+                            pass
+            except SerialException as exc:
+                logger.warning(
+                    f"Console {self.port} failed, reopening: {exc}")
+            finally:
+                with self._read_lock:
+                    self._opened.clear()
+                    self._serial.close()
+
+            self._stopped.wait(self.reopen_delay_s)
+
+    def _append(self, data: bytes) -> None:
+        with self._cond:
+            offset = self._start_offset + len(self._buffer)
+            self._buffer += data
+
+            excess = len(self._buffer) - self.buffer_bytes
+            if excess > 0:
+                del self._buffer[:excess]
+                self._start_offset += excess
+
+            self._cond.notify_all()
+
+        if self.archive is not None:
+            try:
+                self.archive.append(data, offset)
+            except OSError as exc:
+                # Archive must never stop live capture
+                logger.warning(f"Failed to archive console {self.port}: {exc}")
+
+
+class ConsoleCursor:
+    """
+    Serial-like reader of console from offset.
+
+    Provides `in_waiting`, `read` and `timeout` used by read_from_serial,
+    so the same stop conditions apply to reads from console.
+    """
+
+    def __init__(self, console: SerialConsole, offset: Optional[int] = None, timeout: float = 0):
+        self.console = console
+        self.port = console.port
+        self.offset = console.end_offset if offset is None else offset
+        self.timeout = timeout
+        self.dropped_bytes = 0
+
+    @property
+    def in_waiting(self) -> int:
+        return max(self.console.end_offset - self.offset, 0)
+
+    def read(self, size: int = 1) -> bytes:
+        if not self.in_waiting and self.timeout:
+            self.console.wait_for_data(self.offset, self.timeout)
+
+        data, self.offset, dropped = self.console.read_since(
+            self.offset, size)
+        self.dropped_bytes += dropped
+
+        return data
+
+
+class ConsoleManager:
+    """Owner of all consoles of rs232 worker process, each console is bridged to Redis streams."""
+
+    def __init__(self, buffer_bytes: int, reopen_delay_s: float):
+        self.buffer_bytes = buffer_bytes
+        self.reopen_delay_s = reopen_delay_s
+
+        self._consoles: Dict[str, SerialConsole] = {}
+        self._bridges: Dict[str, ConsoleBridge] = {}
+        self._lock = threading.Lock()
+
+    def start(self, ports: Iterable[str]) -> None:
+        for port in ports:
+            self.get_console(port)
+
+    def get_console(self, port: str, baudrate: Optional[int] = None) -> SerialConsole:
+        """Returns console of port, port is opened on the first request."""
+        with self._lock:
+            console = self._consoles.get(port)
+
+            if console is None:
+                rs232_settings = server_settings.RS232_SETTINGS
+                archive = ConsoleArchive(
+                    port,
+                    segment_bytes=rs232_settings.ARCHIVE_SEGMENT_BYTES,
+                    index_interval_s=rs232_settings.ARCHIVE_INDEX_INTERVAL_S,
+                    retention_bytes=rs232_settings.ARCHIVE_RETENTION_BYTES,
+                    retention_s=rs232_settings.ARCHIVE_RETENTION_S
+                )
+                console = SerialConsole(
+                    port, baudrate, self.buffer_bytes, self.reopen_delay_s, archive)
+                console.start()
+                self._consoles[port] = console
+
+                bridge = ConsoleBridge(console)
+                bridge.start()
+                self._bridges[port] = bridge
+
+        console.set_baudrate(baudrate)
+
+        return console
+
+    def stop_all(self) -> None:
+        with self._lock:
+            consoles = list(self._consoles.values())
+            bridges = list(self._bridges.values())
+            self._consoles.clear()
+            self._bridges.clear()
+
+        for bridge in bridges:
+            bridge.stop()
+
+        for console in consoles:
+            console.stop()
+
+
+console_manager = ConsoleManager(
+    buffer_bytes=server_settings.RS232_SETTINGS.CONSOLE_BUFFER_BYTES,
+    reopen_delay_s=server_settings.RS232_SETTINGS.CONSOLE_REOPEN_DELAY_S
+)
@@ -0,0 +1,95 @@
+import logging
+import re
+import time
+from typing import List, Optional, Tuple
+
+from .console_manager import ConsoleCursor, SerialConsole
+from .schemas import (Rs232DialogResult, Rs232DialogStep,
+                      Rs232DialogStepResult, Rs232ExpectStep, Rs232SendStep,
+                      Rs232SleepStep)
+
+logger = logging.getLogger("Rs232Dialog")
+
+# Pattern is searched in new output and this amount of preceding bytes
+EXPECT_LOOKBEHIND: int = 4096
+
+
+def expect(cursor: ConsoleCursor, pattern: re.Pattern, timeout: float) -> Tuple[bytes, Optional[re.Match]]:
+    """
+    Reads console until pattern is found or timeout expires.
+
+    Output after the match is left unread for the next step.
+    """
+    deadline = time.monotonic() + timeout
+    output = bytearray()
+    searched = 0
+
+    while True:
+        match = pattern.search(output, max(searched - EXPECT_LOOKBEHIND, 0))
+        if match is not None:
+            # Rewind cursor to the end of match
+            cursor.offset -= len(output) - match.end()
+            return bytes(output[:match.end()]), match
+
+        searched = len(output)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return bytes(output), None
+
+        cursor.timeout = remaining
+        output += cursor.read(max(cursor.in_waiting, 1))
+
+
+def run_dialog(console: SerialConsole, steps: List[Rs232DialogStep]) -> Rs232DialogResult:
+    """
+    Runs script of send/expect/sleep steps on console.
+
+    Output is expected since the start of the dialog.
+    Dialog is stopped on the first expect which did not match.
+    """
+    start = time.monotonic()
+
+    cursor = ConsoleCursor(console)
+    step_results: List[Rs232DialogStepResult] = []
+    failed_step = None
+
+    for step_number, step in enumerate(steps):
+        step_start = time.monotonic()
+
+        if isinstance(step, Rs232SendStep):
+            console.write(step.text.encode())
+            step_result = Rs232DialogStepResult(
+                action=step.action, success=True, execution_time_s=None)
+
+        elif isinstance(step, Rs232ExpectStep):
+            output, match = expect(
+                cursor, re.compile(step.pattern.encode()), step.timeout)
+            step_result = Rs232DialogStepResult(
+                action=step.action,
+                success=match is not None,
+                output=output.decode(errors="ignore"),
+                match=match.group().decode(errors="ignore") if match else None,
+                execution_time_s=None
+            )
+
+        elif isinstance(step, Rs232SleepStep):
+            time.sleep(step.seconds)
+            step_result = Rs232DialogStepResult(
+                action=step.action, success=True, execution_time_s=None)
+
+        step_result.execution_time_s = time.monotonic() - step_start
+        step_results.append(step_result)
+
+        if not step_result.success:
+            failed_step = step_number
+            logger.info(
+                f"Serial: {console.port}. Step {step_number} did not match '{step.pattern}', stopping dialog")
+            break
+
+    return Rs232DialogResult(
+        steps=step_results,
+        failed_step=failed_step,
+        offset=cursor.offset,
+        execution_time_s=time.monotonic() - start
+    )
@@ -0,0 +1,187 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from ..config import server_settings
+from ..redis_client import redis_client
+
+logger = logging.getLogger("Rs232PortScheduler")
+
+PORT_STATS_KEY = "rs232_port:stats:{port}"
+# Stats of ports which are not used anymore disappear
+PORT_STATS_TTL_S: int = 86400
+
+
+@dataclass
+class PortClaim:
+    """Place of operation in queue of port."""
+    port: str
+    ticket: Tuple[int, int]
+    enqueued_at: float
+    last_seen: float
+
+
+class PortScheduler:
+    """
+    Serializes operations on each serial port of rs232 worker.
+
+    Operations on one port are granted in order of priority (higher first),
+    then in order of arrival. Nothing waits for a port: operation which
+    can't take it is queued and asks again later with the same ID, so
+    task threads are never parked and different ports never wait for
+    each other. Place of operation which didn't ask for `claim_ttl_s`
+    (e.g. its task was revoked) is given up.
+
+    Stats are published to redis by a background thread, which
+    publishes the latest state of changed ports, so redis latency
+    never delays operations on ports.
+    """
+
+    def __init__(self, claim_ttl_s: float):
+        self.claim_ttl_s = claim_ttl_s
+
+        self._lock = threading.Lock()
+        # Heap of (ticket, operation ID) of waiting operations, ticket is (-priority, sequence number)
+        self._waiting: Dict[str, List[Tuple[Tuple[int, int], str]]] = defaultdict(list)
+        self._claims: Dict[str, PortClaim] = {}
+        self._busy: Dict[str, bool] = defaultdict(bool)
+        self._stats: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"acquired": 0, "wait_total_s": 0.0, "wait_max_s": 0.0, "last_wait_s": 0.0})
+        self._sequence = itertools.count()
+        # Stats of ports waiting to be published
+        self._pending: Dict[str, Dict[str, float]] = {}
+        self._has_pending = threading.Event()
+        self._publisher: Optional[threading.Thread] = None
+
+    @contextmanager
+    def acquire(self, port: str, operation_id: str, priority: int = 0) -> Iterator[Optional[float]]:
+        """
+        Holds port for the duration of the block if it's turn of operation, yields time spent in queue.
+
+        Otherwise operation keeps its place in queue and None is yielded at once.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            self._expire_claims_locked(port, now)
+
+            claim = self._claims.get(operation_id)
+            if claim is None:
+                claim = PortClaim(port, (-priority, next(self._sequence)), now, now)
+                self._claims[operation_id] = claim
+                heapq.heappush(self._waiting[port], (claim.ticket, operation_id))
+            claim.last_seen = now
+
+            acquired = not self._busy[port] and self._waiting[port][0][1] == operation_id
+            if acquired:
+                heapq.heappop(self._waiting[port])
+                del self._claims[operation_id]
+                self._busy[port] = True
+
+                wait_s = now - claim.enqueued_at
+                stats = self._stats[port]
+                stats["acquired"] += 1
+                stats["wait_total_s"] += wait_s
+                stats["wait_max_s"] = max(stats["wait_max_s"], wait_s)
+                stats["last_wait_s"] = wait_s
+            self._snapshot_locked(port)
+
+        if not acquired:
+            yield None
+            return
+
+        try:
+            yield wait_s
+        finally:
+            with self._lock:
+                self._busy[port] = False
+                self._snapshot_locked(port)
+
+    @contextmanager
+    def try_acquire(self, port: str) -> Iterator[bool]:
+        """
+        Holds port for the duration of the block if it is free, yields whether it was acquired.
+
+        Port is not taken if it is held or other operations wait for it.
+        """
+        with self._lock:
+            self._expire_claims_locked(port, time.monotonic())
+
+            acquired = not self._busy[port] and not self._waiting[port]
+            if acquired:
+                self._busy[port] = True
+
+        if not acquired:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            with self._lock:
+                self._busy[port] = False
+
+    def _expire_claims_locked(self, port: str, now: float) -> None:
+        waiting = self._waiting[port]
+        expired = {operation_id for _, operation_id in waiting
+                   if now - self._claims[operation_id].last_seen > self.claim_ttl_s}
+        if not expired:
+            return
+
+        for operation_id in expired:
+            del self._claims[operation_id]
+        self._waiting[port] = [entry for entry in waiting if entry[1] not in expired]
+        heapq.heapify(self._waiting[port])
+
+        logger.info(f"Operations {sorted(expired)} stopped waiting for port {port}")
+
+    def _snapshot_locked(self, port: str) -> None:
+        self._pending[port] = {
+            **self._stats[port],
+            "queue_depth": len(self._waiting[port]),
+            "busy": int(self._busy[port])
+        }
+
+        if self._publisher is None:
+            self._publisher = threading.Thread(
+                target=self._publish_pending, name="port-stats-publisher", daemon=True)
+            self._publisher.start()
+
+        self._has_pending.set()
+
+    def _publish_pending(self) -> None:
+        # API reads stats of rs232 worker from redis
+        while True:
+            self._has_pending.wait()
+
+            with self._lock:
+                self._has_pending.clear()
+                pending, self._pending = self._pending, {}
+
+            try:
+                pipeline = redis_client.pipeline(transaction=False)
+                for port, mapping in pending.items():
+                    key = PORT_STATS_KEY.format(port=port)
+                    pipeline.hset(key, mapping=mapping)
+                    pipeline.expire(key, PORT_STATS_TTL_S)
+                pipeline.execute()
+            except RedisError as exc:
+                logger.debug(f"Failed to publish stats of ports {list(pending)}: {exc}")
+
+
+def get_port_stats(port: str) -> Dict[str, float]:
+    raw_stats = redis_client.hgetall(PORT_STATS_KEY.format(port=port))
+
+    return {name.decode(): float(value) for name, value in raw_stats.items()}
+
+
+port_scheduler = PortScheduler(
+    claim_ttl_s=server_settings.RS232_SETTINGS.PORT_CLAIM_TTL_S)
@@ -1,7 +1,10 @@
-from pydantic import BaseModel, Field
-from typing import Union, Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Annotated, List, Literal, Union, Optional
 
 from pathlib import Path
+import re
+
+from ..enums import Rs232StopReason, Rs232TransferProtocol
 
 #########################
 # --- Queue Request --- #
@@ -14,18 +17,95 @@ class Rs232Request(BaseModel):
     timeout: float = Field(ge=0, examples=[0, 10])
 
 
-class Rs232ReadRequest(Rs232Request):
-    pass
+class Rs232ReadStopConditions(BaseModel):
+    """Reading stops on the first met condition, `timeout` is the idle gap by default"""
+    terminator: Optional[str] = Field(
+        default=None, description="Regex matched against the last line of output", examples=["=> ", "login:"])
+    max_bytes: Optional[int] = Field(default=None, gt=0, examples=[65536])
+    idle_timeout: Optional[float] = Field(
+        default=None, gt=0, description="Stop if nothing was received for this time", examples=[1])
+    deadline: Optional[float] = Field(
+        default=None, gt=0, description="Overall time of reading", examples=[30])
+
+    @field_validator("terminator")
+    @classmethod
+    def check_terminator(cls, terminator: Optional[str]) -> Optional[str]:
+        if terminator is not None:
+            try:
+                re.compile(terminator)
+            except re.error as exc:
+                raise ValueError(f"Invalid terminator regex: {exc}")
+        return terminator
+
+
+class Rs232ReadRequest(Rs232Request, Rs232ReadStopConditions):
+    offset: Optional[int] = Field(
+        default=None, ge=0, description="Read console since offset returned by previous read, only new output by default")
 
 
-class Rs232WriteRequest(Rs232Request):
+class Rs232ScheduledRequest(BaseModel):
+    """Writing operations on one port are executed one by one, reads are shared"""
+    priority: int = Field(
+        default=0, description="Operations on the same port with higher priority are executed first")
+
+
+class Rs232WriteRequest(Rs232Request, Rs232ScheduledRequest):
     text: str
 
 
-class Rs232WriteAndReadRequest(Rs232Request):
+class Rs232WriteAndReadRequest(Rs232Request, Rs232ReadStopConditions, Rs232ScheduledRequest):
     text: str
 
 
+class Rs232SendStep(BaseModel):
+    action: Literal["send"]
+    text: str = Field(examples=["\n", "setenv bootdelay 3\n"])
+
+
+class Rs232ExpectStep(BaseModel):
+    action: Literal["expect"]
+    pattern: str = Field(examples=["Hit any key to stop autoboot", "=> "])
+    timeout: float = Field(gt=0, examples=[10])
+
+    @field_validator("pattern")
+    @classmethod
+    def check_pattern(cls, pattern: str) -> str:
+        try:
+            re.compile(pattern)
+        except re.error as exc:
+            raise ValueError(f"Invalid pattern regex: {exc}")
+        return pattern
+
+
+class Rs232SleepStep(BaseModel):
+    action: Literal["sleep"]
+    seconds: float = Field(gt=0, examples=[0.5])
+
+
+Rs232DialogStep = Annotated[Union[Rs232SendStep, Rs232ExpectStep, Rs232SleepStep],
+                            Field(discriminator="action")]
+
+
+class Rs232DialogRequest(Rs232ScheduledRequest):
+    hostname: str
+    baudrate: Optional[int] = Field(default=None, gt=0, examples=[115200])
+    steps: List[Rs232DialogStep] = Field(min_length=1)
+
+
+class Rs232TransferRequest(Rs232ScheduledRequest):
+    hostname: str
+    baudrate: Optional[int] = Field(default=None, gt=0, examples=[115200])
+    file_name: str = Field(
+        description="File in TRANSFER_FOLDER_PATH of rs232 worker", examples=["u-boot-recovery.imx"])
+    protocol: Rs232TransferProtocol = Field(default=Rs232TransferProtocol.YMODEM)
+    start_command: Optional[str] = Field(
+        default=None, description="Command which starts receiver on device", examples=["loady 0x40480000\n"])
+    block_size: Optional[Literal[128, 1024]] = Field(
+        default=None, description="Initial block size, 1024 for ymodem and 128 for xmodem by default")
+    handshake_timeout: float = Field(
+        default=60, gt=0, description="Time to wait for receiver to start", examples=[60])
+
+
 ##########################
 # --- Queue Response --- #
 ##########################
@@ -42,10 +122,17 @@ class Rs232QueuedResponse(BaseModel):
 
 class Rs232Result(BaseModel):
     execution_time_s: Optional[float]
+    port_wait_s: Optional[float] = Field(
+        default=None, description="Time spent waiting for operations of other tasks on the port")
 
 
 class Rs232ReadResult(Rs232Result):
     output: str
+    stop_reason: Optional[Rs232StopReason] = Field(default=None)
+    offset: Optional[int] = Field(
+        default=None, description="Console offset after the last read byte")
+    dropped_bytes: int = Field(
+        default=0, description="Bytes since requested offset which are no longer kept by console")
 
 
 class Rs232WriteResult(Rs232Result):
@@ -54,6 +141,50 @@ class Rs232WriteResult(Rs232Result):
 
 class Rs232WriteAndReadResult(Rs232Result):
     output: str
+    stop_reason: Optional[Rs232StopReason] = Field(default=None)
+    offset: Optional[int] = Field(
+        default=None, description="Console offset after the last read byte")
+
+
+class Rs232DialogStepResult(Rs232Result):
+    action: str
+    success: bool
+    output: Optional[str] = Field(
+        default=None, description="Output received while waiting for pattern")
+    match: Optional[str] = Field(default=None)
+
+
+class Rs232DialogResult(Rs232Result):
+    steps: List[Rs232DialogStepResult]
+    failed_step: Optional[int]
+    offset: int = Field(description="Console offset after the last matched output")
+
+
+class Rs232TransferResult(Rs232Result):
+    protocol: Rs232TransferProtocol
+    size_bytes: int
+    transferred_bytes: int
+    blocks: int
+    retransmits: int
+    block_size: Optional[int] = Field(
+        default=None, description="Block size at the end of transfer")
+    throughput_bps: float = Field(description="Bytes per second")
+    offset: int = Field(description="Console offset, output of device after transfer starts here")
+
+###############################
+# --- Port Stats Response --- #
+###############################
+
+
+class Rs232PortStatsResponse(BaseModel):
+    hostname: str
+    port: str
+    queue_depth: int
+    busy: bool
+    acquired: int
+    avg_wait_s: float
+    max_wait_s: float
+    last_wait_s: float
 
 ###############################
 # --- Task State Response --- #
@@ -65,4 +196,4 @@ class Rs232TaskResponse(BaseModel):
     status: str
     meta: Optional[dict]
     result: Union[Rs232ReadResult, Rs232WriteResult,
-                  Rs232WriteAndReadResult, None]
+                  Rs232WriteAndReadResult, Rs232DialogResult, Rs232TransferResult, None]
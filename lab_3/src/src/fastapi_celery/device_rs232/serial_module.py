@@ -1,10 +1,17 @@
 from ..config import server_settings
+from ..enums import Rs232StopReason
 import serial
 
 import logging
+import re
+import time
+from typing import Optional, Tuple
 
 logger = logging.getLogger("DutSerialModule")
 
+# Terminator is searched in the last line, but not further back than this
+TERMINATOR_LOOKBEHIND: int = 4096
+
 
 def connect_via_serial(port: str, baudrate: int, timeout: int) -> serial.SerialBase:
     """
@@ -26,20 +33,90 @@ def connect_via_serial(port: str, baudrate: int, timeout: int) -> serial.SerialB
     return ser
 
 
-def read_from_serial(ser: serial.Serial) -> str:
-    output = b''
+def read_from_serial(
+    ser: serial.Serial,
+    terminator: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    idle_timeout: Optional[float] = None,
+    deadline: Optional[float] = None
+) -> Tuple[str, Rs232StopReason]:
+    """
+    Reads from serial until one of stop conditions is met.
+
+    - `terminator`: regex matched against the last line of output (e.g. '=> ', 'login:')
+    - `max_bytes`: amount of read bytes
+    - `idle_timeout`: no data was received for this time, timeout of port by default
+    - `deadline`: overall time of reading
+
+    Everything received is read at once, so reading returns right after
+    the terminator without waiting for an idle gap.
+    With zero timeouts only already received data is read.
+    """
+    pattern = re.compile(terminator.encode()) if terminator else None
+    if idle_timeout is None:
+        idle_timeout = ser.timeout or 0
+
+    output = bytearray()
+    # Output before this position was already checked for terminator
+    checked = 0
+
+    start = time.monotonic()
+    last_data = start
+
+    # Timeout of port is changed while waiting for data
+    original_timeout = ser.timeout
+
+    try:
+        while True:
+            # Whole received burst is read at once
+            to_read = ser.in_waiting
+            if max_bytes is not None:
+                to_read = min(to_read, max_bytes - len(output))
+
+            if to_read > 0:
+                output += ser.read(to_read)
+            else:
+                now = time.monotonic()
+
+                wait = idle_timeout - (now - last_data)
+                stop_reason = Rs232StopReason.IDLE
+                if deadline is not None and deadline - (now - start) < wait:
+                    wait = deadline - (now - start)
+                    stop_reason = Rs232StopReason.DEADLINE
+
+                if wait <= 0:
+                    break
+
+                # Block until the first byte of the next burst
+                ser.timeout = wait
+                data = ser.read(1)
+                if not data:
+                    continue
+                output += data
+
+            last_data = time.monotonic()
+
+            if pattern is not None:
+                line_start = output.rfind(b"\n", 0, checked) + 1
+                line_start = max(line_start, checked - TERMINATOR_LOOKBEHIND)
+                if pattern.search(output, line_start):
+                    stop_reason = Rs232StopReason.TERMINATOR
+                    break
+                checked = len(output)
+
+            if max_bytes is not None and len(output) >= max_bytes:
+                stop_reason = Rs232StopReason.MAX_BYTES
+                break
+    finally:
+        if ser.timeout != original_timeout:
+            ser.timeout = original_timeout
 
-    while True:
-        data = ser.read(1)
-        if data:
-            output += data
-        else:
-            break
+    text = output.decode(errors="ignore")
 
     logger.debug(
-        f"Serial: {ser.port}. \nRead:\n'{output.decode(errors="ignore")}'")
+        f"Serial: {ser.port}. Stop reason: {stop_reason}. \nRead:\n'{text}'")
 
-    return output.decode(errors="ignore")
+    return text, stop_reason
 
 
 def write_to_serial(ser: serial.Serial, text: str) -> None:
@@ -1,41 +1,86 @@
 import datetime
+import time
+from typing import List
 
 from celery import states
-from celery.exceptions import MaxRetriesExceededError
+from celery.exceptions import MaxRetriesExceededError, Retry
+from celery.signals import worker_ready, worker_shutdown
 from celery.utils.log import get_task_logger
+from pydantic import TypeAdapter
 from serial import SerialException, SerialTimeoutException
 
-from ..exceptions import Rs232Exception
-from .schemas import Rs232ReadResult, Rs232WriteAndReadResult, Rs232WriteResult
-from .serial_module import (connect_via_serial, read_from_serial,
-                            write_to_serial)
+from ..config import server_settings
+from ..enums import Rs232TransferProtocol
+from ..exceptions import Rs232Exception, Rs232TransferError
+from .binary_transfer import transfer_file
+from .schemas import (Rs232DialogResult, Rs232DialogStep, Rs232ReadResult,
+                      Rs232TransferResult, Rs232WriteAndReadResult,
+                      Rs232WriteResult)
+from .console_manager import ConsoleCursor, console_manager
+from .dialog import run_dialog
+from .port_scheduler import port_scheduler
+from .serial_module import read_from_serial
 from .worker import rs232_worker
 
 logger = get_task_logger("Rs232Task")
 
 
+@worker_ready.connect
+def start_consoles(**kwargs):
+    # Output printed between tasks (boot logs, panics) is captured too
+    console_manager.start(
+        device.rs232_port for device in server_settings.DEVICES)
+
+
+@worker_shutdown.connect
+def stop_consoles(**kwargs):
+    console_manager.stop_all()
+
+
+def wait_for_port(task) -> Retry:
+    """Re-queues task which waits for busy port, so it doesn't hold a worker thread meanwhile."""
+    # Waiting isn't limited by max_retries of task, it lasts while the port is busy
+    return task.retry(countdown=server_settings.RS232_SETTINGS.PORT_RETRY_DELAY_S,
+                      max_retries=task.request.retries + 1)
+
+
+def get_read_deadline(deadline: float = None) -> float:
+    """Reading of endless output (e.g. boot log) is limited by READ_MAX_DEADLINE_S."""
+    max_deadline = server_settings.RS232_SETTINGS.READ_MAX_DEADLINE_S
+
+    return min(deadline, max_deadline) if deadline is not None else max_deadline
+
+
 @rs232_worker.task(name="rs232_read", max_retries=2, default_retry_delay=3, bind=True, queue='rs232_queue')
 def rs232_read_task(
     self,
     port: str,
     timeout: float,
-    baudrate: int
+    baudrate: int,
+    terminator: str = None,
+    max_bytes: int = None,
+    idle_timeout: float = None,
+    deadline: float = None,
+    offset: int = None
 ) -> Rs232ReadResult:
     self.update_state(state=states.STARTED,
                       meta={})
-    serial = connect_via_serial(
-        port=port, baudrate=baudrate, timeout=timeout)
 
     try:
         start_time = datetime.datetime.now()
 
-        serial_output = read_from_serial(serial)
+        console = console_manager.get_console(port, baudrate)
+        cursor = ConsoleCursor(console, offset, timeout)
+
+        serial_output, stop_reason = read_from_serial(
+            cursor, terminator, max_bytes, idle_timeout, get_read_deadline(deadline))
 
         end_time = datetime.datetime.now()
         execution_time = (end_time - start_time).total_seconds()
 
         response = Rs232ReadResult(
-            output=serial_output, execution_time_s=execution_time)
+            output=serial_output, execution_time_s=execution_time, stop_reason=stop_reason,
+            offset=cursor.offset, dropped_bytes=cursor.dropped_bytes)
 
         return response.model_dump()
     except MaxRetriesExceededError as e:
@@ -54,8 +99,6 @@ def rs232_read_task(
     except Exception as e:
         self.update_state(state=states.RETRY, meta={
                           'exception': f'Unexpected exception. Exception: {str(e)}. Type: {type(e)}'})
-    finally:
-        serial.close()
 
 
 @rs232_worker.task(name="rs232_write", bind=True, max_retries=2, default_retry_delay=3, queue='rs232_queue')
@@ -64,25 +107,31 @@ def rs232_write_task(
     port: str,
     baudrate: int,
     timeout: float,
-    text: str
+    text: str,
+    priority: int = 0
 ) -> Rs232WriteResult:
     self.update_state(state=states.STARTED,
                       meta={})
-    serial = connect_via_serial(
-        port=port, baudrate=baudrate, timeout=timeout)
 
     try:
-        start_time = datetime.datetime.now()
+        with port_scheduler.acquire(port, self.request.id, priority) as port_wait_s:
+            if port_wait_s is None:
+                raise wait_for_port(self)
 
-        write_to_serial(serial, text)
+            start_time = datetime.datetime.now()
 
-        end_time = datetime.datetime.now()
-        execution_time = (end_time - start_time).total_seconds()
+            console = console_manager.get_console(port, baudrate)
+            console.write(text.encode())
+
+            end_time = datetime.datetime.now()
+            execution_time = (end_time - start_time).total_seconds()
 
         response = Rs232WriteResult(
-            execution_time_s=execution_time)
+            execution_time_s=execution_time, port_wait_s=port_wait_s)
 
         return response.model_dump()
+    except Retry:
+        raise
     except MaxRetriesExceededError as e:
         self.update_state(state=states.FAILURE, meta={})
     except Rs232Exception as e:
@@ -99,8 +148,6 @@ def rs232_write_task(
     except Exception as e:
         self.update_state(state=states.RETRY, meta={
                           'exception': f'Unexpected exception. Exception: {str(e)}. Type: {type(e)}'})
-    finally:
-        serial.close()
 
 
 @rs232_worker.task(name="rs232_write_and_read", max_retries=2, default_retry_delay=3, bind=True, queue='rs232_queue')
@@ -109,27 +156,42 @@ def rs232_write_and_read_task(
     port: str,
     baudrate: int,
     text: str,
-    timeout: float
+    timeout: float,
+    terminator: str = None,
+    max_bytes: int = None,
+    idle_timeout: float = None,
+    deadline: float = None,
+    priority: int = 0
 ) -> Rs232WriteAndReadResult:
     self.update_state(state=states.STARTED,
                       meta={})
-    serial = connect_via_serial(
-        port=port, baudrate=baudrate, timeout=timeout)
 
     try:
-        start_time = datetime.datetime.now()
+        with port_scheduler.acquire(port, self.request.id, priority) as port_wait_s:
+            if port_wait_s is None:
+                raise wait_for_port(self)
 
-        write_to_serial(serial, text)
+            start_time = datetime.datetime.now()
 
-        serial_output = read_from_serial(serial)
+            console = console_manager.get_console(port, baudrate)
+            # Response is read from the moment of writing
+            cursor = ConsoleCursor(console, timeout=timeout)
 
-        end_time = datetime.datetime.now()
-        execution_time = (end_time - start_time).total_seconds()
+            console.write(text.encode())
+
+            serial_output, stop_reason = read_from_serial(
+                cursor, terminator, max_bytes, idle_timeout, get_read_deadline(deadline))
+
+            end_time = datetime.datetime.now()
+            execution_time = (end_time - start_time).total_seconds()
 
         response = Rs232WriteAndReadResult(
-            execution_time_s=execution_time, output=serial_output)
+            execution_time_s=execution_time, output=serial_output, stop_reason=stop_reason,
+            offset=cursor.offset, port_wait_s=port_wait_s)
 
         return response.model_dump()
+    except Retry:
+        raise
     except MaxRetriesExceededError as e:
         self.update_state(state=states.FAILURE, meta={})
     except Rs232Exception as e:
@@ -146,5 +208,102 @@ def rs232_write_and_read_task(
     except Exception as e:
         self.update_state(state=states.RETRY, meta={
                           'exception': f'Unexpected exception. Exception: {str(e)}. Type: {type(e)}'})
-    finally:
-        serial.close()
+
+
+@rs232_worker.task(name="rs232_dialog", bind=True, max_retries=2, default_retry_delay=3, queue='rs232_queue')
+def rs232_dialog_task(
+    self,
+    port: str,
+    baudrate: int,
+    steps: List[dict],
+    priority: int = 0
+) -> Rs232DialogResult:
+    """Runs send/expect/sleep script on one open console."""
+    self.update_state(state=states.STARTED,
+                      meta={})
+
+    try:
+        # Nothing else is written to port during the whole dialog
+        with port_scheduler.acquire(port, self.request.id, priority) as port_wait_s:
+            if port_wait_s is None:
+                raise wait_for_port(self)
+
+            console = console_manager.get_console(port, baudrate)
+
+            response = run_dialog(
+                console, TypeAdapter(List[Rs232DialogStep]).validate_python(steps))
+
+        response.port_wait_s = port_wait_s
+
+        return response.model_dump()
+    except Retry:
+        raise
+    except MaxRetriesExceededError as e:
+        self.update_state(state=states.FAILURE, meta={})
+    except SerialException as e:
+        self.update_state(state=states.RETRY,
+                          meta={'exc_type': type(e).__name__,
+                                'exc_message': e.__str__()})
+    except Exception as e:
+        self.update_state(state=states.RETRY, meta={
+                          'exception': f'Unexpected exception. Exception: {str(e)}. Type: {type(e)}'})
+
+
+class TransferProgress:
+    """Reports progress of binary transfer to task state not more often than once in interval."""
+
+    def __init__(self, task, file_name: str, interval_s: float = 1.0):
+        self.task = task
+        self.file_name = file_name
+        self.interval_s = interval_s
+        self._start = time.monotonic()
+        self._last_update = 0.0
+
+    def __call__(self, transferred: int, size: int) -> None:
+        now = time.monotonic()
+        if now - self._last_update < self.interval_s and transferred < size:
+            return
+
+        self._last_update = now
+        elapsed = now - self._start
+        self.task.update_state(state=states.STARTED,
+                               meta={'file_name': self.file_name,
+                                     'transferred_bytes': transferred,
+                                     'size_bytes': size,
+                                     'throughput_bps': transferred / elapsed if elapsed else 0})
+
+
+@rs232_worker.task(name="rs232_transfer", bind=True, max_retries=2, default_retry_delay=3, queue='rs232_queue')
+def rs232_transfer_task(
+    self,
+    port: str,
+    baudrate: int,
+    file_name: str,
+    protocol: Rs232TransferProtocol,
+    start_command: str = None,
+    block_size: int = None,
+    handshake_timeout: float = 60,
+    priority: int = 0
+) -> Rs232TransferResult:
+    """Sends file to receiver on device (u-boot loady/loadx) via console."""
+    self.update_state(state=states.STARTED,
+                      meta={})
+
+    try:
+        # Any other write would corrupt the transfer
+        with port_scheduler.acquire(port, self.request.id, priority) as port_wait_s:
+            if port_wait_s is None:
+                raise wait_for_port(self)
+
+            console = console_manager.get_console(port, baudrate)
+
+            response = transfer_file(
+                console, file_name, Rs232TransferProtocol(protocol), start_command,
+                block_size, handshake_timeout, TransferProgress(self, file_name))
+
+        response.port_wait_s = port_wait_s
+
+        return response.model_dump()
+    except (Rs232TransferError, SerialException) as e:
+        # Transfer is started from the beginning, exception of the last retry fails the task
+        raise self.retry(exc=e)
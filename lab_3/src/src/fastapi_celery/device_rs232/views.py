@@ -1,18 +1,31 @@
+import asyncio
+from datetime import datetime, timezone
+
 from celery.result import AsyncResult
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import JSONResponse, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
 
-from ..database import get_db
-from typing import Annotated
+from ..config import server_settings
+from ..database import SessionLocal, get_db
+from typing import Annotated, List, Optional
 from ..device_data.schemas import DeviceSchema
 from ..device_data.service import get_device
+from ..exceptions import DeviceNotFoundError, Rs232ConsoleArchiveNotFoundError
 from celery import states
-from .schemas import (Rs232QueuedResponse, Rs232ReadRequest, Rs232ReadResult,
-                      Rs232TaskResponse, Rs232WriteAndReadRequest,
+from ..task_status import (MAX_WAIT_S, get_task_meta, send_task_updates,
+                           stream_task_events, wait_for_task_update)
+from .console_archive import iter_archive_range
+from .console_bridge import attach_websocket
+from .port_scheduler import get_port_stats
+from .schemas import (Rs232DialogRequest, Rs232DialogResult,
+                      Rs232PortStatsResponse, Rs232QueuedResponse, Rs232ReadRequest, Rs232ReadResult,
+                      Rs232TaskResponse, Rs232TransferRequest,
+                      Rs232TransferResult, Rs232WriteAndReadRequest,
                       Rs232WriteAndReadResult, Rs232WriteRequest,
                       Rs232WriteResult)
-from .tasks import (rs232_worker, rs232_read_task, rs232_write_and_read_task,
+from .tasks import (rs232_worker, rs232_dialog_task, rs232_read_task,
+                    rs232_transfer_task, rs232_write_and_read_task,
                     rs232_write_task)
 
 router = APIRouter(prefix="/device_rs232", tags=["Device RS232"])
@@ -25,7 +38,12 @@ def read(request: Annotated[Rs232ReadRequest, "Rs232 Read Request"], db: Session
     task = rs232_read_task.delay(
         port=device.rs232_port,
         timeout=request.timeout,
-        baudrate=request.baudrate
+        baudrate=request.baudrate,
+        terminator=request.terminator,
+        max_bytes=request.max_bytes,
+        idle_timeout=request.idle_timeout,
+        deadline=request.deadline,
+        offset=request.offset
     )
 
     response = Rs232QueuedResponse(id=task.id, location=f"/queue/{task.id}")
@@ -40,7 +58,8 @@ def write(request: Rs232WriteRequest, db: Session = Depends(get_db)) -> Rs232Que
         port=device.rs232_port,
         text=request.text,
         baudrate=request.baudrate,
-        timeout=request.timeout
+        timeout=request.timeout,
+        priority=request.priority
     )
 
     response = Rs232QueuedResponse(id=task.id, location=f"/queue/{task.id}")
@@ -55,39 +74,219 @@ def write_and_read(request: Rs232WriteAndReadRequest, db: Session = Depends(get_
         port=device.rs232_port,
         text=request.text,
         baudrate=request.baudrate,
-        timeout=request.timeout
+        timeout=request.timeout,
+        terminator=request.terminator,
+        max_bytes=request.max_bytes,
+        idle_timeout=request.idle_timeout,
+        deadline=request.deadline,
+        priority=request.priority
     )
 
     response = Rs232QueuedResponse(id=task.id, location=f"/queue/{task.id}")
     return response
 
 
-@router.get("/queue/{task_id}", response_model=Rs232TaskResponse)
-async def get_status(task_id, response: Response) -> Rs232TaskResponse:
-    """URL used to receive updates on Celery tasks."""
+@router.post("/dialog", status_code=202, response_model=Rs232QueuedResponse)
+def dialog(request: Rs232DialogRequest, db: Session = Depends(get_db)) -> Rs232QueuedResponse:
+    """
+    Runs script of send/expect/sleep steps in one task.
+
+    Dialog fails fast on the first expect which did not match in time.
+    """
+    device: DeviceSchema = get_device(db=db, hostname=request.hostname)
+
+    task = rs232_dialog_task.delay(
+        port=device.rs232_port,
+        baudrate=request.baudrate,
+        steps=[step.model_dump() for step in request.steps],
+        priority=request.priority
+    )
+
+    response = Rs232QueuedResponse(id=task.id, location=f"/queue/{task.id}")
+    return response
+
+
+@router.post("/transfer", status_code=202, response_model=Rs232QueuedResponse)
+def transfer(request: Rs232TransferRequest, db: Session = Depends(get_db)) -> Rs232QueuedResponse:
+    """
+    Sends file to device via YMODEM, XMODEM-CRC or as is.
+
+    Progress and throughput are reported in meta of the task.
+    """
+    device: DeviceSchema = get_device(db=db, hostname=request.hostname)
+
+    task = rs232_transfer_task.delay(
+        port=device.rs232_port,
+        baudrate=request.baudrate,
+        file_name=request.file_name,
+        protocol=request.protocol,
+        start_command=request.start_command,
+        block_size=request.block_size,
+        handshake_timeout=request.handshake_timeout,
+        priority=request.priority
+    )
+
+    response = Rs232QueuedResponse(id=task.id, location=f"/queue/{task.id}")
+    return response
+
+
+@router.get("/ports/stats", response_model=List[Rs232PortStatsResponse])
+def get_ports_stats() -> List[Rs232PortStatsResponse]:
+    """Queue depth and wait time of operations on serial port of every device."""
+    ports_stats = []
+
+    for device in server_settings.DEVICES:
+        stats = get_port_stats(device.rs232_port)
+        acquired = int(stats.get("acquired", 0))
+
+        ports_stats.append(Rs232PortStatsResponse(
+            hostname=device.hostname,
+            port=device.rs232_port,
+            queue_depth=int(stats.get("queue_depth", 0)),
+            busy=bool(stats.get("busy", 0)),
+            acquired=acquired,
+            avg_wait_s=stats.get("wait_total_s", 0) / acquired if acquired else 0,
+            max_wait_s=stats.get("wait_max_s", 0),
+            last_wait_s=stats.get("last_wait_s", 0)
+        ))
+
+    return ports_stats
+
+
+@router.get("/console/{hostname}/archive")
+def get_console_archive(
+    hostname: str,
+    start: datetime = Query(..., description="Start of range, ISO 8601, UTC if timezone is not given"),
+    end: datetime = Query(..., description="End of range, ISO 8601, UTC if timezone is not given"),
+    compressed: bool = Query(
+        False, description="Stream gzip as stored in archive instead of plain text"),
+    db: Session = Depends(get_db)
+) -> StreamingResponse:
+    """
+    Console output of device between start and end.
+
+    Range is resolved with precision of ARCHIVE_INDEX_INTERVAL_S.
+    """
+    # Naive datetime would be taken as local time of server
+    start, end = (value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+                  for value in (start, end))
+
+    if end <= start:
+        raise HTTPException(
+            status_code=422, detail="End of range must be after its start")
+
+    device: DeviceSchema = get_device(db=db, hostname=hostname)
+
+    try:
+        chunks = iter_archive_range(
+            device.rs232_port, start.timestamp(), end.timestamp(), compressed)
+    except Rs232ConsoleArchiveNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    if compressed:
+        return StreamingResponse(
+            chunks,
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{hostname}-console.log.gz"'}
+        )
+
+    return StreamingResponse(chunks, media_type="text/plain")
+
+
+@router.websocket("/console/{hostname}/ws")
+async def live_console(
+    websocket: WebSocket,
+    hostname: str,
+    history: int = Query(
+        0, ge=0, le=1000, description="Amount of last output chunks sent on attach")
+) -> None:
+    """
+    Live console of device.
+
+    Output of port is sent as binary frames, received frames are written to port.
+    Frames received while port is held by a task are rejected, which is told by a text frame.
+    Several viewers can be attached to the same device at once.
+    """
+    try:
+        device: DeviceSchema = await asyncio.to_thread(get_console_device, hostname)
+    except DeviceNotFoundError as exc:
+        await websocket.close(code=1008, reason=exc.message)
+        return
+
+    await websocket.accept()
+    await attach_websocket(websocket, device.rs232_port, history)
+
+
+def get_console_device(hostname: str) -> DeviceSchema:
+    # Session isn't held by the socket, which stays open for hours
+    db = SessionLocal()
+    try:
+        return get_device(db=db, hostname=hostname)
+    finally:
+        db.close()
+
+
+def build_task_response(task_id: str) -> Rs232TaskResponse:
     rs232_task = AsyncResult(task_id, app=rs232_worker)
 
     rs232_task_response = Rs232TaskResponse(
         id=task_id,
         status=rs232_task.state,
-        meta=rs232_task.info,
+        meta=get_task_meta(rs232_task),
         result=None
     )
 
     task_name = rs232_task.name
 
-    if rs232_task.state == states.SUCCESS:
+    if rs232_task.state == states.SUCCESS and rs232_task.result is not None:
         if task_name == "rs232_read":
             task_result = Rs232ReadResult(**rs232_task.result)
         elif task_name == "rs232_write":
             task_result = Rs232WriteResult(**rs232_task.result)
         elif task_name == "rs232_write_and_read":
             task_result = Rs232WriteAndReadResult(**rs232_task.result)
+        elif task_name == "rs232_dialog":
+            task_result = Rs232DialogResult(**rs232_task.result)
+        elif task_name == "rs232_transfer":
+            task_result = Rs232TransferResult(**rs232_task.result)
         else:
-            response.status_code = 500
             raise HTTPException(
                 status_code=500, detail="Unknown task name (do you need /device_rs232 route??)")
 
         rs232_task_response.result = task_result
 
     return rs232_task_response
+
+
+@router.get("/queue/{task_id}", response_model=Rs232TaskResponse)
+async def get_status(
+    task_id,
+    response: Response,
+    wait: Optional[int] = Query(
+        None, ge=0, le=MAX_WAIT_S, description="Long-poll: wait up to `wait` s for update of task"),
+    since: Optional[str] = Query(
+        None, description="Status known by client, long-poll returns once status differs")
+) -> Rs232TaskResponse:
+    """URL used to receive updates on Celery tasks."""
+    if wait:
+        await wait_for_task_update(rs232_worker, task_id, wait, since)
+
+    return build_task_response(task_id)
+
+
+@router.get("/queue/{task_id}/events")
+async def stream_status(task_id: str) -> StreamingResponse:
+    """Server-Sent Events with status of task on every update, stream ends when task is finished."""
+    return StreamingResponse(
+        stream_task_events(rs232_worker, task_id,
+                           lambda: asyncio.to_thread(build_task_response, task_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+@router.websocket("/queue/{task_id}/ws")
+async def subscribe_status(websocket: WebSocket, task_id: str) -> None:
+    """Status of task on every update, socket is closed when task is finished."""
+    await send_task_updates(websocket, rs232_worker, task_id,
+                            lambda: asyncio.to_thread(build_task_response, task_id))
@@ -1,5 +1,5 @@
 from celery import Celery
-from ..config import env_settings
+from ..config import env_settings, server_settings
 
 rs232_worker = Celery('rs232_worker',
                       broker_connection_retry_on_startup=True,
@@ -14,5 +14,8 @@ rs232_worker.conf.update(
     task_serializer='json',
     result_serializer='json',
     accept_content=['json'],
-    timezone='UTC'
+    timezone='UTC',
+    # Consoles are owned by one process and shared by task threads
+    worker_pool='threads',
+    worker_concurrency=server_settings.RS232_SETTINGS.WORKER_CONCURRENCY
 )
@@ -0,0 +1,313 @@
+import asyncio
+import datetime
+import queue
+import socket
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+
+import asyncssh
+from celery.utils.log import get_task_logger
+
+from ..config import server_settings
+from ..enums import ImageType
+from .output_capture import OutputCapture
+from .schemas import SshResult
+from .ssh_module import READ_CHUNK_SIZE, OutputCallback
+
+logger = get_task_logger("SshAsyncExecutor")
+
+# (ip, port, username, image type)
+ConnectionKey = Tuple[str, int, str, str]
+
+# Upper bound for checking of command inactivity timeout
+WATCHDOG_INTERVAL_S: float = 0.5
+
+
+@dataclass
+class AsyncConnection:
+    conn: asyncssh.SSHClientConnection
+    image_id: Optional[str]
+    # Limits amount of channels opened in one connection (MaxSessions of sshd)
+    sessions: asyncio.Semaphore
+    last_used: float = field(default_factory=time.monotonic)
+    active: int = 0
+
+
+class AsyncSshExecutor:
+    """
+    Executes SSH commands of all tasks of worker process in one event loop.
+
+    Loop runs in a background thread and task threads only wait for
+    output of their commands, so with threads pool of Celery hundreds
+    of sessions run in one process instead of occupying a process per
+    command. Every waiting task still holds one thread of the pool.
+    One authenticated connection per device is shared by all commands to it.
+    """
+
+    def __init__(self, max_sessions: int, sessions_per_host: int, idle_timeout_s: float, keepalive_s: int):
+        self.max_sessions = max_sessions
+        self.sessions_per_host = sessions_per_host
+        self.idle_timeout_s = idle_timeout_s
+        self.keepalive_s = keepalive_s
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+        # Following attributes are used only from the loop thread
+        self._sessions: Optional[asyncio.Semaphore] = None
+        self._evict_task: Optional[asyncio.Task] = None
+        self._connections: Dict[ConnectionKey, AsyncConnection] = {}
+        self._connect_locks: Dict[ConnectionKey,
+                                  asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def execute(
+        self,
+        hostname: str,
+        port: int,
+        username: str,
+        image_type: ImageType,
+        password_getter: Callable[[], str],
+        command: str,
+        cmd_timeout: int,
+        on_output: Optional[OutputCallback] = None,
+        output: Optional[OutputCapture] = None,
+        error: Optional[OutputCapture] = None,
+        image_id: Optional[str] = None
+    ) -> SshResult:
+        """
+        Same contract as ssh_module.execute_command, but connection is managed by executor.
+
+        Output is passed from the loop to the calling thread,
+        so publishing and capturing of output never block the loop.
+        """
+        output = output if output is not None else OutputCapture()
+        error = error if error is not None else OutputCapture()
+        captures = {"stdout": output, "stderr": error}
+
+        key: ConnectionKey = (hostname, port, str(username), str(image_type))
+        chunks: queue.SimpleQueue = queue.SimpleQueue()
+
+        start_time = datetime.datetime.now()
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._execute(key, password_getter, image_id,
+                          command, cmd_timeout, chunks.put),
+            self._get_loop()
+        )
+
+        try:
+            # None is put after the last chunk of output
+            for stream_name, data in iter(chunks.get, None):
+                captures[stream_name].write(data)
+                if on_output is not None:
+                    on_output(stream_name, data)
+
+            retcode = future.result()
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            output.close()
+            error.close()
+
+        end_time = datetime.datetime.now()
+        execution_time = (end_time - start_time).total_seconds()
+
+        logger.debug(f"Executed '{command}'. Return code: {retcode}")
+
+        return SshResult(
+            stdout=output.getvalue(),
+            stderr=error.getvalue(),
+            retcode=retcode,
+            execution_time_s=execution_time,
+            truncated=output.truncated or error.truncated,
+            total_bytes=output.total_bytes + error.total_bytes
+        )
+
+    def close(self) -> None:
+        with self._loop_lock:
+            loop = self._loop
+            self._loop = None
+
+        if loop is None:
+            return
+
+        asyncio.run_coroutine_threadsafe(
+            self._close_connections(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        # Loop is started lazily, so it belongs to the forked worker process
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=self._run_loop, args=(loop,),
+                                 name="ssh-async-executor", daemon=True).start()
+                self._loop = loop
+
+            return self._loop
+
+    def _run_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        asyncio.set_event_loop(loop)
+
+        self._sessions = asyncio.Semaphore(self.max_sessions)
+        self._evict_task = loop.create_task(self._evict_idle())
+
+        loop.run_forever()
+
+    async def _execute(
+        self,
+        key: ConnectionKey,
+        password_getter: Callable[[], str],
+        image_id: Optional[str],
+        command: str,
+        cmd_timeout: int,
+        put_chunk: Callable[[Optional[Tuple[str, bytes]]], None]
+    ) -> Optional[int]:
+        try:
+            async with self._sessions:
+                connection = await self._get_connection(key, password_getter, image_id)
+
+                connection.active += 1
+                try:
+                    async with connection.sessions:
+                        return await self._run_process(connection.conn, command, cmd_timeout, put_chunk)
+                finally:
+                    connection.active -= 1
+                    connection.last_used = time.monotonic()
+        finally:
+            put_chunk(None)
+
+    async def _run_process(
+        self,
+        conn: asyncssh.SSHClientConnection,
+        command: str,
+        cmd_timeout: int,
+        put_chunk: Callable[[Tuple[str, bytes]], None]
+    ) -> Optional[int]:
+        loop = asyncio.get_running_loop()
+        last_activity = loop.time()
+
+        async def pump(reader: asyncssh.SSHReader, stream_name: str) -> None:
+            nonlocal last_activity
+            while True:
+                data = await reader.read(READ_CHUNK_SIZE)
+                if not data:
+                    return
+                last_activity = loop.time()
+                put_chunk((stream_name, data))
+
+        process = await asyncio.wait_for(
+            conn.create_process(command, encoding=None), cmd_timeout)
+
+        pending = {
+            asyncio.create_task(pump(process.stdout, "stdout")),
+            asyncio.create_task(pump(process.stderr, "stderr"))
+        }
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=WATCHDOG_INTERVAL_S)
+
+                for task in done:
+                    task.result()
+
+                if pending and loop.time() - last_activity > cmd_timeout:
+                    raise socket.timeout(
+                        f"Command did not respond for {cmd_timeout} s")
+
+            # Exit status follows the end of output
+            await asyncio.wait_for(process.wait_closed(), cmd_timeout)
+
+            return process.returncode
+        finally:
+            for task in pending:
+                task.cancel()
+            process.close()
+
+    async def _get_connection(
+        self,
+        key: ConnectionKey,
+        password_getter: Callable[[], str],
+        image_id: Optional[str]
+    ) -> AsyncConnection:
+        # Only one connect per device, other commands wait for it
+        async with self._connect_locks[key]:
+            connection = self._connections.get(key)
+
+            if connection is not None:
+                if connection.conn.is_closed():
+                    logger.debug(
+                        f"SSH connection to {key} is closed, reconnecting")
+                    del self._connections[key]
+                    connection = None
+                elif image_id is not None and connection.image_id != image_id:
+                    # Device was re-imaged since connection was opened
+                    del self._connections[key]
+                    self._close_when_unused(connection)
+                    connection = None
+
+            if connection is None:
+                connection = await self._connect(key, password_getter, image_id)
+                self._connections[key] = connection
+
+            return connection
+
+    async def _connect(
+        self,
+        key: ConnectionKey,
+        password_getter: Callable[[], str],
+        image_id: Optional[str]
+    ) -> AsyncConnection:
+        hostname, port, username, _ = key
+
+        # Password getter uses blocking redis and subprocess calls
+        password = await asyncio.get_running_loop().run_in_executor(None, password_getter)
+
+        conn = await asyncssh.connect(
+            hostname, port=port, username=username, password=password,
+            known_hosts=None, client_keys=None,
+            keepalive_interval=self.keepalive_s or None)
+
+        return AsyncConnection(
+            conn=conn,
+            image_id=image_id,
+            sessions=asyncio.Semaphore(self.sessions_per_host)
+        )
+
+    def _close_when_unused(self, connection: AsyncConnection) -> None:
+        async def close() -> None:
+            while connection.active:
+                await asyncio.sleep(WATCHDOG_INTERVAL_S)
+            connection.conn.close()
+
+        asyncio.get_running_loop().create_task(close())
+
+    async def _evict_idle(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.idle_timeout_s, 60))
+
+            expire_before = time.monotonic() - self.idle_timeout_s
+
+            for key, connection in list(self._connections.items()):
+                if not connection.active and connection.last_used < expire_before:
+                    del self._connections[key]
+                    connection.conn.close()
+
+    async def _close_connections(self) -> None:
+        self._evict_task.cancel()
+
+        for connection in self._connections.values():
+            connection.conn.close()
+        self._connections.clear()
+
+
+async_ssh_executor = AsyncSshExecutor(
+    max_sessions=server_settings.SSH_SETTINGS.ASYNC_MAX_SESSIONS,
+    sessions_per_host=server_settings.SSH_SETTINGS.ASYNC_SESSIONS_PER_HOST,
+    idle_timeout_s=server_settings.SSH_SETTINGS.POOL_IDLE_TIMEOUT_S,
+    keepalive_s=server_settings.SSH_SETTINGS.POOL_KEEPALIVE_S
+)
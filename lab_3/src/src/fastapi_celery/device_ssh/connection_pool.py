@@ -0,0 +1,306 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import paramiko
+from celery.utils.log import get_task_logger
+from redis.exceptions import RedisError
+
+from ..config import server_settings
+from ..enums import ImageType
+from ..exceptions import SshPoolExhaustedError
+from ..redis_client import redis_client
+
+logger = get_task_logger("SshConnectionPool")
+
+# (ip, port, username, image type)
+PoolKey = Tuple[str, int, str, str]
+
+POOL_STATS_KEY = "ssh_pool:stats"
+
+
+@dataclass
+class PooledConnection:
+    key: PoolKey
+    client: paramiko.SSHClient
+    image_id: Optional[str]
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SshConnectionPool:
+    """
+    Worker-side pool of authenticated SSH connections.
+
+    Connections are keyed by (ip, port, username, image type) and reused
+    between tasks, so a command costs one channel open instead of a full
+    TCP connect, key exchange and password authentication.
+    """
+
+    def __init__(self, idle_timeout_s: float, max_per_host: int, acquire_timeout_s: float, keepalive_s: int):
+        self.idle_timeout_s = idle_timeout_s
+        self.max_per_host = max_per_host
+        self.acquire_timeout_s = acquire_timeout_s
+        self.keepalive_s = keepalive_s
+
+        self._idle: Dict[PoolKey, List[PooledConnection]] = defaultdict(list)
+        # Open connections (idle and checked out) per host ip
+        self._host_count: Dict[str, int] = defaultdict(int)
+        self._cond = threading.Condition()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @contextmanager
+    def connection(
+        self,
+        hostname: str,
+        port: int,
+        username: str,
+        image_type: ImageType,
+        password_getter: Callable[[], str],
+        image_id: Optional[str] = None
+    ) -> Iterator[paramiko.SSHClient]:
+        """
+        Checks out a connection for the duration of the block.
+
+        Password is requested only when a new connection has to be opened.
+        Connection is returned to the pool if it is still alive afterwards.
+        """
+        key: PoolKey = (hostname, port, str(username), str(image_type))
+        pooled = self._acquire(key, password_getter, image_id)
+
+        try:
+            yield pooled.client
+        finally:
+            if self._is_alive(pooled.client):
+                self._release(pooled)
+            else:
+                self._discard(pooled)
+
+    def invalidate(self, key: PoolKey) -> None:
+        """Closes idle connections with given key (e.g. credentials are no longer valid)."""
+        with self._cond:
+            entries = self._idle.pop(key, [])
+            for entry in entries:
+                self._close_locked(entry)
+            self._cond.notify_all()
+
+        if entries:
+            logger.info(f"Invalidated {len(entries)} SSH connection(s) for {key}")
+
+    def invalidate_host(self, hostname: str) -> None:
+        """Closes all idle connections to host (e.g. device was re-imaged)."""
+        with self._cond:
+            keys = [key for key in self._idle if key[0] == hostname]
+        for key in keys:
+            self.invalidate(key)
+
+    def close_all(self) -> None:
+        with self._cond:
+            for entries in self._idle.values():
+                for entry in entries:
+                    self._close_locked(entry)
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Stats of connection pool in current process."""
+        with self._cond:
+            idle = sum(len(entries) for entries in self._idle.values())
+            open_connections = sum(self._host_count.values())
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "idle": idle,
+            "open": open_connections
+        }
+
+    def _acquire(self, key: PoolKey, password_getter: Callable[[], str], image_id: Optional[str]) -> PooledConnection:
+        deadline = time.monotonic() + self.acquire_timeout_s
+
+        while True:
+            pooled = self._checkout(key, image_id, deadline)
+
+            if pooled is None:
+                # Slot for new connection is reserved in _checkout
+                self._record("misses")
+                return self._open(key, password_getter, image_id)
+
+            if self._is_alive(pooled.client):
+                self._record("hits")
+                return pooled
+
+            logger.debug(f"Pooled SSH connection to {key} is dead, dropping it")
+            self._discard(pooled)
+
+    def _checkout(self, key: PoolKey, image_id: Optional[str], deadline: float) -> Optional[PooledConnection]:
+        """Returns idle connection or None if slot for a new one was reserved."""
+        hostname = key[0]
+        evicted = 0
+
+        try:
+            with self._cond:
+                while True:
+                    evicted += self._evict_expired_locked()
+
+                    entries = self._idle.get(key)
+                    while entries:
+                        pooled = entries.pop()
+                        if image_id is not None and pooled.image_id != image_id:
+                            # Device was re-imaged since connection was opened
+                            self._close_locked(pooled)
+                            continue
+                        return pooled
+
+                    if self._host_count[hostname] < self.max_per_host:
+                        self._host_count[hostname] += 1
+                        return None
+
+                    # Host is at its cap: drop idle connection with another key to free a slot
+                    if self._close_foreign_idle_locked(hostname):
+                        continue
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise SshPoolExhaustedError(
+                            f"No SSH connection to {hostname} became free in {self.acquire_timeout_s} s. "
+                            f"Max connections per host: {self.max_per_host}")
+
+                    self._cond.wait(remaining)
+        finally:
+            # Stats are recorded after lock is released, so pool never waits for redis
+            if evicted:
+                self._record("evictions", evicted)
+
+    def _open(self, key: PoolKey, password_getter: Callable[[], str], image_id: Optional[str]) -> PooledConnection:
+        hostname, port, username, _ = key
+
+        try:
+            password = password_getter()
+
+            ssh_client = paramiko.SSHClient()
+            ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            ssh_client.connect(hostname=hostname, port=port,
+                               username=username, password=password)
+
+            if self.keepalive_s:
+                ssh_client.get_transport().set_keepalive(self.keepalive_s)
+        except paramiko.AuthenticationException:
+            self._free_slot(hostname)
+            self.invalidate(key)
+            raise
+        except BaseException:
+            self._free_slot(hostname)
+            raise
+
+        return PooledConnection(key=key, client=ssh_client, image_id=image_id)
+
+    def _release(self, pooled: PooledConnection) -> None:
+        pooled.last_used = time.monotonic()
+
+        with self._cond:
+            self._idle[pooled.key].append(pooled)
+            evicted = self._evict_expired_locked()
+            self._cond.notify()
+
+        if evicted:
+            self._record("evictions", evicted)
+
+    def _discard(self, pooled: PooledConnection) -> None:
+        with self._cond:
+            self._close_locked(pooled)
+            self._cond.notify()
+
+    def _free_slot(self, hostname: str) -> None:
+        with self._cond:
+            self._host_count[hostname] -= 1
+            self._cond.notify()
+
+    def _close_locked(self, pooled: PooledConnection) -> None:
+        try:
+            pooled.client.close()
+        except Exception as exc:
+            logger.debug(f"Error while closing SSH connection to {pooled.key}: {exc}")
+
+        self._host_count[pooled.key[0]] -= 1
+
+    def _close_foreign_idle_locked(self, hostname: str) -> bool:
+        oldest: Optional[PooledConnection] = None
+
+        for key, entries in self._idle.items():
+            if key[0] != hostname or not entries:
+                continue
+            if oldest is None or entries[0].last_used < oldest.last_used:
+                oldest = entries[0]
+
+        if oldest is None:
+            return False
+
+        self._idle[oldest.key].remove(oldest)
+        self._close_locked(oldest)
+        return True
+
+    def _evict_expired_locked(self) -> int:
+        """Closes connections idle longer than idle timeout, returns their amount."""
+        expire_before = time.monotonic() - self.idle_timeout_s
+        evicted = 0
+
+        for key in list(self._idle):
+            entries = self._idle[key]
+            alive = [entry for entry in entries if entry.last_used >= expire_before]
+
+            for entry in entries:
+                if entry.last_used < expire_before:
+                    self._close_locked(entry)
+                    evicted += 1
+
+            if alive:
+                self._idle[key] = alive
+            else:
+                del self._idle[key]
+
+        return evicted
+
+    @staticmethod
+    def _is_alive(ssh_client: paramiko.SSHClient) -> bool:
+        transport = ssh_client.get_transport()
+
+        if transport is None or not transport.is_active():
+            return False
+
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+
+        return True
+
+    def _record(self, counter: str, amount: int = 1) -> None:
+        setattr(self, counter, getattr(self, counter) + amount)
+
+        # Counters are shared between worker processes through redis
+        try:
+            redis_client.hincrby(POOL_STATS_KEY, counter, amount)
+        except RedisError as exc:
+            logger.debug(f"Failed to record SSH pool stats: {exc}")
+
+
+def get_pool_stats() -> Dict[str, int]:
+    """Aggregated stats of SSH connection pools of all ssh workers."""
+    raw_stats = redis_client.hgetall(POOL_STATS_KEY)
+
+    return {name.decode(): int(value) for name, value in raw_stats.items()}
+
+
+ssh_pool = SshConnectionPool(
+    idle_timeout_s=server_settings.SSH_SETTINGS.POOL_IDLE_TIMEOUT_S,
+    max_per_host=server_settings.SSH_SETTINGS.POOL_MAX_PER_HOST,
+    acquire_timeout_s=server_settings.SSH_SETTINGS.POOL_ACQUIRE_TIMEOUT_S,
+    keepalive_s=server_settings.SSH_SETTINGS.POOL_KEEPALIVE_S
+)
@@ -0,0 +1,138 @@
+import gzip
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+from celery.utils.log import get_task_logger
+
+from ..config import server_settings
+from ..enums import SshCaptureMode
+from ..exceptions import SshArtifactNotFoundError
+
+logger = get_task_logger("SshOutputCapture")
+
+TRUNCATION_MARKER = "\n...[{skipped} bytes truncated]...\n"
+
+
+def get_artifact_path(artifact_id: str, stream_name: str) -> Path:
+    # Artifact ID is always UUID, it also protects from path traversal
+    try:
+        artifact_id = str(uuid.UUID(artifact_id))
+    except ValueError:
+        raise SshArtifactNotFoundError(
+            f"Invalid artifact ID: '{artifact_id}'")
+
+    return Path(server_settings.SSH_SETTINGS.ARTIFACTS_FOLDER_PATH) / f"{artifact_id}.{stream_name}.gz"
+
+
+def remove_expired_artifacts() -> None:
+    folder = Path(server_settings.SSH_SETTINGS.ARTIFACTS_FOLDER_PATH)
+    expire_before = time.time() - server_settings.SSH_SETTINGS.ARTIFACTS_TTL_S
+
+    for artifact_path in folder.glob("*.gz"):
+        try:
+            if artifact_path.stat().st_mtime < expire_before:
+                artifact_path.unlink()
+        except OSError as exc:
+            logger.debug(
+                f"Failed to remove expired artifact {artifact_path}: {exc}")
+
+
+class OutputCapture:
+    """
+    Captures output stream of command with bounded memory usage.
+
+    Without `cap_bytes` whole output is kept in memory. Otherwise only head
+    and tail of output (`cap_bytes` in total) are kept, and once output
+    exceeds the cap it is fully written to compressed artifact file.
+    """
+
+    def __init__(self, cap_bytes: Optional[int] = None, artifact_path: Optional[Path] = None):
+        self.cap_bytes = cap_bytes
+        self.artifact_path = artifact_path
+        self.total_bytes = 0
+
+        self._head_size = cap_bytes // 2 if cap_bytes else None
+        self._tail_size = cap_bytes - self._head_size if cap_bytes else None
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._artifact: Optional[gzip.GzipFile] = None
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_bytes > len(self._head) + len(self._tail)
+
+    @property
+    def spilled(self) -> bool:
+        return self._artifact is not None
+
+    def write(self, data: bytes) -> None:
+        if self.cap_bytes is None:
+            self._head += data
+            self.total_bytes += len(data)
+            return
+
+        if self._artifact is None and self.artifact_path is not None \
+                and self.total_bytes + len(data) > self.cap_bytes:
+            # Nothing was dropped yet, buffers hold all previous output
+            self._open_artifact()
+
+        if self._artifact is not None:
+            self._artifact.write(data)
+
+        self.total_bytes += len(data)
+
+        head_free = self._head_size - len(self._head)
+        if head_free > 0:
+            self._head += data[:head_free]
+            data = data[head_free:]
+
+        self._tail += data
+        if len(self._tail) > self._tail_size:
+            del self._tail[:len(self._tail) - self._tail_size]
+
+    def getvalue(self) -> str:
+        if not self.truncated:
+            return (self._head + self._tail).decode(errors="ignore")
+
+        skipped = self.total_bytes - len(self._head) - len(self._tail)
+
+        return self._head.decode(errors="ignore") \
+            + TRUNCATION_MARKER.format(skipped=skipped) \
+            + self._tail.decode(errors="ignore")
+
+    def close(self) -> None:
+        if self._artifact is not None:
+            self._artifact.close()
+
+    def _open_artifact(self) -> None:
+        try:
+            self.artifact_path.parent.mkdir(parents=True, exist_ok=True)
+            remove_expired_artifacts()
+
+            self._artifact = gzip.open(self.artifact_path, "wb", compresslevel=1)
+            self._artifact.write(self._head)
+            self._artifact.write(self._tail)
+        except OSError as exc:
+            logger.warning(
+                f"Failed to create output artifact {self.artifact_path}, output will be truncated. Exception: {exc}")
+            self._artifact = None
+            self.artifact_path = None
+
+
+def create_captures(
+        capture_mode: SshCaptureMode,
+        cap_bytes: Optional[int],
+        artifact_id: str
+) -> Tuple[OutputCapture, OutputCapture]:
+    """Returns captures for stdout and stderr of command."""
+    if capture_mode != SshCaptureMode.BOUNDED:
+        return OutputCapture(), OutputCapture()
+
+    cap_bytes = cap_bytes or server_settings.SSH_SETTINGS.OUTPUT_CAP_BYTES
+
+    return (
+        OutputCapture(cap_bytes, get_artifact_path(artifact_id, "stdout")),
+        OutputCapture(cap_bytes, get_artifact_path(artifact_id, "stderr"))
+    )
@@ -0,0 +1,122 @@
+import asyncio
+import codecs
+import json
+from typing import AsyncIterator, Dict, Optional
+
+from celery.result import AsyncResult
+from celery.utils.log import get_task_logger
+from redis.exceptions import RedisError
+
+from ..config import server_settings
+from ..redis_client import async_redis_client, redis_client
+from .worker import ssh_worker
+
+logger = get_task_logger("SshOutputStream")
+
+OUTPUT_STREAM_KEY = "ssh_output:{task_id}"
+EOF_EVENT = "eof"
+TRUNCATED_EVENT = "truncated"
+
+KEEPALIVE_INTERVAL_MS: int = 15000
+
+
+class OutputStreamPublisher:
+    """
+    Publishes output of running command to redis stream of the task.
+
+    Stream entry IDs are used by clients as offsets to resume reading.
+    No more than `cap_bytes` of every output stream are published, the
+    rest is replaced with single truncated event.
+    Publishing errors are logged and never break command execution.
+    """
+
+    def __init__(self, task_id: str, cap_bytes: Optional[int] = None):
+        self.key = OUTPUT_STREAM_KEY.format(task_id=task_id)
+        self.expire_s = ssh_worker.conf.result_expires
+        self.cap_bytes = cap_bytes or server_settings.SSH_SETTINGS.OUTPUT_STREAM_CAP_BYTES
+        self.enabled = True
+        self._published = {"stdout": 0, "stderr": 0}
+        # Multibyte characters can be split between chunks
+        self._decoders = {
+            stream_name: codecs.getincrementaldecoder("utf-8")(errors="ignore")
+            for stream_name in ("stdout", "stderr")
+        }
+
+    def publish(self, stream_name: str, data: bytes) -> None:
+        free = self.cap_bytes - self._published[stream_name]
+        if free < 0:
+            return
+
+        if len(data) > free:
+            text = self._decoders[stream_name].decode(data[:free], final=True)
+        else:
+            text = self._decoders[stream_name].decode(data)
+        self._published[stream_name] += len(data)
+
+        if text:
+            self._add({"event": stream_name, "data": text})
+
+        if self._published[stream_name] > self.cap_bytes:
+            self._add({"event": TRUNCATED_EVENT, "stream": stream_name})
+
+    def close(self, retcode: Optional[int]) -> None:
+        self._add({"event": EOF_EVENT,
+                   "retcode": "" if retcode is None else str(retcode)})
+
+    def _add(self, fields: Dict[str, str]) -> None:
+        if not self.enabled:
+            return
+
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            pipeline.xadd(self.key, fields)
+            pipeline.expire(self.key, self.expire_s)
+            pipeline.execute()
+        except RedisError as exc:
+            logger.warning(
+                f"Failed to publish output to {self.key}, streaming disabled. Exception: {str(exc)}")
+            self.enabled = False
+
+
+def format_event(event_id: str, event: str, payload: dict) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+async def read_output_events(task_id: str, offset: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Yields Server-Sent Events with output of the task starting after `offset`.
+
+    Generator ends after the end of output was read or
+    if task is finished and has no output stream (e.g. it expired).
+    """
+    key = OUTPUT_STREAM_KEY.format(task_id=task_id)
+    last_id = offset or "0-0"
+
+    while True:
+        response = await async_redis_client.xread(
+            {key: last_id}, count=100, block=KEEPALIVE_INTERVAL_MS)
+
+        if not response:
+            if not await async_redis_client.exists(key):
+                task = AsyncResult(task_id, app=ssh_worker)
+                if await asyncio.to_thread(task.ready):
+                    return
+
+            yield ": keep-alive\n\n"
+            continue
+
+        for _, entries in response:
+            for entry_id, fields in entries:
+                last_id = entry_id.decode()
+                event = fields[b"event"].decode()
+
+                if event == EOF_EVENT:
+                    retcode = fields[b"retcode"].decode()
+                    yield format_event(last_id, event, {"retcode": int(retcode) if retcode else None})
+                    return
+
+                if event == TRUNCATED_EVENT:
+                    yield format_event(last_id, event, {"stream": fields[b"stream"].decode()})
+                    continue
+
+                yield format_event(last_id, event, {"data": fields[b"data"].decode()})
@@ -0,0 +1,82 @@
+import hashlib
+import json
+from typing import Optional, Tuple
+
+from celery.utils.log import get_task_logger
+from redis.exceptions import RedisError
+
+from ..database import SessionLocal
+from ..device_data.schemas import DeviceSchema
+from ..device_data.service import get_device
+from ..exceptions import DeviceNotFoundError
+from ..redis_client import redis_client
+from .schemas import SshResult
+
+logger = get_task_logger("SshResultCache")
+
+# Image and test stage are parts of the key, so results cached before
+# re-imaging or change of test stage are never read and expire by TTL
+RESULT_CACHE_KEY = "ssh_cache:{hostname}:{image_id}:{test_stage}:{username}:{digest}"
+
+
+def get_cache_key(device: DeviceSchema, username: str, command: str) -> str:
+    digest = hashlib.sha256(command.encode()).hexdigest()
+
+    return RESULT_CACHE_KEY.format(
+        hostname=device.hostname,
+        image_id=device.image_id,
+        test_stage=device.test_stage,
+        username=username,
+        digest=digest
+    )
+
+
+def get_cached_result(cache_key: str) -> Optional[Tuple[SshResult, int]]:
+    """Returns cached result and seconds until it expires, None on miss."""
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.get(cache_key)
+        pipeline.ttl(cache_key)
+        raw_result, ttl = pipeline.execute()
+    except RedisError as exc:
+        logger.warning(
+            f"Failed to read cached SSH result {cache_key}: {str(exc)}")
+        return None
+
+    if raw_result is None:
+        return None
+
+    return SshResult(**json.loads(raw_result)), max(ttl, 0)
+
+
+def cache_result(hostname: str, username: str, command: str, image_id: str,
+                 result: SshResult, ttl_s: int) -> None:
+    """
+    Caches only complete results of successful commands.
+
+    Key is computed from device state after command was executed.
+    Result isn't cached if device was re-imaged after command was queued
+    with `image_id`, as it's unknown which image the output came from.
+    """
+    if result.retcode != 0 or result.truncated:
+        return
+
+    db = SessionLocal()
+    try:
+        device = get_device(db, hostname)
+    except DeviceNotFoundError:
+        return
+    finally:
+        db.close()
+
+    if device.image_id != image_id:
+        logger.info(
+            f"SSH result of {hostname} is not cached, image changed from {image_id} to {device.image_id}")
+        return
+
+    cache_key = get_cache_key(device, username, command)
+    try:
+        redis_client.set(cache_key, result.model_dump_json(), ex=ttl_s)
+    except RedisError as exc:
+        logger.warning(
+            f"Failed to cache SSH result {cache_key}: {str(exc)}")
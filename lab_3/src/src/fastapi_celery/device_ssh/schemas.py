@@ -1,7 +1,9 @@
 from pathlib import Path
-from typing import Optional, Union
+from typing import List, Optional, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, computed_field, model_validator
+
+from ..enums import SshUser
 
 #########################
 # --- Queue Request --- #
@@ -19,6 +21,42 @@ class SshRequest(BaseModel):
     retry_timeout: int = Field(default=5)
     cmd_timeout: int = Field(default=5)
 
+
+class SshBatchStep(BaseModel):
+    cmd: str
+    cmd_timeout: int = Field(default=5, gt=0)
+
+
+class SshBatchRequest(BaseModel):
+    hostname: str
+    username: SshUser
+    steps: List[SshBatchStep] = Field(min_length=1)
+    stop_on_error: bool = Field(default=True)
+
+
+class SshFanoutRequest(BaseModel):
+    cmd: str
+    username: SshUser
+    reservation_id: Optional[str] = Field(default=None)
+    hostnames: Optional[List[str]] = Field(default=None, min_length=1)
+    concurrency: Optional[int] = Field(default=None, gt=0)
+    cmd_timeout: int = Field(default=5, gt=0)
+
+    @model_validator(mode="after")
+    def check_targets(self):
+        if (self.reservation_id is None) == (self.hostnames is None):
+            raise ValueError(
+                "Exactly one of 'reservation_id' or 'hostnames' must be specified")
+        return self
+
+
+class SftpDownloadRequest(BaseModel):
+    hostname: str
+    username: SshUser
+    remote_path: str
+    resume: bool = Field(
+        default=True, description="Continue interrupted download when task is retried")
+
 ##########################
 # --- Queue Response --- #
 ##########################
@@ -28,6 +66,7 @@ class SshQueuedResponse(BaseModel):
     id: str
     location: Union[Path, str]
 
+
 #########################
 # --- Worker Result --- #
 #########################
@@ -38,6 +77,28 @@ class SshResult(BaseModel):
     stderr: Optional[str]
     retcode: Optional[int]
     execution_time_s: Optional[float]
+    truncated: bool = Field(default=False)
+    total_bytes: Optional[int] = Field(default=None)
+    artifact_id: Optional[str] = Field(
+        default=None, description="ID to download full output of truncated command")
+
+
+class SshBatchResult(BaseModel):
+    steps: List[SshResult]
+    failed_step: Optional[int]
+    execution_time_s: Optional[float]
+    commands_time_s: Optional[float]
+
+
+class SftpResult(BaseModel):
+    remote_path: str
+    size_bytes: int
+    transferred_bytes: int
+    resumed_from: int
+    sha256: str
+    verified: bool = Field(
+        description="Checksum was compared with checksum calculated on device")
+    execution_time_s: Optional[float]
 
 ###############################
 # --- Task State Response --- #
@@ -49,3 +110,51 @@ class SshTaskResponse(BaseModel):
     status: str
     meta: Optional[dict]
     result: Optional[SshResult]
+
+
+class SshBatchTaskResponse(BaseModel):
+    id: str
+    status: str
+    meta: Optional[dict]
+    result: Optional[SshBatchResult]
+
+
+class SshCachedResponse(BaseModel):
+    result: SshResult
+    expires_in_s: int
+
+
+class SftpTaskResponse(BaseModel):
+    id: str
+    status: str
+    meta: Optional[dict]
+    result: Optional[SftpResult]
+
+
+class SshFanoutDeviceResponse(SshTaskResponse):
+    hostname: str
+
+
+class SshFanoutTaskResponse(BaseModel):
+    id: str
+    status: str
+    completed: int
+    total: int
+    devices: List[SshFanoutDeviceResponse]
+
+
+###############################
+# --- Pool Stats Response --- #
+###############################
+
+
+class SshPoolStatsResponse(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+
+    @computed_field
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,148 @@
+import json
+import uuid
+from typing import List, Tuple
+
+from celery import Signature, group, states
+from celery.result import AsyncResult, GroupResult
+from sqlalchemy.orm import Session
+
+from ..config import server_settings
+from ..device_data.schemas import DeviceSchema
+from ..device_data.service import get_device
+from ..device_reserve.service import get_reservation_devices
+from ..exceptions import (DeviceHasNoImageError, DeviceNotFoundError,
+                          SshFanoutNotFoundError)
+from ..images.schemas import ImageSchema
+from ..images.service import get_image
+from ..redis_client import redis_client
+from ..task_status import get_task_meta
+from .schemas import (SshFanoutDeviceResponse, SshFanoutRequest,
+                      SshFanoutTaskResponse, SshResult)
+from .tasks import (FANOUT_PENDING_KEY, ssh_worker, task_ssh,
+                    task_ssh_fanout_next)
+
+FANOUT_HOSTNAMES_KEY = "ssh_fanout:{group_id}:hostnames"
+
+
+def get_device_with_image(db: Session, hostname: str) -> Tuple[DeviceSchema, ImageSchema]:
+    """Returns device and image installed on it, image defines SSH credentials."""
+    device: DeviceSchema = get_device(db=db, hostname=hostname)
+
+    if device.image_id is None:
+        raise DeviceHasNoImageError(
+            "You must upload image for device before using ssh command.")
+
+    image: ImageSchema = get_image(db, device.image_id)
+
+    return device, image
+
+
+def create_fanout(db: Session, request: SshFanoutRequest) -> str:
+    """
+    Dispatches command to every requested device, returns group ID.
+
+    The first `concurrency` tasks are sent at once, the rest wait in
+    redis. Every finished task sends the next pending one, so no more than
+    `concurrency` tasks of the group are executed at once and a slow or
+    failed device doesn't hold up the others.
+    """
+    if request.reservation_id is not None:
+        hostnames = [device.hostname for device in get_reservation_devices(
+            db, request.reservation_id)]
+    else:
+        hostnames = request.hostnames
+
+    if not hostnames:
+        raise DeviceNotFoundError(
+            "No devices found to execute command on")
+
+    group_id = str(uuid.uuid4())
+    concurrency = request.concurrency or server_settings.SSH_SETTINGS.FANOUT_CONCURRENCY
+    next_task = task_ssh_fanout_next.si(group_id)
+    signatures: List[Signature] = []
+
+    for hostname in hostnames:
+        device, image = get_device_with_image(db, hostname)
+
+        signature = task_ssh.si(
+            command=request.cmd,
+            hostname=device.ip,
+            username=request.username,
+            device_type=device.type,
+            image_type=image.type,
+            cmd_timeout=request.cmd_timeout,
+            image_id=image.id
+        ).set(task_id=str(uuid.uuid4()))
+        signature.link(next_task)
+        signature.link_error(next_task)
+
+        signatures.append(signature)
+
+    group_result = GroupResult(
+        group_id, [AsyncResult(signature.id, app=ssh_worker) for signature in signatures], app=ssh_worker)
+    group_result.save()
+
+    expire_s = ssh_worker.conf.result_expires
+    redis_client.set(FANOUT_HOSTNAMES_KEY.format(group_id=group_id),
+                     json.dumps(hostnames), ex=expire_s)
+
+    # Pending tasks are stored before the first ones are sent, so none of them is missed
+    pending = signatures[concurrency:]
+    if pending:
+        pending_key = FANOUT_PENDING_KEY.format(group_id=group_id)
+        pipeline = redis_client.pipeline()
+        pipeline.rpush(pending_key, *[json.dumps(signature) for signature in pending])
+        pipeline.expire(pending_key, expire_s)
+        pipeline.execute()
+
+    group(signatures[:concurrency]).apply_async()
+
+    return group_id
+
+
+def get_fanout_status(group_id: str) -> SshFanoutTaskResponse:
+    group_result: GroupResult = GroupResult.restore(group_id, app=ssh_worker)
+    hostnames = redis_client.get(FANOUT_HOSTNAMES_KEY.format(group_id=group_id))
+
+    if group_result is None or hostnames is None:
+        raise SshFanoutNotFoundError(
+            f"Fan-out group with ID {group_id} not found")
+
+    devices: List[SshFanoutDeviceResponse] = []
+    completed = 0
+
+    for hostname, task_result in zip(json.loads(hostnames), group_result.results):
+        device_response = SshFanoutDeviceResponse(
+            id=task_result.id,
+            hostname=hostname,
+            status=task_result.state,
+            meta=None,
+            result=None
+        )
+
+        if task_result.state in states.READY_STATES:
+            completed += 1
+
+        if task_result.state == states.SUCCESS and task_result.result is not None:
+            device_response.result = SshResult(**task_result.result)
+        else:
+            device_response.meta = get_task_meta(task_result)
+
+        devices.append(device_response)
+
+    if all(device.status == states.PENDING for device in devices):
+        status = states.PENDING
+    elif completed < len(devices):
+        status = states.STARTED
+    elif all(device.status == states.SUCCESS for device in devices):
+        status = states.SUCCESS
+    else:
+        status = states.FAILURE
+
+    return SshFanoutTaskResponse(
+        id=group_id,
+        status=status,
+        completed=completed,
+        total=len(devices),
+        devices=devices
+    )
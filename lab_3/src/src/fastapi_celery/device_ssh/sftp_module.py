@@ -0,0 +1,264 @@
+import hashlib
+import os
+import shlex
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+
+import paramiko
+from celery.utils.log import get_task_logger
+
+from ..config import server_settings
+from ..exceptions import SftpChecksumMismatchError, SftpFileNotFoundError
+from .ssh_module import execute_command
+
+logger = get_task_logger("SftpModule")
+
+PARTIAL_SUFFIX = ".part"
+HASH_COMMAND_TIMEOUT_S: int = 60
+
+# Called with amount of transferred bytes and total size of file
+ProgressCallback = Callable[[int, int], None]
+
+
+def get_transfer_path(transfer_id: str, suffix: str = "") -> Path:
+    # Transfer ID is always UUID, it also protects from path traversal
+    try:
+        transfer_id = str(uuid.UUID(transfer_id))
+    except ValueError:
+        raise SftpFileNotFoundError(
+            f"Invalid transfer ID: '{transfer_id}'")
+
+    return Path(server_settings.SSH_SETTINGS.TRANSFER_FOLDER_PATH) / f"{transfer_id}{suffix}"
+
+
+def get_download_partial_path(transfer_id: str) -> Path:
+    """Partial file belongs to download task, so only retries of the task resume it."""
+    return get_transfer_path(transfer_id, PARTIAL_SUFFIX)
+
+
+def remove_expired_transfers() -> None:
+    folder = Path(server_settings.SSH_SETTINGS.TRANSFER_FOLDER_PATH)
+    expire_before = time.time() - server_settings.SSH_SETTINGS.TRANSFER_TTL_S
+
+    for transfer_path in folder.glob("*"):
+        try:
+            if transfer_path.stat().st_mtime < expire_before:
+                transfer_path.unlink()
+        except OSError as exc:
+            logger.debug(
+                f"Failed to remove expired transfer {transfer_path}: {exc}")
+
+
+def hash_file_prefix(path: str, size: int, chunk_size: int) -> "hashlib._Hash":
+    """Returns sha256 object fed with first `size` bytes of local file."""
+    sha256 = hashlib.sha256()
+
+    if size == 0:
+        return sha256
+
+    with open(path, "rb") as local_file:
+        remaining = size
+        while remaining > 0:
+            data = local_file.read(min(chunk_size, remaining))
+            if not data:
+                break
+            sha256.update(data)
+            remaining -= len(data)
+
+    return sha256
+
+
+def get_remote_sha256(ssh_client: paramiko.SSHClient, remote_path: str) -> Optional[str]:
+    """Returns sha256 of remote file, None if device can't calculate it."""
+    result = execute_command(
+        ssh_client, f"sha256sum {shlex.quote(remote_path)}", HASH_COMMAND_TIMEOUT_S)
+
+    if result.retcode != 0 or not result.stdout:
+        logger.warning(
+            f"Failed to calculate sha256 of {remote_path} on device: {result.stderr}")
+        return None
+
+    return result.stdout.split()[0]
+
+
+def verify_remote_sha256(ssh_client: paramiko.SSHClient, remote_path: str, sha256: str) -> bool:
+    """
+    Compares checksum of remote file with checksum of transferred data.
+
+    Returns False if checksum could not be verified.
+    """
+    remote_sha256 = get_remote_sha256(ssh_client, remote_path)
+
+    if remote_sha256 is None:
+        return False
+
+    if remote_sha256 != sha256:
+        raise SftpChecksumMismatchError(
+            f"Checksum of '{remote_path}' on device {remote_sha256} differs from checksum of transferred data {sha256}")
+
+    return True
+
+
+def get_remote_size(sftp: paramiko.SFTPClient, remote_path: str) -> int:
+    try:
+        return sftp.stat(remote_path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def write_chunks(
+        source: BinaryIO,
+        remote_file: paramiko.SFTPFile,
+        sha256: "hashlib._Hash",
+        transferred: int,
+        size: int,
+        chunk_size: int,
+        on_progress: Optional[ProgressCallback] = None
+) -> int:
+    """Writes source to remote file with pipelined writes, returns amount of transferred bytes."""
+    remote_file.set_pipelined(True)
+
+    while True:
+        data = source.read(chunk_size)
+        if not data:
+            break
+
+        remote_file.write(data)
+        sha256.update(data)
+        transferred += len(data)
+
+        if on_progress is not None:
+            on_progress(transferred, size)
+
+    return transferred
+
+
+def upload_file(
+        ssh_client: paramiko.SSHClient,
+        local_path: str,
+        remote_path: str,
+        resume: bool = True,
+        on_progress: Optional[ProgressCallback] = None
+) -> dict:
+    """
+    Uploads local file to device in fixed-size chunks with pipelined writes.
+
+    Data is written to '<remote_path>.part' which is renamed after
+    the whole file was transferred, so interrupted upload is resumed
+    from the size of partial file.
+    """
+    chunk_size = server_settings.SSH_SETTINGS.SFTP_CHUNK_SIZE
+    size = os.path.getsize(local_path)
+    partial_path = remote_path + PARTIAL_SUFFIX
+
+    with ssh_client.open_sftp() as sftp:
+        offset = get_remote_size(sftp, partial_path) if resume else 0
+        if offset > size:
+            offset = 0
+
+        sha256 = hash_file_prefix(local_path, offset, chunk_size)
+
+        # Writes are sent with explicit offset, append mode is not honoured by every server
+        with open(local_path, "rb") as local_file, \
+                sftp.open(partial_path, "r+b" if offset else "wb", bufsize=chunk_size) as remote_file:
+            local_file.seek(offset)
+            remote_file.seek(offset)
+            write_chunks(local_file, remote_file, sha256,
+                         offset, size, chunk_size, on_progress)
+
+        sftp.posix_rename(partial_path, remote_path)
+
+    return {
+        "size_bytes": size,
+        "resumed_from": offset,
+        "sha256": sha256.hexdigest()
+    }
+
+
+def upload_stream(
+        ssh_client: paramiko.SSHClient,
+        source: BinaryIO,
+        size: int,
+        remote_path: str,
+        on_progress: Optional[ProgressCallback] = None
+) -> dict:
+    """
+    Uploads data read from source, e.g. reader shared with other uploads.
+
+    Source can't be rewound, so upload always starts from the beginning.
+    """
+    chunk_size = server_settings.SSH_SETTINGS.SFTP_CHUNK_SIZE
+    partial_path = remote_path + PARTIAL_SUFFIX
+    sha256 = hashlib.sha256()
+
+    with ssh_client.open_sftp() as sftp:
+        with sftp.open(partial_path, "wb", bufsize=chunk_size) as remote_file:
+            transferred = write_chunks(
+                source, remote_file, sha256, 0, size, chunk_size, on_progress)
+
+        sftp.posix_rename(partial_path, remote_path)
+
+    return {
+        "size_bytes": transferred,
+        "resumed_from": 0,
+        "sha256": sha256.hexdigest()
+    }
+
+
+def download_file(
+        ssh_client: paramiko.SSHClient,
+        remote_path: str,
+        local_path: str,
+        partial_path: Optional[str] = None,
+        resume: bool = True,
+        on_progress: Optional[ProgressCallback] = None
+) -> dict:
+    """
+    Downloads file from device in fixed-size chunks with prefetched reads.
+
+    Data is written to `partial_path` ('<local_path>.part' by default)
+    which is renamed after the whole file was transferred,
+    so interrupted download is resumed from the size of partial file.
+    """
+    chunk_size = server_settings.SSH_SETTINGS.SFTP_CHUNK_SIZE
+    partial_path = partial_path or local_path + PARTIAL_SUFFIX
+
+    with ssh_client.open_sftp() as sftp:
+        size = sftp.stat(remote_path).st_size
+
+        offset = os.path.getsize(partial_path) if resume and os.path.exists(
+            partial_path) else 0
+        if offset > size:
+            offset = 0
+
+        sha256 = hash_file_prefix(partial_path, offset, chunk_size)
+        transferred = offset
+
+        with sftp.open(remote_path, "rb", bufsize=chunk_size) as remote_file, \
+                open(partial_path, "r+b" if offset else "wb") as local_file:
+            remote_file.seek(offset)
+            local_file.seek(offset)
+            remote_file.prefetch(
+                size, max_concurrent_requests=server_settings.SSH_SETTINGS.SFTP_MAX_REQUESTS)
+
+            while transferred < size:
+                data = remote_file.read(min(chunk_size, size - transferred))
+                if not data:
+                    break
+
+                local_file.write(data)
+                sha256.update(data)
+                transferred += len(data)
+
+                if on_progress is not None:
+                    on_progress(transferred, size)
+
+    os.replace(partial_path, local_path)
+
+    return {
+        "size_bytes": transferred,
+        "resumed_from": offset,
+        "sha256": sha256.hexdigest()
+    }
@@ -0,0 +1,114 @@
+import datetime
+import select
+import socket
+import time
+from typing import Callable, Optional
+
+import paramiko
+from celery.utils.log import get_task_logger
+
+from .output_capture import OutputCapture
+from .schemas import SshResult
+
+logger = get_task_logger("SshModule")
+
+READ_CHUNK_SIZE: int = 32768
+# Upper bound for waiting of channel events, channel pipe wakes us up earlier
+POLL_INTERVAL_S: float = 0.1
+
+# Called with stream name ('stdout' or 'stderr') and received bytes
+OutputCallback = Callable[[str, bytes], None]
+
+
+def read_available(
+        channel: paramiko.Channel,
+        output: OutputCapture,
+        error: OutputCapture,
+        on_output: Optional[OutputCallback]
+) -> bool:
+    """Reads already received stdout and stderr data, returns False if there was nothing to read."""
+    received = False
+
+    if channel.recv_ready():
+        data = channel.recv(READ_CHUNK_SIZE)
+        output.write(data)
+        received = True
+        if on_output is not None:
+            on_output("stdout", data)
+
+    if channel.recv_stderr_ready():
+        data = channel.recv_stderr(READ_CHUNK_SIZE)
+        error.write(data)
+        received = True
+        if on_output is not None:
+            on_output("stderr", data)
+
+    return received
+
+
+def execute_command(
+        ssh_client: paramiko.SSHClient,
+        command: str,
+        cmd_timeout: int,
+        on_output: Optional[OutputCallback] = None,
+        output: Optional[OutputCapture] = None,
+        error: Optional[OutputCapture] = None
+) -> SshResult:
+    """
+    Executes command on a new channel of already opened connection.
+
+    Output is read as soon as it arrives and passed to `on_output`.
+    By default whole output is kept in memory, pass bounded captures
+    to limit size of the result.
+    socket.timeout is raised if command does not print anything
+    and does not exit for `cmd_timeout` seconds.
+    """
+    output = output if output is not None else OutputCapture()
+    error = error if error is not None else OutputCapture()
+
+    start_time = datetime.datetime.now()
+
+    channel = ssh_client.get_transport().open_session(timeout=cmd_timeout)
+
+    try:
+        channel.exec_command(command)
+
+        last_activity = time.monotonic()
+
+        while True:
+            if read_available(channel, output, error, on_output):
+                last_activity = time.monotonic()
+                continue
+
+            if channel.exit_status_ready() or channel.closed:
+                # Output sent right before exit could arrive after last read
+                while read_available(channel, output, error, on_output):
+                    pass
+                break
+
+            if time.monotonic() - last_activity > cmd_timeout:
+                raise socket.timeout(
+                    f"Command did not respond for {cmd_timeout} s")
+
+            select.select([channel], [], [], POLL_INTERVAL_S)
+
+        # Blocking call if command was not finished
+        retcode = channel.recv_exit_status()
+    finally:
+        channel.close()
+        output.close()
+        error.close()
+
+    end_time = datetime.datetime.now()
+    execution_time = (end_time - start_time).total_seconds()
+
+    logger.debug(f"Executed '{command}'. Return code: {retcode}")
+
+    return SshResult(
+        stdout=output.getvalue(),
+        stderr=error.getvalue(),
+        retcode=retcode,
+        execution_time_s=execution_time,
+        truncated=output.truncated or error.truncated,
+        total_bytes=output.total_bytes + error.total_bytes
+    )
@@ -1,14 +1,21 @@
 import subprocess
 
 from celery.utils.log import get_task_logger
+from redis.exceptions import LockError, RedisError
 
 from ..config import server_settings
 from ..enums import DeviceType
 from ..exceptions import ReceivingPasswordError
 from ..enums import ImageType, SshUser
+from ..redis_client import redis_client
 
 logger = get_task_logger("SshTask")
 
+UPLOADER_TIMEOUT_S: int = 15
+
+PASSWORD_CACHE_KEY = "ssh_password:{device_type}"
+PASSWORD_LOCK_KEY = "ssh_password:lock:{device_type}"
+
 
 def get_password(user: str, image_type: ImageType, device_type: DeviceType) -> str:
     if user == SshUser.ROOT:
@@ -16,22 +23,85 @@ def get_password(user: str, image_type: ImageType, device_type: DeviceType) -> s
             return server_settings.SSH_SETTINGS.DEV_PASSWORD
 
         if image_type == ImageType.RELEASE:
-            return get_release_password(device_type)
+            return get_cached_release_password(device_type)
 
         raise ReceivingPasswordError(
             f"Don't know password for image of type: {image_type}")
 
 
+def invalidate_password(user: str, image_type: ImageType, device_type: DeviceType) -> None:
+    """Drops cached password, so the next request goes to the password server."""
+    if user == SshUser.ROOT and image_type == ImageType.RELEASE:
+        invalidate_release_password(device_type)
+
+
+def get_cached_release_password(device_type: DeviceType) -> str:
+    """
+    Returns release password from cache shared by all ssh workers.
+
+    On cache miss only one worker calls password uploader for device type,
+    the others wait for lock and read the password it stored.
+    """
+    cache_key = PASSWORD_CACHE_KEY.format(device_type=device_type)
+
+    try:
+        password = redis_client.get(cache_key)
+        if password is not None:
+            return password.decode()
+
+        lock = redis_client.lock(
+            PASSWORD_LOCK_KEY.format(device_type=device_type),
+            timeout=UPLOADER_TIMEOUT_S + 5,
+            blocking_timeout=server_settings.SSH_SETTINGS.PASSWORD_LOCK_TIMEOUT_S
+        )
+
+        if not lock.acquire():
+            raise ReceivingPasswordError(
+                f"Timed out waiting for password of {device_type} requested by another worker")
+
+        try:
+            # Password could be stored while we were waiting for lock
+            password = redis_client.get(cache_key)
+            if password is not None:
+                return password.decode()
+
+            password = get_release_password(device_type)
+
+            redis_client.set(
+                cache_key, password, ex=server_settings.SSH_SETTINGS.PASSWORD_CACHE_TTL_S)
+
+            return password
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                # Lock expired while uploader was running
+                pass
+    except RedisError as exc:
+        logger.warning(
+            f"Password cache is unavailable, requesting password directly. Exception: {str(exc)}")
+        return get_release_password(device_type)
+
+
+def invalidate_release_password(device_type: DeviceType) -> None:
+    try:
+        redis_client.delete(PASSWORD_CACHE_KEY.format(device_type=device_type))
+        logger.info(f"Invalidated cached release password for {device_type}")
+    except RedisError as exc:
+        logger.warning(
+            f"Failed to invalidate cached password for {device_type}. Exception: {str(exc)}")
+
+
 def get_release_password(device_type: DeviceType):
     path: str = server_settings.SSH_SETTINGS.PASSWORD_UPLOADER_BIN_PATH
     request_type: str = server_settings.SSH_SETTINGS.REQUEST_TYPE
-    command = f"{path} {request_type} {device_type}"
+    command = [path, request_type, str(device_type)]
 
-    timeout_s: int = 15
+    timeout_s: int = UPLOADER_TIMEOUT_S
 
     try:
         result = subprocess.run(
-            command, capture_output=True, text=True, shell=True, check=True, timeout=timeout_s)
+            command, capture_output=True, text=True, check=True, timeout=timeout_s)
 
         return result.stdout
     except subprocess.CalledProcessError as exc:
@@ -1,19 +1,78 @@
 import datetime
+import json
+import os
+import socket
+import sys
+import time
+from typing import List
 
+import asyncssh
 import paramiko
 from celery import states
-from celery.exceptions import MaxRetriesExceededError
+from celery.exceptions import Retry
+from celery.signals import worker_process_shutdown, worker_shutdown
 from celery.utils.log import get_task_logger
 from paramiko.ssh_exception import ChannelException, NoValidConnectionsError
 
-from ..enums import ImageType, SshUser, DeviceType
-from ..exceptions import ReceivingPasswordError
+from ..config import server_settings
+from ..enums import ImageType, SshCaptureMode, SshExecutor, SshUser, DeviceType
+from ..exceptions import (ReceivingPasswordError, SftpChecksumMismatchError,
+                          SshPoolExhaustedError)
+from ..redis_client import redis_client
+from .async_executor import async_ssh_executor
+from .connection_pool import ssh_pool
 from .worker import ssh_worker
-from .schemas import SshResult
-from .ssh_password import get_password
+from .schemas import SftpResult, SshBatchResult, SshResult
+from .output_capture import create_captures
+from .output_stream import OutputStreamPublisher
+from .result_cache import cache_result
+from .sftp_module import (download_file, get_download_partial_path,
+                          get_transfer_path, remove_expired_transfers,
+                          upload_file, verify_remote_sha256)
+from .ssh_module import execute_command
+from .ssh_password import get_password, invalidate_password
 
 logger = get_task_logger("SshTask")
 
+# Signatures of fan-out tasks which wait for a free slot of group
+FANOUT_PENDING_KEY = "ssh_fanout:{group_id}:pending"
+
+# Device could not be connected, task can be retried from the start.
+# Exception of the last retry is raised, so task ends in FAILURE state.
+CONNECT_ERRORS = (NoValidConnectionsError, SshPoolExhaustedError,
+                  ReceivingPasswordError)
+# Connection was lost during transfer, the next attempt resumes partial file
+TRANSFER_ERRORS = CONNECT_ERRORS + (paramiko.SSHException, EOFError, socket.timeout)
+
+
+# Connections live in pool child processes with prefork pool
+# and in the main worker process with threads pool
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def close_ssh_pool(**kwargs):
+    ssh_pool.close_all()
+    async_ssh_executor.close()
+
+
+def device_connection(
+        hostname: str,
+        port: int,
+        username: SshUser,
+        device_type: DeviceType,
+        image_type: ImageType,
+        image_id: str = None
+):
+    """Pooled connection to device, password is requested only for a new connection."""
+    return ssh_pool.connection(
+        hostname=hostname,
+        port=port,
+        username=username,
+        image_type=image_type,
+        image_id=image_id,
+        password_getter=lambda: get_password(
+            username, image_type, device_type)
+    )
+
 
 @ssh_worker.task(name="ssh", bind=True, max_retries=3, default_retry_delay=5, queue='ssh_queue')
 def task_ssh(
@@ -24,64 +83,326 @@ def task_ssh(
         device_type: DeviceType,
         image_type: ImageType,
         port: int = 22,
-        cmd_timeout: int = 5
+        cmd_timeout: int = 5,
+        image_id: str = None,
+        capture_mode: SshCaptureMode = SshCaptureMode.FULL,
+        output_cap_bytes: int = None,
+        cache_hostname: str = None,
+        cache_ttl_s: int = None
 ) -> SshResult:
+    output, error = create_captures(
+        capture_mode, output_cap_bytes, artifact_id=self.request.id)
+    # Output is published while command runs, clients can tail it.
+    # Bounded output isn't streamed beyond the cap, whole of it is in artifact
+    output_stream = OutputStreamPublisher(self.request.id, cap_bytes=output.cap_bytes)
+    retcode = None
+
+    try:
+        self.update_state(state=states.STARTED,
+                          meta={})
+
+        start_time = datetime.datetime.now()
+
+        if server_settings.SSH_SETTINGS.EXECUTOR == SshExecutor.ASYNCIO:
+            self.update_state(state=states.STARTED,
+                              meta={'cmd': f'{command}'})
+
+            response = async_ssh_executor.execute(
+                hostname=hostname,
+                port=port,
+                username=username,
+                image_type=image_type,
+                password_getter=lambda: get_password(
+                    username, image_type, device_type),
+                command=command,
+                cmd_timeout=cmd_timeout,
+                on_output=output_stream.publish,
+                output=output,
+                error=error,
+                image_id=image_id
+            )
+        else:
+            with device_connection(hostname, port, username, device_type, image_type, image_id) as ssh_client:
+                self.update_state(state=states.STARTED,
+                                  meta={'cmd': f'{command}'})
+
+                response = execute_command(
+                    ssh_client, command, cmd_timeout, on_output=output_stream.publish,
+                    output=output, error=error)
+        retcode = response.retcode
+
+        if output.spilled or error.spilled:
+            response.artifact_id = self.request.id
+
+        logger.info("Finished SSH!")
+
+        end_time = datetime.datetime.now()
+        response.execution_time_s = (end_time - start_time).total_seconds()
+
+        if cache_hostname is not None:
+            cache_result(cache_hostname, username, command,
+                         image_id, response, cache_ttl_s)
+
+        return response.model_dump()
+    except (paramiko.AuthenticationException, asyncssh.PermissionDenied) as e:
+        # Password could be changed on server, request it again on retry
+        invalidate_password(username, image_type, device_type)
+        raise self.retry(exc=e)
+    except CONNECT_ERRORS as e:
+        raise self.retry(exc=e)
+    finally:
+        # Output of the next attempt of retried task goes to the same stream
+        if not isinstance(sys.exc_info()[1], Retry):
+            output_stream.close(retcode)
+
+
+@ssh_worker.task(name="ssh_batch", bind=True, max_retries=3, default_retry_delay=5, queue='ssh_queue')
+def task_ssh_batch(
+        self,
+        steps: List[dict],
+        hostname: str,
+        username: SshUser,
+        device_type: DeviceType,
+        image_type: ImageType,
+        port: int = 22,
+        stop_on_error: bool = True,
+        image_id: str = None
+) -> SshBatchResult:
+    """
+    Executes ordered list of commands over one connection.
+
+    Step is failed if command returned non zero code or timed out.
+    Task is retried if device could not be connected, so no step was
+    executed yet. Other errors fail the task.
+    """
     try:
         self.update_state(state=states.STARTED,
                           meta={})
 
-        password = get_password(username, image_type, device_type)
+        start_time = datetime.datetime.now()
+
+        step_results: List[SshResult] = []
+        failed_step = None
+
+        with device_connection(hostname, port, username, device_type, image_type, image_id) as ssh_client:
+            for step_number, step in enumerate(steps):
+                command = step['cmd']
+                cmd_timeout = step['cmd_timeout']
+
+                self.update_state(state=states.STARTED,
+                                  meta={'step': step_number,
+                                        'steps_total': len(steps),
+                                        'cmd': f'{command}'})
+
+                try:
+                    step_result = execute_command(
+                        ssh_client, command, cmd_timeout)
+                except socket.timeout:
+                    step_result = SshResult(
+                        stdout=None,
+                        stderr=f"Command timed out after {cmd_timeout} s",
+                        retcode=None,
+                        execution_time_s=cmd_timeout
+                    )
+
+                step_results.append(step_result)
+
+                if step_result.retcode != 0 and failed_step is None:
+                    failed_step = step_number
+
+                    if stop_on_error:
+                        logger.info(
+                            f"Step {step_number} '{command}' failed, skipping remaining steps")
+                        break
+
+        logger.info("Finished SSH batch!")
+
+        end_time = datetime.datetime.now()
+        execution_time = (end_time - start_time).total_seconds()
+
+        response = SshBatchResult(
+            steps=step_results,
+            failed_step=failed_step,
+            execution_time_s=execution_time,
+            commands_time_s=sum(
+                step_result.execution_time_s for step_result in step_results)
+        )
+
+        return response.model_dump()
+    except paramiko.AuthenticationException as e:
+        # Password could be changed on server, request it again on retry
+        invalidate_password(username, image_type, device_type)
+        raise self.retry(exc=e)
+    except CONNECT_ERRORS as e:
+        raise self.retry(exc=e)
+
+
+@ssh_worker.task(name="ssh_fanout_next", queue='ssh_queue')
+def task_ssh_fanout_next(group_id: str) -> None:
+    """
+    Sends the next pending task of fan-out group.
+
+    Linked to every task of group as callback and errback, so a finished
+    task frees its slot whether it succeeded or failed.
+    """
+    raw_signature = redis_client.lpop(FANOUT_PENDING_KEY.format(group_id=group_id))
+
+    if raw_signature is not None:
+        ssh_worker.signature(json.loads(raw_signature)).apply_async()
+
+
+class TransferProgress:
+    """Reports progress of file transfer to task state not more often than once in interval."""
+
+    def __init__(self, task, remote_path: str, interval_s: float = 1.0):
+        self.task = task
+        self.remote_path = remote_path
+        self.interval_s = interval_s
+        self._last_update = 0.0
+
+    def __call__(self, transferred: int, size: int) -> None:
+        now = time.monotonic()
+        if now - self._last_update < self.interval_s and transferred < size:
+            return
+
+        self._last_update = now
+        self.task.update_state(state=states.STARTED,
+                               meta={'remote_path': self.remote_path,
+                                     'transferred_bytes': transferred,
+                                     'size_bytes': size})
+
+
+@ssh_worker.task(name="sftp_upload", bind=True, max_retries=3, default_retry_delay=5, queue='ssh_queue')
+def task_sftp_upload(
+        self,
+        local_path: str,
+        remote_path: str,
+        hostname: str,
+        username: SshUser,
+        device_type: DeviceType,
+        image_type: ImageType,
+        port: int = 22,
+        image_id: str = None
+) -> SftpResult:
+    """
+    Uploads file staged on server to device.
+
+    Interrupted upload is retried and resumed. Staged file is removed
+    when upload succeeded or failed for good.
+    """
+    try:
+        self.update_state(state=states.STARTED,
+                          meta={})
 
         start_time = datetime.datetime.now()
 
-        ssh_client = paramiko.SSHClient()
-        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh_client.connect(hostname=hostname, port=port,
-                           username=username, password=password)
+        with device_connection(hostname, port, username, device_type, image_type, image_id) as ssh_client:
+            transfer = upload_file(
+                ssh_client, local_path, remote_path,
+                on_progress=TransferProgress(self, remote_path))
+
+            try:
+                verified = verify_remote_sha256(
+                    ssh_client, remote_path, transfer['sha256'])
+            except SftpChecksumMismatchError:
+                # Corrupted file must not be resumed
+                with ssh_client.open_sftp() as sftp:
+                    sftp.remove(remote_path)
+                raise
+
+        logger.info("Finished SFTP upload!")
+
+        end_time = datetime.datetime.now()
+        execution_time = (end_time - start_time).total_seconds()
+
+        response = SftpResult(
+            remote_path=remote_path,
+            size_bytes=transfer['size_bytes'],
+            transferred_bytes=transfer['size_bytes'] -
+            transfer['resumed_from'],
+            resumed_from=transfer['resumed_from'],
+            sha256=transfer['sha256'],
+            verified=verified,
+            execution_time_s=execution_time
+        )
+
+        return response.model_dump()
+    except paramiko.AuthenticationException as e:
+        invalidate_password(username, image_type, device_type)
+        raise self.retry(exc=e)
+    except TRANSFER_ERRORS as e:
+        raise self.retry(exc=e)
+    finally:
+        if not isinstance(sys.exc_info()[1], Retry) and os.path.exists(local_path):
+            os.remove(local_path)
+
+
+@ssh_worker.task(name="sftp_download", bind=True, max_retries=3, default_retry_delay=5, queue='ssh_queue')
+def task_sftp_download(
+        self,
+        remote_path: str,
+        hostname: str,
+        username: SshUser,
+        device_type: DeviceType,
+        image_type: ImageType,
+        port: int = 22,
+        resume: bool = True,
+        image_id: str = None
+) -> SftpResult:
+    """
+    Downloads file from device to transfer folder of server.
 
+    Downloaded file is named by ID of the task and removed after
+    TRANSFER_TTL_S. Interrupted download is retried and resumed,
+    partial file is removed when download failed for good.
+    """
+    local_path = get_transfer_path(self.request.id)
+    partial_path = get_download_partial_path(self.request.id)
+
+    try:
         self.update_state(state=states.STARTED,
-                          meta={'cmd': f'{command}'})
+                          meta={})
 
-        stdin, stdout, stderr = ssh_client.exec_command(
-            command, timeout=cmd_timeout)
+        start_time = datetime.datetime.now()
 
-        output = stdout.read().decode(errors="skip")
-        error = stderr.read().decode(errors="skip")
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        remove_expired_transfers()
 
-        # Blocking call if command was not finished
-        retcode = stdout.channel.recv_exit_status()
-        ssh_client.close()
+        with device_connection(hostname, port, username, device_type, image_type, image_id) as ssh_client:
+            transfer = download_file(
+                ssh_client, remote_path, str(local_path), str(partial_path),
+                resume=resume, on_progress=TransferProgress(self, remote_path))
 
-        logger.info("Finished SSH!")
+            try:
+                verified = verify_remote_sha256(
+                    ssh_client, remote_path, transfer['sha256'])
+            except SftpChecksumMismatchError:
+                # File could be changed on device after partial download
+                local_path.unlink(missing_ok=True)
+                raise
+
+        logger.info("Finished SFTP download!")
 
         end_time = datetime.datetime.now()
         execution_time = (end_time - start_time).total_seconds()
 
-        response = SshResult(
-            stdout=output, stderr=error, retcode=retcode, execution_time_s=execution_time)
+        response = SftpResult(
+            remote_path=remote_path,
+            size_bytes=transfer['size_bytes'],
+            transferred_bytes=transfer['size_bytes'] -
+            transfer['resumed_from'],
+            resumed_from=transfer['resumed_from'],
+            sha256=transfer['sha256'],
+            verified=verified,
+            execution_time_s=execution_time
+        )
 
         return response.model_dump()
-    except MaxRetriesExceededError as e:
-        self.update_state(state=states.FAILURE,
-                          meta={'exc_type': type(e).__name__,
-                                'exc_message': e.__str__()})
     except paramiko.AuthenticationException as e:
-        self.update_state(state=states.RETRY,
-                          meta={'exc_type': type(e).__name__,
-                                'exc_message': e.__str__()})
-    except paramiko.SSHException as e:
-        self.update_state(state=states.RETRY,
-                          meta={'exc_type': type(e).__name__,
-                                'exc_message': e.__str__()})
-    except NoValidConnectionsError as e:
-        self.update_state(state=states.RETRY,
-                          meta={'exc_type': type(e).__name__,
-                                'exc_message': e.__str__()})
-    except ReceivingPasswordError as e:
-        self.update_state(state=states.RETRY,
-                          meta={'exc_type': type(e).__name__,
-                                'exc_message': e.__str__()})
-    except Exception as e:
-        self.update_state(state=states.RETRY,
-                          meta={'exc_type': type(e).__name__,
-                                'exc_message': e.__str__()})
+        invalidate_password(username, image_type, device_type)
+        raise self.retry(exc=e)
+    except TRANSFER_ERRORS as e:
+        raise self.retry(exc=e)
+    finally:
+        if not isinstance(sys.exc_info()[1], Retry):
+            partial_path.unlink(missing_ok=True)
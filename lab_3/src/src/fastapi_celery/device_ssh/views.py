@@ -1,41 +1,84 @@
+import asyncio
+import shutil
+import uuid
+from typing import Annotated, Literal, Optional, Union
+
 from celery import states
 from celery.result import AsyncResult
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import JSONResponse, Response
+from fastapi import (APIRouter, Depends, File, Form, Header, HTTPException,
+                     Query, UploadFile, WebSocket)
+from fastapi.responses import (FileResponse, JSONResponse, Response,
+                               StreamingResponse)
 from sqlalchemy.orm import Session
 
+from ..config import server_settings
 from ..database import get_db
-from ..device_data.schemas import DeviceSchema
-from ..device_data.service import get_device
-from ..enums import ImageType, SshUser
+from ..enums import ImageType, SshCaptureMode, SshUser
 from ..exceptions import (DeviceHasNoImageError, DeviceNotFoundError,
-                          ImageNotFoundInDatabaseError)
-from ..images.schemas import ImageSchema
-from ..images.service import get_image
-from .schemas import SshQueuedResponse, SshResult, SshTaskResponse
+                          ImageNotFoundInDatabaseError,
+                          ReservationNotFoundError, SftpFileNotFoundError,
+                          SshArtifactNotFoundError, SshFanoutNotFoundError)
+from ..task_status import (MAX_WAIT_S, get_task_meta, send_task_updates,
+                           stream_task_events, wait_for_task_update)
+from .connection_pool import get_pool_stats
+from .output_capture import get_artifact_path
+from .output_stream import read_output_events
+from .result_cache import get_cache_key, get_cached_result
+from .schemas import (SftpDownloadRequest, SftpResult, SftpTaskResponse,
+                      SshBatchRequest, SshBatchResult, SshBatchTaskResponse,
+                      SshCachedResponse, SshFanoutRequest, SshFanoutTaskResponse,
+                      SshPoolStatsResponse, SshQueuedResponse, SshResult,
+                      SshTaskResponse)
+from .service import create_fanout, get_device_with_image, get_fanout_status
+from .sftp_module import get_transfer_path, remove_expired_transfers
 from .tasks import ssh_worker
-from .tasks import task_ssh
+from .tasks import (task_sftp_download, task_sftp_upload, task_ssh,
+                    task_ssh_batch)
 
 router = APIRouter(prefix="/device_ssh", tags=["Device SSH"])
 
 
-@router.post("", status_code=202, response_model=SshQueuedResponse)
-def ssh_command(cmd: str, hostname: str, username: SshUser, db: Session = Depends(get_db)) -> SshQueuedResponse:
-    try:
-        device: DeviceSchema = get_device(db=db, hostname=hostname)
+@router.post("", status_code=202, response_model=Union[SshQueuedResponse, SshCachedResponse])
+def ssh_command(
+    cmd: str,
+    hostname: str,
+    username: SshUser,
+    capture_mode: SshCaptureMode = Query(
+        SshCaptureMode.FULL, description="'bounded' keeps only head and tail of output in result"),
+    output_cap_bytes: Optional[int] = Query(
+        None, gt=0, description="Size of output kept in result in bounded mode"),
+    cache_ttl_s: Optional[int] = Query(
+        None, gt=0, le=server_settings.SSH_SETTINGS.RESULT_CACHE_MAX_TTL_S,
+        description="Read-only command: result is cached until device image or test stage changes"),
+    db: Session = Depends(get_db)
+) -> Union[SshQueuedResponse, SshCachedResponse]:
+    """
+    Queues command on device.
 
-        if device.image_id is None:
-            raise DeviceHasNoImageError(
-                "You must upload image for device before using ssh command.")
+    Cached result of read-only command is returned at once with status 200.
+    """
+    try:
+        device, image = get_device_with_image(db, hostname)
 
-        image: ImageSchema = get_image(db, device.image_id)
+        if cache_ttl_s is not None:
+            cached = get_cached_result(get_cache_key(device, username, cmd))
+            if cached is not None:
+                result, expires_in_s = cached
+                response = SshCachedResponse(
+                    result=result, expires_in_s=expires_in_s)
+                return JSONResponse(status_code=200, content=response.model_dump(mode="json"))
 
         task = task_ssh.delay(
             command=cmd,
             hostname=device.ip,
             username=username,
             device_type=device.type,
-            image_type=image.type
+            image_type=image.type,
+            image_id=image.id,
+            capture_mode=capture_mode,
+            output_cap_bytes=output_cap_bytes,
+            cache_hostname=device.hostname if cache_ttl_s is not None else None,
+            cache_ttl_s=cache_ttl_s
         )
 
         response = SshQueuedResponse(id=task.id, location=f"/queue/{task.id}")
@@ -48,21 +91,288 @@ def ssh_command(cmd: str, hostname: str, username: SshUser, db: Session = Depend
         raise HTTPException(status_code=exc.status_code, detail=str(exc))
 
 
-@router.get("/queue/{task_id}", response_model=SshTaskResponse)
-async def get_status(task_id, response: Response):
-    """URL used to receive updates on Celery tasks."""
+def build_task_response(task_id: str) -> SshTaskResponse:
     ssh_task = AsyncResult(task_id, app=ssh_worker)
 
     ssh_task_response = SshTaskResponse(
         id=task_id,
         status=ssh_task.state,
-        meta=ssh_task.info,
+        meta=get_task_meta(ssh_task),
         result=None
     )
 
-    if ssh_task.state == states.SUCCESS:
+    if ssh_task.state == states.SUCCESS and ssh_task.result is not None:
         task_result = SshResult(**ssh_task.result)
 
         ssh_task_response.result = task_result
 
     return ssh_task_response
+
+
+@router.get("/queue/{task_id}", response_model=SshTaskResponse)
+async def get_status(
+    task_id,
+    response: Response,
+    wait: Optional[int] = Query(
+        None, ge=0, le=MAX_WAIT_S, description="Long-poll: wait up to `wait` s for update of task"),
+    since: Optional[str] = Query(
+        None, description="Status known by client, long-poll returns once status differs")
+):
+    """URL used to receive updates on Celery tasks."""
+    if wait:
+        await wait_for_task_update(ssh_worker, task_id, wait, since)
+
+    return build_task_response(task_id)
+
+
+@router.get("/queue/{task_id}/events")
+async def stream_status(task_id: str) -> StreamingResponse:
+    """Server-Sent Events with status of task on every update, stream ends when task is finished."""
+    return StreamingResponse(
+        stream_task_events(ssh_worker, task_id,
+                           lambda: asyncio.to_thread(build_task_response, task_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+@router.websocket("/queue/{task_id}/ws")
+async def subscribe_status(websocket: WebSocket, task_id: str) -> None:
+    """Status of task on every update, socket is closed when task is finished."""
+    await send_task_updates(websocket, ssh_worker, task_id,
+                            lambda: asyncio.to_thread(build_task_response, task_id))
+
+
+@router.get("/queue/{task_id}/stream")
+async def stream_output(
+    task_id: str,
+    offset: Optional[str] = Query(
+        None, description="ID of the last received event, output is streamed after it"),
+    last_event_id: Optional[str] = Header(None)
+) -> StreamingResponse:
+    """
+    Server-Sent Events with stdout/stderr of running command.
+
+    Stream ends with 'eof' event containing return code. Output above
+    the cap is dropped and 'truncated' event is sent instead.
+    Reconnecting clients resume from the 'Last-Event-ID' header or `offset`.
+    """
+    return StreamingResponse(
+        read_output_events(task_id, offset or last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+@router.get("/artifact/{artifact_id}/{stream_name}")
+def download_artifact(artifact_id: str, stream_name: Literal["stdout", "stderr"]) -> FileResponse:
+    """Full gzip-compressed output of command which result was truncated."""
+    try:
+        artifact_path = get_artifact_path(artifact_id, stream_name)
+
+        if not artifact_path.exists():
+            raise SshArtifactNotFoundError(
+                f"Output '{stream_name}' of '{artifact_id}' not found. Either output was not truncated or artifact expired.")
+
+        return FileResponse(artifact_path, media_type="application/gzip", filename=artifact_path.name)
+    except SshArtifactNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+
+@router.post("/batch", status_code=202, response_model=SshQueuedResponse)
+def ssh_batch(request: SshBatchRequest, db: Session = Depends(get_db)) -> SshQueuedResponse:
+    """Executes ordered list of commands over one SSH connection."""
+    try:
+        device, image = get_device_with_image(db, request.hostname)
+
+        task = task_ssh_batch.delay(
+            steps=[step.model_dump() for step in request.steps],
+            hostname=device.ip,
+            username=request.username,
+            device_type=device.type,
+            image_type=image.type,
+            stop_on_error=request.stop_on_error,
+            image_id=image.id
+        )
+
+        response = SshQueuedResponse(
+            id=task.id, location=f"/batch/queue/{task.id}")
+        return response
+    except DeviceHasNoImageError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except DeviceNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except ImageNotFoundInDatabaseError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+
+@router.get("/batch/queue/{task_id}", response_model=SshBatchTaskResponse)
+async def get_batch_status(task_id) -> SshBatchTaskResponse:
+    """URL used to receive updates on SSH batch tasks."""
+    ssh_task = AsyncResult(task_id, app=ssh_worker)
+
+    ssh_task_response = SshBatchTaskResponse(
+        id=task_id,
+        status=ssh_task.state,
+        meta=get_task_meta(ssh_task),
+        result=None
+    )
+
+    if ssh_task.state == states.SUCCESS and ssh_task.result is not None:
+        ssh_task_response.result = SshBatchResult(**ssh_task.result)
+
+    return ssh_task_response
+
+
+@router.post("/sftp/upload", status_code=202, response_model=SshQueuedResponse)
+def sftp_upload(
+    hostname: Annotated[str, Form()],
+    username: Annotated[SshUser, Form()],
+    remote_path: Annotated[str, Form()],
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+) -> SshQueuedResponse:
+    """
+    Writes file to device.
+
+    File is staged on server and uploaded by ssh worker.
+    Interrupted upload to the same `remote_path` is resumed.
+    """
+    try:
+        device, image = get_device_with_image(db, hostname)
+
+        transfer_id = str(uuid.uuid4())
+        staged_path = get_transfer_path(transfer_id, ".upload")
+        staged_path.parent.mkdir(parents=True, exist_ok=True)
+        remove_expired_transfers()
+
+        with open(staged_path, "wb") as staged_file:
+            shutil.copyfileobj(file.file, staged_file,
+                               server_settings.SSH_SETTINGS.SFTP_CHUNK_SIZE)
+
+        task = task_sftp_upload.apply_async(
+            kwargs=dict(
+                local_path=str(staged_path),
+                remote_path=remote_path,
+                hostname=device.ip,
+                username=username,
+                device_type=device.type,
+                image_type=image.type,
+                image_id=image.id
+            ),
+            task_id=transfer_id
+        )
+
+        response = SshQueuedResponse(
+            id=task.id, location=f"/sftp/queue/{task.id}")
+        return response
+    except DeviceHasNoImageError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except DeviceNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except ImageNotFoundInDatabaseError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+
+@router.post("/sftp/download", status_code=202, response_model=SshQueuedResponse)
+def sftp_download(request: SftpDownloadRequest, db: Session = Depends(get_db)) -> SshQueuedResponse:
+    """
+    Reads file from device.
+
+    When task is finished, file is available at `/sftp/file/{id}`.
+    """
+    try:
+        device, image = get_device_with_image(db, request.hostname)
+
+        task = task_sftp_download.delay(
+            remote_path=request.remote_path,
+            hostname=device.ip,
+            username=request.username,
+            device_type=device.type,
+            image_type=image.type,
+            resume=request.resume,
+            image_id=image.id
+        )
+
+        response = SshQueuedResponse(
+            id=task.id, location=f"/sftp/queue/{task.id}")
+        return response
+    except DeviceHasNoImageError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except DeviceNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except ImageNotFoundInDatabaseError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+
+@router.get("/sftp/queue/{task_id}", response_model=SftpTaskResponse)
+async def get_sftp_status(task_id) -> SftpTaskResponse:
+    """URL used to receive updates on SFTP tasks."""
+    sftp_task = AsyncResult(task_id, app=ssh_worker)
+
+    sftp_task_response = SftpTaskResponse(
+        id=task_id,
+        status=sftp_task.state,
+        meta=get_task_meta(sftp_task),
+        result=None
+    )
+
+    if sftp_task.state == states.SUCCESS and sftp_task.result is not None:
+        sftp_task_response.result = SftpResult(**sftp_task.result)
+
+    return sftp_task_response
+
+
+@router.get("/sftp/file/{task_id}")
+def get_sftp_file(task_id: str) -> FileResponse:
+    """File downloaded from device by SFTP task."""
+    try:
+        file_path = get_transfer_path(task_id)
+
+        if not file_path.exists():
+            raise SftpFileNotFoundError(
+                f"File of '{task_id}' not found. Either download is not finished or task is unknown.")
+
+        return FileResponse(file_path, media_type="application/octet-stream", filename=file_path.name)
+    except SftpFileNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+
+@router.post("/fanout", status_code=202, response_model=SshQueuedResponse)
+def ssh_fanout(request: SshFanoutRequest, db: Session = Depends(get_db)) -> SshQueuedResponse:
+    """Executes command on all devices of reservation or on listed devices in parallel."""
+    try:
+        group_id = create_fanout(db, request)
+
+        response = SshQueuedResponse(
+            id=group_id, location=f"/fanout/queue/{group_id}")
+        return response
+    except DeviceHasNoImageError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except DeviceNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except ImageNotFoundInDatabaseError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except ReservationNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+
+@router.get("/fanout/queue/{group_id}", response_model=SshFanoutTaskResponse)
+def get_fanout_group_status(group_id: str) -> SshFanoutTaskResponse:
+    """Aggregated status and results of fan-out group."""
+    try:
+        return get_fanout_status(group_id)
+    except SshFanoutNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+
+@router.get("/pool/stats", response_model=SshPoolStatsResponse)
+def get_ssh_pool_stats() -> SshPoolStatsResponse:
+    """Hit/miss rate of SSH connection pools of ssh workers."""
+    stats = get_pool_stats()
+
+    return SshPoolStatsResponse(
+        hits=stats.get("hits", 0),
+        misses=stats.get("misses", 0),
+        evictions=stats.get("evictions", 0)
+    )
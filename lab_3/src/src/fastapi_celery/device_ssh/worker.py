@@ -1,5 +1,6 @@
 from celery import Celery
-from ..config import env_settings
+from ..config import env_settings, server_settings
+from ..enums import SshExecutor
 
 ssh_worker = Celery('ssh_worker',
                     broker_connection_retry_on_startup=True,
@@ -16,3 +17,13 @@ ssh_worker.conf.update(
     accept_content=['json'],
     timezone='UTC'
 )
+
+if server_settings.SSH_SETTINGS.EXECUTOR == SshExecutor.ASYNCIO:
+    # SSH I/O of all commands runs in one event loop of the process, but every
+    # running task still blocks its own OS thread while it waits for output,
+    # so ASYNC_MAX_SESSIONS threads are started. Threads are much cheaper
+    # than processes of prefork pool, not free.
+    ssh_worker.conf.update(
+        worker_pool='threads',
+        worker_concurrency=server_settings.SSH_SETTINGS.ASYNC_MAX_SESSIONS
+    )
@@ -70,6 +70,24 @@ class TaskType(StrEnum):
     SET_LICENSE = 'device_set_license'
     RS232 = 'device_rs232'
 
+# --- Reload properties ---
+
+
+class ReloadReadyCheck(StrEnum):
+    CONSOLE = 'console'
+    SSH = 'ssh'
+
+# --- Install properties ---
+
+
+class InstallStage(StrEnum):
+    BOOT_PIN_ON = 'boot_pin_on'
+    POWER_CYCLE = 'power_cycle'
+    TRANSFER = 'transfer'
+    VERIFY = 'verify'
+    BOOT_PIN_OFF = 'boot_pin_off'
+    REBOOT = 'reboot'
+
 # --- Modbus properties ---
 
 
@@ -90,6 +108,33 @@ class ImageType(StrEnum):
 class SshUser(StrEnum):
     ROOT = 'root'
 
+
+class SshCaptureMode(StrEnum):
+    FULL = 'full'
+    BOUNDED = 'bounded'
+
+
+class SshExecutor(StrEnum):
+    PARAMIKO = 'paramiko'
+    ASYNCIO = 'asyncio'
+
+
+# --- RS232 properties ---
+
+
+class Rs232StopReason(StrEnum):
+    TERMINATOR = 'terminator'
+    MAX_BYTES = 'max_bytes'
+    IDLE = 'idle'
+    DEADLINE = 'deadline'
+
+
+class Rs232TransferProtocol(StrEnum):
+    YMODEM = 'ymodem'
+    XMODEM = 'xmodem'
+    RAW = 'raw'
+
+
 class PinType(StrEnum):
     BOOT = 'boot'
     POWER = 'power'
\ No newline at end of file
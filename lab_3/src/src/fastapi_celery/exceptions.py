@@ -23,6 +23,20 @@ class Rs232Exception(Rs232ExceptionBase):
     def __init__(self, message: str):
         super().__init__(message, status_code=500)
 
+
+class Rs232ConsoleArchiveNotFoundError(Rs232ExceptionBase):
+    """Raised when console of port was never archived"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=404)
+
+
+class Rs232TransferError(Rs232ExceptionBase):
+    """Raised when binary transfer to device was not completed"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=500)
+
 #########################
 #     SSH EXCEPTIONS    #
 #########################
@@ -43,6 +57,41 @@ class ReceivingPasswordError(SshExceptionBase):
         super().__init__(message, status_code=500)
 
 
+class SshPoolExhaustedError(SshExceptionBase):
+    """Raised when no SSH connection to host became free in time"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=503)
+
+
+class SshFanoutNotFoundError(SshExceptionBase):
+    """Raised when fan-out group is unknown or its results expired"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=404)
+
+
+class SshArtifactNotFoundError(SshExceptionBase):
+    """Raised when file with full output of command not found"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=404)
+
+
+class SftpChecksumMismatchError(SshExceptionBase):
+    """Raised when checksum of transferred file differs from checksum of source file"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=500)
+
+
+class SftpFileNotFoundError(SshExceptionBase):
+    """Raised when transferred file not found on server"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=404)
+
+
 ###########################
 #     IMAGE EXCEPTIONS    #
 ###########################
@@ -168,6 +217,13 @@ class BolidNotFoundError(BolidExceptionBase):
         super().__init__(message, status_code=500)
 
 
+class BolidModbusError(BolidExceptionBase):
+    """Raised when bolid did not execute Modbus request"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=502)
+
+
 ###############################
 #     BOLID PIN EXCEPTIONS    #
 ###############################
@@ -192,3 +248,43 @@ class BolidPinLimitExceededError(BolidPinExceptionBase):
 
     def __init__(self, message: str):
         super().__init__(message, status_code=500)
+
+
+#############################
+#     INSTALL EXCEPTIONS    #
+#############################
+
+
+class InstallExceptionBase(BaseException):
+    """
+    Base class for exceptions in Device Install module
+    """
+    pass
+
+
+class InstallStageError(InstallExceptionBase):
+    """Raised when stage of image installation failed on device"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=500)
+
+
+class InstallTargetError(InstallExceptionBase):
+    """Raised when targets passed to install worker are invalid"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=422)
+
+
+class UsbPathNotFoundError(InstallExceptionBase):
+    """Raised when device has no USB path of serial download"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=404)
+
+
+class RecoveryFileNotFoundError(InstallExceptionBase):
+    """Raised when recovery file for USB loader is not found"""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=404)
@@ -8,7 +8,9 @@ def convert_from_model_to_schema(model: Image) -> ImageSchema:
         type=model.type,
         version=model.version,
         commit=model.commit,
-        filename=model.filename
+        filename=model.filename,
+        size=model.size,
+        sha256=model.sha256
     )
 
     return schema
@@ -1,5 +1,6 @@
 import uuid
 
+from sqlalchemy import BigInteger, LargeBinary
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..dependencies import Base
@@ -15,6 +16,12 @@ class Image(Base):
     version: Mapped[str]
     commit: Mapped[str] = mapped_column(nullable=True)
     filename: Mapped[str]
+    # Calculated while image is uploaded
+    size: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    sha256: Mapped[str] = mapped_column(nullable=True)
+    # Concatenated sha256 of blocks of file, cached for delta install
+    block_size: Mapped[int] = mapped_column(nullable=True)
+    block_hashes: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
 
     device: Mapped["Device"] = relationship(
         "Device",
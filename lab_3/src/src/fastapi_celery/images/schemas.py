@@ -10,6 +10,8 @@ class ImageSchema(BaseModel):
     version: Optional[str]
     commit: Optional[str]
     filename: str
+    size: Optional[int] = None
+    sha256: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -1,9 +1,10 @@
+import asyncio
+import hashlib
 import logging
 import os
-import shutil
 import uuid
 from pathlib import Path
-from typing import List
+from typing import AsyncIterator, List, Optional
 
 from fastapi import UploadFile
 from sqlalchemy import and_
@@ -20,6 +21,7 @@ from ..exceptions import (DeviceNotFoundError, EmptyFileExtensionError,
 from .convert_model_schema import convert_from_model_to_schema
 from .model import Image
 from .schemas import ImageSchema
+from .storage import ImageFileWriter, write_image_file
 
 logger = logging.getLogger()
 
@@ -48,13 +50,44 @@ def get_image(db: Session, id: str) -> ImageSchema:
     return image_schema
 
 
+def get_block_hashes(db: Session, id: str, block_size: int) -> Optional[List[bytes]]:
+    """Cached block hashes of image file, None if they were not calculated for this block size."""
+    image_db: Image = db.query(Image).filter(
+        Image.id == id).first()
+
+    if image_db is None:
+        raise ImageNotFoundInDatabaseError(f"Image with ID {id} not found")
+
+    if image_db.block_hashes is None or image_db.block_size != block_size:
+        return None
+
+    digest_size = hashlib.sha256().digest_size
+    return [image_db.block_hashes[offset:offset + digest_size]
+            for offset in range(0, len(image_db.block_hashes), digest_size)]
+
+
+def save_block_hashes(db: Session, id: str, block_size: int, block_hashes: List[bytes]) -> None:
+    image_db: Image = db.query(Image).filter(
+        Image.id == id).first()
+
+    if image_db is None:
+        raise ImageNotFoundInDatabaseError(f"Image with ID {id} not found")
+
+    image_db.block_size = block_size
+    image_db.block_hashes = b"".join(block_hashes)
+
+    db.commit()
+
+
 def create_image(db: Session, image: ImageSchema) -> ImageSchema:
     image_db = Image(
         id=image.id,
         commit=image.commit,
         version=image.version,
         type=image.type,
-        filename=image.filename
+        filename=image.filename,
+        size=image.size,
+        sha256=image.sha256
     )
 
     db.add(image_db)
@@ -131,8 +164,8 @@ def get_by_device_hostname(db: Session, device_hostname: str) -> ImageSchema:
     return image_schema
 
 
-async def save_file(upload_folder: str, file: UploadFile, image_type: ImageType, image_version: str, device_hostname: str, commit: str = None) -> tuple[str, Path]:
-    file_extension = os.path.splitext(file.filename)[1]
+def get_image_filename(file_name: str, image_type: ImageType, image_version: str, device_hostname: str, commit: str = None) -> str:
+    file_extension = os.path.splitext(file_name)[1]
 
     if not file_extension:
         raise EmptyFileExtensionError("Extension of file is empty.")
@@ -141,63 +174,103 @@ async def save_file(upload_folder: str, file: UploadFile, image_type: ImageType,
         raise InvalidFileExtensionError(
             f"Extension '{file_extension}' is not in the list of available extensions: {str(server_settings.IMAGE_SETTINGS.VALID_EXTS)}")
 
-    filename = f"{device_hostname}-{image_type}-{image_version}-{commit}{file_extension}"
-    filepath: Path = os.path.join(upload_folder, filename)
+    return f"{device_hostname}-{image_type}-{image_version}-{commit}{file_extension}"
 
-    with open(filepath, "wb") as target_file:
-        shutil.copyfileobj(file.file, target_file)
 
-    return filename, filepath
+async def read_upload_file(file: UploadFile) -> AsyncIterator[bytes]:
+    """Chunks of spooled upload file, spooled file is read in a thread."""
+    while chunk := await file.read(server_settings.IMAGE_SETTINGS.UPLOAD_WRITE_SIZE):
+        yield chunk
 
 
-async def save_image(db: Session, file: UploadFile, image_type: ImageType, image_version: str, device_hostname: str, commit: str = None) -> ImageSchema:
+async def save_file(upload_folder: str, chunks: AsyncIterator[bytes]) -> ImageFileWriter:
+    """Writes image to temporary file in image folder, image is hashed while it is written."""
+    return await write_image_file(
+        chunks,
+        upload_folder,
+        block_size=server_settings.INSTALL_SETTINGS.DELTA_BLOCK_SIZE,
+        write_size=server_settings.IMAGE_SETTINGS.UPLOAD_WRITE_SIZE
+    )
+
+
+async def save_image_stream(db: Session, chunks: AsyncIterator[bytes], file_name: str, image_type: ImageType, image_version: str, device_hostname: str, commit: str = None) -> ImageSchema:
     """
-    Saves the uploaded image file to the specified folder and creates a database entry.
+    Saves image streamed in chunks to image folder and creates a database entry.
+
+    Device is checked before the image is written. Size, sha256 and
+    block hashes for delta install are stored with the image. Image
+    replaces the previous image of device only after it is stored in
+    database, so a failure keeps the previous image and its file intact.
     """
-    upload_folder = "/images"
+    if not device_hostname:
+        raise UnspecifiedDeviceHostnameError(
+            "Device hostname must be specified.")
+
+    filename = get_image_filename(
+        file_name, image_type, image_version, device_hostname, commit)
+
+    # find device for image
+    device = db.query(Device).filter(
+        Device.hostname == device_hostname).first()
+
+    if device is None:
+        raise DeviceNotFoundError(
+            f"Device with hostname {device_hostname} not found")
+
+    upload_folder = server_settings.IMAGE_SETTINGS.FOLDER_PATH
     Path(upload_folder).mkdir(parents=True,
                               exist_ok=True)
+    filepath = os.path.join(upload_folder, filename)
 
-    try:
-        filename, filepath = await save_file(upload_folder, file, image_type, image_version, device_hostname, commit)
+    writer = await save_file(upload_folder, chunks)
+    digest = writer.digest
 
-        image_schema = ImageSchema(
+    try:
+        image_db = Image(
             id=str(uuid.uuid4()),
             type=image_type,
             version=image_version,
             commit=commit,
-            filename=filename
+            filename=filename,
+            size=digest.size,
+            sha256=digest.sha256,
+            block_size=digest.block_size,
+            block_hashes=b"".join(digest.block_hashes)
         )
-        # add image to db
-        created_image_schema = create_image(db, image_schema)
+        db.add(image_db)
 
-        if not device_hostname:
-            raise UnspecifiedDeviceHostnameError(
-                "Device hostname must be specified.")
+        previous_filename: Optional[str] = None
+        if device.image is not None:
+            previous_filename = device.image.filename
+            db.delete(device.image)
 
-        # find device for image
-        device = db.query(Device).filter(
-            Device.hostname == device_hostname).first()
+        device.image = image_db
+        db.commit()
+        db.refresh(image_db)
+    except Exception:
+        db.rollback()
+        await asyncio.to_thread(writer.discard)
+        raise
 
-        if device is None:
-            os.remove(filepath)
-            raise DeviceNotFoundError(
-                f"Device with hostname {device_hostname} not found")
+    await asyncio.to_thread(writer.commit, filepath)
 
-        created_image_db = db.query(Image).filter(
-            Image.id == created_image_schema.id).first()
+    # File of image of the same build was replaced by the new one
+    if previous_filename is not None and previous_filename != filename:
+        previous_filepath = os.path.join(upload_folder, previous_filename)
+        try:
+            os.remove(previous_filepath)
+        except FileNotFoundError:
+            logger.warning(
+                f"File of previous image of device {device_hostname} was not found. Path: '{previous_filepath}'")
 
-        if device.image:
-            delete_image(db, device.image.id)
+    return convert_from_model_to_schema(image_db)
 
-        device.image = created_image_db
-        db.commit()
 
-        return created_image_schema
-    except Exception as exc:
-        try:
-            os.remove(filepath)
-        finally:
-            raise exc
+async def save_image(db: Session, file: UploadFile, image_type: ImageType, image_version: str, device_hostname: str, commit: str = None) -> ImageSchema:
+    """
+    Saves the uploaded image file to the specified folder and creates a database entry.
+    """
+    try:
+        return await save_image_stream(db, read_upload_file(file), file.filename, image_type, image_version, device_hostname, commit)
     finally:
         await file.close()
@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional
+
+PARTIAL_SUFFIX = ".part"
+
+
+@dataclass
+class ImageFileDigest:
+    size: int
+    sha256: str
+    block_size: int
+    block_hashes: List[bytes] = field(default_factory=list)
+
+
+class ImageFileWriter:
+    """
+    Writes image to temporary file in image folder while hashing it.
+
+    Sha256 of the whole file and sha256 of every `block_size` block
+    (as in delta install) are calculated from the written data, so file
+    is never read again. File is flushed to disk by `finish` and appears
+    at its path only after `commit`, so it can replace the previous file
+    once the image is stored in database. Readers never see a partially
+    written image.
+    """
+
+    def __init__(self, folder: str, block_size: int):
+        self.folder = folder
+        self.block_size = block_size
+
+        fd, self.partial_path = tempfile.mkstemp(
+            dir=folder, prefix=".", suffix=PARTIAL_SUFFIX)
+        # Temporary file is private, image is read by install worker
+        os.fchmod(fd, 0o644)
+        self._file = os.fdopen(fd, "wb")
+
+        self._sha256 = hashlib.sha256()
+        self._block_sha256 = hashlib.sha256()
+        self._block_filled = 0
+        self._block_hashes: List[bytes] = []
+        self._size = 0
+
+        self.digest: Optional[ImageFileDigest] = None
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._sha256.update(data)
+        self._size += len(data)
+
+        view = memoryview(data)
+        while view:
+            part = view[:self.block_size - self._block_filled]
+            self._block_sha256.update(part)
+            self._block_filled += len(part)
+            view = view[len(part):]
+
+            if self._block_filled == self.block_size:
+                self._block_hashes.append(self._block_sha256.digest())
+                self._block_sha256 = hashlib.sha256()
+                self._block_filled = 0
+
+    def finish(self) -> ImageFileDigest:
+        """Flushes file to disk, file stays at its temporary path."""
+        # The last block is hashed as is without padding
+        if self._block_filled:
+            self._block_hashes.append(self._block_sha256.digest())
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        self.digest = ImageFileDigest(
+            size=self._size,
+            sha256=self._sha256.hexdigest(),
+            block_size=self.block_size,
+            block_hashes=self._block_hashes
+        )
+        return self.digest
+
+    def commit(self, path: str) -> None:
+        """Renames finished file to `path`, replacing existing file."""
+        os.replace(self.partial_path, path)
+        fsync_folder(self.folder)
+
+    def discard(self) -> None:
+        self._file.close()
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+
+def fsync_folder(folder: str) -> None:
+    """Makes rename in folder durable."""
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+async def write_image_file(chunks: AsyncIterator[bytes], folder: str, block_size: int, write_size: int) -> ImageFileWriter:
+    """
+    Writes stream of chunks to temporary file in `folder`, returns finished writer.
+
+    Chunks are collected up to `write_size` bytes and written
+    and hashed in a thread, so event loop is not blocked by disk.
+    File is removed if stream fails.
+    """
+    writer = await asyncio.to_thread(ImageFileWriter, folder, block_size)
+
+    try:
+        buffer = bytearray()
+        async for chunk in chunks:
+            buffer += chunk
+            if len(buffer) >= write_size:
+                await asyncio.to_thread(writer.write, buffer)
+                buffer = bytearray()
+
+        if buffer:
+            await asyncio.to_thread(writer.write, buffer)
+
+        await asyncio.to_thread(writer.finish)
+        return writer
+    except BaseException:
+        await asyncio.shield(asyncio.to_thread(writer.discard))
+        raise
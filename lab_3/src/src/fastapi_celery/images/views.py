@@ -1,6 +1,6 @@
 from typing import List, Annotated
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, Form
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile, Form
 from sqlalchemy.orm import Session
 
 from ..database import get_db
@@ -83,6 +83,47 @@ async def upload_single_file(
         raise HTTPException(status_code=500, detail=[str(exc), str(type(exc))])
 
 
+@router.post("/upload_stream", response_model=ImageSchema)
+async def upload_single_file_stream(
+    request: Request,
+    file_name: str,
+    image_type: ImageType,
+    image_version: str,
+    device_hostname: str,
+    commit: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Upload image sent as raw request body
+
+    Body is written to image folder while it is received, without
+    spooling it first. `file_name` is used for extension of image.
+    """
+    try:
+        created_image: ImageSchema = await image_service.save_image_stream(db,
+                                                                           chunks=request.stream(),
+                                                                           file_name=file_name,
+                                                                           image_type=image_type,
+                                                                           image_version=image_version,
+                                                                           device_hostname=device_hostname,
+                                                                           commit=commit
+                                                                           )
+
+        return created_image
+    except DeviceNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except UnspecifiedDeviceHostnameError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except ImageFileNotFoundError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except InvalidFileExtensionError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except EmptyFileExtensionError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=[str(exc), str(type(exc))])
+
+
 @router.delete('/remove_by_id', response_model=ImageSchema)
 async def remove_image_by_id(
     image_id: str,
@@ -0,0 +1,10 @@
+import redis
+import redis.asyncio
+
+from .config import env_settings
+
+# Shared connections to the Redis instance used as Celery result backend.
+# Connections are established lazily on the first command.
+redis_client = redis.Redis.from_url(env_settings.CELERY_RESULT_BACKEND)
+async_redis_client = redis.asyncio.Redis.from_url(
+    env_settings.CELERY_RESULT_BACKEND)
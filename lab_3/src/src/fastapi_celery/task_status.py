@@ -0,0 +1,129 @@
+import json
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from celery import Celery, states
+from celery.result import AsyncResult
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
+
+from .redis_client import async_redis_client
+
+# Upper bound of long-poll request, clients repeat request after it
+MAX_WAIT_S: int = 60
+KEEPALIVE_INTERVAL_S: float = 15
+
+
+def get_task_meta(task: AsyncResult) -> Optional[dict]:
+    """Meta of task state, exception of failed or retried task is returned as its type and message."""
+    if isinstance(task.info, BaseException):
+        return {'exc_type': type(task.info).__name__,
+                'exc_message': str(task.info)}
+
+    return task.info
+
+
+async def get_task_state(app: Celery, task_id: str) -> str:
+    raw_meta = await async_redis_client.get(app.backend.get_key_for_task(task_id))
+
+    if raw_meta is None:
+        return states.PENDING
+
+    return app.backend.decode_result(raw_meta)["status"]
+
+
+async def wait_for_task_update(app: Celery, task_id: str, timeout_s: float, since: Optional[str] = None) -> None:
+    """
+    Waits until state of task differs from `since` or task reports an update.
+
+    Redis result backend publishes every stored state to channel named
+    as the result key, so waiting costs one subscription instead of polling.
+    Returns at once if task is already finished.
+    """
+    async with async_redis_client.pubsub() as pubsub:
+        await pubsub.subscribe(app.backend.get_key_for_task(task_id))
+
+        # State is read after subscription, so update can't be missed in between
+        state = await get_task_state(app, task_id)
+        if state in states.READY_STATES or (since is not None and state != since):
+            return
+
+        deadline = time.monotonic() + timeout_s
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message is not None:
+                return
+
+
+async def wait_for_task_ready(app: Celery, task_id: str, timeout_s: float) -> str:
+    """Waits until task is finished or timeout expires, returns the last state of task."""
+    deadline = time.monotonic() + timeout_s
+    state = await get_task_state(app, task_id)
+
+    while state not in states.READY_STATES and (remaining := deadline - time.monotonic()) > 0:
+        await wait_for_task_update(app, task_id, remaining, since=state)
+        state = await get_task_state(app, task_id)
+
+    return state
+
+
+async def iter_task_updates(
+    app: Celery,
+    task_id: str,
+    build_response: Callable[[], Awaitable[BaseModel]]
+) -> AsyncIterator[Optional[BaseModel]]:
+    """
+    Yields status response of task on subscription and on every update until task is finished.
+
+    None is yielded if task was not updated for KEEPALIVE_INTERVAL_S.
+    """
+    async with async_redis_client.pubsub() as pubsub:
+        await pubsub.subscribe(app.backend.get_key_for_task(task_id))
+
+        while True:
+            response = await build_response()
+            yield response
+
+            if response.status in states.READY_STATES:
+                return
+
+            keepalive_at = time.monotonic() + KEEPALIVE_INTERVAL_S
+            # get_message also returns None for skipped subscribe confirmations
+            while await pubsub.get_message(ignore_subscribe_messages=True,
+                                           timeout=max(keepalive_at - time.monotonic(), 0)) is None:
+                if time.monotonic() >= keepalive_at:
+                    yield None
+                    keepalive_at = time.monotonic() + KEEPALIVE_INTERVAL_S
+
+
+async def stream_task_events(
+    app: Celery,
+    task_id: str,
+    build_response: Callable[[], Awaitable[BaseModel]]
+) -> AsyncIterator[str]:
+    """Server-Sent Events with status response of task."""
+    async for response in iter_task_updates(app, task_id, build_response):
+        if response is None:
+            yield ": keep-alive\n\n"
+            continue
+
+        yield f"event: status\ndata: {json.dumps(response.model_dump(mode='json'))}\n\n"
+
+
+async def send_task_updates(
+    websocket: WebSocket,
+    app: Celery,
+    task_id: str,
+    build_response: Callable[[], Awaitable[BaseModel]]
+) -> None:
+    """Sends status response of task to websocket until task is finished."""
+    await websocket.accept()
+
+    try:
+        async for response in iter_task_updates(app, task_id, build_response):
+            if response is not None:
+                await websocket.send_json(response.model_dump(mode="json"))
+    except WebSocketDisconnect:
+        return
+
+    await websocket.close()
@@ -0,0 +1,112 @@
+import os
+import sys
+import types
+
+import fakeredis
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Settings are read from environment when modules are imported
+os.environ.setdefault("POSTGRESQL_USER", "test")
+os.environ.setdefault("POSTGRESQL_PASSWORD", "test")
+os.environ.setdefault("POSTGRESQL_SERVER", "localhost")
+os.environ.setdefault("POSTGRESQL_PORT", "5432")
+os.environ.setdefault("POSTGRESQL_DB", "test")
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+
+
+def _install_test_redis() -> None:
+    """Shared redis clients are replaced before modules which use them are imported."""
+    from src.fastapi_celery import redis_client
+
+    server = fakeredis.FakeServer()
+    redis_client.redis_client = fakeredis.FakeRedis(server=server)
+    redis_client.async_redis_client = fakeredis.FakeAsyncRedis(server=server)
+
+
+def _install_test_database() -> None:
+    """Models are bound to in-memory sqlite, so modules which use database are imported without postgresql."""
+    from src.fastapi_celery.bolid.model import Bolid  # noqa: F401
+    from src.fastapi_celery.dependencies import Base
+    from src.fastapi_celery.device_data.model import Device  # noqa: F401
+    from src.fastapi_celery.device_pin_control.model import BolidPin  # noqa: F401
+    from src.fastapi_celery.device_reserve.model import Reservation  # noqa: F401
+    from src.fastapi_celery.images.model import Image  # noqa: F401
+
+    engine = create_engine("sqlite://",
+                           connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+
+    database = types.ModuleType("src.fastapi_celery.database")
+    database.engine = engine
+    database.SessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, bind=engine)
+
+    def get_db():
+        db = database.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    database.get_db = get_db
+    sys.modules[database.__name__] = database
+
+
+_install_test_redis()
+_install_test_database()
+
+
+@pytest.fixture(autouse=True)
+def redis_client():
+    from src.fastapi_celery.redis_client import redis_client
+
+    redis_client.flushall()
+    yield redis_client
+    redis_client.flushall()
+
+
+@pytest.fixture(autouse=True)
+def result_backend(monkeypatch, redis_client):
+    """Task states and results of all workers are stored in fake redis."""
+    from celery.backends.redis import RedisBackend
+
+    monkeypatch.setattr(RedisBackend, "client", property(lambda backend: redis_client))
+
+
+@pytest.fixture
+def db():
+    from src.fastapi_celery.database import SessionLocal, engine
+    from src.fastapi_celery.dependencies import Base
+
+    session = SessionLocal()
+    yield session
+    session.close()
+
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+
+@pytest.fixture
+def device(db):
+    """Device with dev image, pins of device are not created."""
+    from src.fastapi_celery.device_data.model import Device
+    from src.fastapi_celery.enums import DeviceTestStage, DeviceType, ImageType
+    from src.fastapi_celery.images.model import Image
+
+    image = Image(id="image-1", type=ImageType.DEV, version="1.0",
+                  commit="abc", filename="device-1-dev-1.0-abc.img")
+    device = Device(hostname="device-1", mac="00:00:00:00:00:01", ip="192.168.0.10",
+                    type=DeviceType.V2, https_port=443, ws_port=8080,
+                    rs232_port="/dev/ttyS0", output_power_id="power-pin",
+                    output_boot_id="boot-pin", test_stage=DeviceTestStage.NONE,
+                    image=image)
+    db.add(device)
+    db.commit()
+
+    return device
@@ -0,0 +1,147 @@
+import io
+from typing import List
+
+import pytest
+from celery import states
+
+from src.fastapi_celery.config import server_settings
+from src.fastapi_celery.device_rs232 import tasks
+from src.fastapi_celery.device_rs232.binary_transfer import (ACK, CPMEOF, EOT,
+                                                             LARGE_BLOCK_SIZE,
+                                                             NAK, SOH, STX,
+                                                             ModemSender,
+                                                             crc16)
+
+
+class FakeConsole:
+    port = "/dev/ttyTEST"
+    end_offset = 0
+
+    def __init__(self):
+        self.packets: List[bytes] = []
+
+    def write(self, data) -> None:
+        self.packets.append(bytes(data))
+
+
+class FakeCursor:
+    """Answers of receiver, every packet is acknowledged when answers run out."""
+
+    def __init__(self, answers: List[int] = ()):
+        self.answers = list(answers)
+        self.timeout = 0
+
+    def read(self, size: int = 1) -> bytes:
+        return bytes([self.answers.pop(0) if self.answers else ACK])
+
+
+def create_sender(console: FakeConsole, cursor: FakeCursor, block_size: int) -> ModemSender:
+    return ModemSender(console, cursor, block_size, ack_timeout=1, max_retries=3)
+
+
+def test_crc16_xmodem_check_value():
+    assert crc16(b"123456789") == 0x31C3
+
+
+def test_send_file_frames_xmodem_crc_packets():
+    data = bytes(range(200))
+    console = FakeConsole()
+    sender = create_sender(console, FakeCursor(), 128)
+
+    assert sender.send_file(io.BytesIO(data), len(data)) == len(data)
+    assert len(console.packets) == 2
+
+    for block_number, packet in enumerate(console.packets, start=1):
+        assert len(packet) == 3 + 128 + 2
+        assert packet[0] == SOH
+        assert packet[1] == block_number
+        assert packet[2] == 0xFF - block_number
+        assert int.from_bytes(packet[-2:], "big") == crc16(packet[3:-2])
+
+    assert console.packets[0][3:-2] == data[:128]
+    # The last block is padded
+    assert console.packets[1][3:-2] == data[128:] + bytes([CPMEOF]) * 56
+
+
+def test_send_file_of_1k_blocks():
+    data = b"x" * LARGE_BLOCK_SIZE
+    console = FakeConsole()
+    sender = create_sender(console, FakeCursor(), LARGE_BLOCK_SIZE)
+
+    sender.send_file(io.BytesIO(data), len(data))
+
+    assert console.packets[0][0] == STX
+    assert len(console.packets[0]) == 3 + LARGE_BLOCK_SIZE + 2
+
+
+def test_send_file_retransmits_block_on_nak():
+    data = b"y" * 128
+    console = FakeConsole()
+    sender = create_sender(console, FakeCursor([NAK]), 128)
+
+    sender.send_file(io.BytesIO(data), len(data))
+
+    assert sender.retransmits == 1
+    assert console.packets == [console.packets[0]] * 2
+
+
+def test_send_file_reduces_block_size_after_errors():
+    data = b"z" * LARGE_BLOCK_SIZE
+    console = FakeConsole()
+    sender = create_sender(console, FakeCursor([NAK, NAK]), LARGE_BLOCK_SIZE)
+
+    assert sender.send_file(io.BytesIO(data), len(data)) == len(data)
+
+    assert [packet[0] for packet in console.packets] == [STX, STX] + [SOH] * 8
+    assert [packet[1] for packet in console.packets[2:]] == list(range(1, 9))
+
+
+def test_send_eot_until_acknowledged():
+    console = FakeConsole()
+    sender = create_sender(console, FakeCursor([NAK]), 128)
+
+    sender.send_eot()
+
+    assert console.packets == [bytes([EOT])] * 2
+
+
+@pytest.fixture
+def transfer_folder(monkeypatch, tmp_path):
+    monkeypatch.setattr(server_settings.RS232_SETTINGS, "TRANSFER_FOLDER_PATH", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def console(monkeypatch):
+    console = FakeConsole()
+    monkeypatch.setattr(tasks.console_manager, "get_console", lambda port, baudrate: console)
+    return console
+
+
+def test_transfer_task_sends_raw_file(transfer_folder, console):
+    (transfer_folder / "u-boot.bin").write_bytes(b"z" * 300)
+
+    result = tasks.rs232_transfer_task.apply(kwargs=dict(
+        port=FakeConsole.port, baudrate=115200, file_name="u-boot.bin", protocol="raw"))
+
+    assert result.state == states.SUCCESS
+    assert result.result["transferred_bytes"] == 300
+    assert b"".join(console.packets) == b"z" * 300
+
+
+def test_transfer_task_fails_after_retries(monkeypatch, transfer_folder, console):
+    attempts = []
+    send_file = tasks.transfer_file
+
+    def transfer_file(*args):
+        attempts.append(args[1])
+        return send_file(*args)
+
+    monkeypatch.setattr(tasks, "transfer_file", transfer_file)
+
+    result = tasks.rs232_transfer_task.apply(kwargs=dict(
+        port=FakeConsole.port, baudrate=115200, file_name="missing.bin", protocol="raw"))
+
+    assert result.state == states.FAILURE
+    assert isinstance(result.result, tasks.Rs232TransferError)
+    assert attempts == ["missing.bin"] * (tasks.rs232_transfer_task.max_retries + 1)
@@ -0,0 +1,31 @@
+from src.fastapi_celery.device_pin_control.bolid_driver import (build_frame,
+                                                               crc16_modbus,
+                                                               pack_coils,
+                                                               unpack_coils)
+
+
+def test_crc16_modbus_of_read_holding_registers_request():
+    # Read 10 registers from address 0 of slave 1
+    assert crc16_modbus(bytes.fromhex("01030000000a")) == 0xCDC5
+
+
+def test_build_frame_appends_crc_low_byte_first():
+    frame = build_frame(1, 0x03, bytes.fromhex("0000000a"))
+
+    assert frame == bytes.fromhex("01030000000ac5cd")
+    # CRC over frame with its own CRC is zero
+    assert crc16_modbus(frame) == 0
+
+
+def test_pack_coils_lsb_first():
+    # Coils 20-29 of write multiple coils example of Modbus specification
+    values = [True, False, True, True, False, False, True, True, True, False]
+
+    assert pack_coils(values) == bytes.fromhex("cd01")
+    assert unpack_coils(pack_coils(values), len(values)) == values
+
+
+def test_pack_coils_of_full_bytes():
+    assert pack_coils([]) == b""
+    assert pack_coils([False] * 8) == b"\x00"
+    assert pack_coils([True] * 9) == b"\xff\x01"
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from src.fastapi_celery.device_install.broadcast import ImageBroadcast
+
+DATA = bytes(range(256)) * 16
+WINDOW = 1024
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / "image.bin"
+    path.write_bytes(DATA)
+    return str(path)
+
+
+def create_broadcast(path: str, sinks: int, join_timeout_s: float = 0.1, stall_timeout_s: float = 5) -> ImageBroadcast:
+    return ImageBroadcast(path, sinks, window_bytes=WINDOW,
+                          join_timeout_s=join_timeout_s, stall_timeout_s=stall_timeout_s)
+
+
+def read_all(reader, chunk_size: int = 256) -> bytes:
+    data = bytearray()
+    while chunk := reader.read(chunk_size):
+        data += chunk
+    return bytes(data)
+
+
+def test_sinks_read_the_same_image(image_path):
+    broadcast = create_broadcast(image_path, sinks=3, join_timeout_s=1)
+    results = {}
+
+    def sink(number: int) -> None:
+        with broadcast.join() as reader:
+            results[number] = (read_all(reader), reader.detached)
+
+    threads = [threading.Thread(target=sink, args=(number,)) for number in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    broadcast.close()
+
+    assert results == {number: (DATA, False) for number in range(3)}
+    assert broadcast.detached == 0
+
+
+def test_fast_sink_waits_within_window(image_path):
+    broadcast = create_broadcast(image_path, sinks=2)
+    fast = broadcast.join()
+    slow = broadcast.join()
+
+    assert fast.read(WINDOW) == DATA[:WINDOW]
+
+    moved = threading.Event()
+
+    def read_beyond_window() -> None:
+        fast.read(256)
+        moved.set()
+
+    thread = threading.Thread(target=read_beyond_window)
+    thread.start()
+
+    # Fast sink can't move further than window ahead of the slowest one
+    assert not moved.wait(0.2)
+
+    slow.read(256)
+
+    assert moved.wait(1)
+    thread.join(1)
+    broadcast.close()
+
+
+def test_stalled_sink_is_detached(image_path):
+    broadcast = create_broadcast(image_path, sinks=2, stall_timeout_s=0.2)
+    fast = broadcast.join()
+    stalled = broadcast.join()
+
+    start = time.monotonic()
+    data = read_all(fast)
+
+    assert data == DATA
+    assert time.monotonic() - start >= 0.2
+    assert stalled.detached
+    assert broadcast.detached == 1
+
+    # Detached sink continues alone
+    assert read_all(stalled) == DATA
+    broadcast.close()
+
+
+def test_late_sink_reads_alone(image_path):
+    broadcast = create_broadcast(image_path, sinks=2)
+    first = broadcast.join()
+    broadcast.leave()
+
+    for _ in range(WINDOW * 2 // 256):
+        first.read(256)
+    late = broadcast.join()
+
+    assert late.detached
+    assert read_all(late) == DATA
+    assert read_all(first) == DATA[WINDOW * 2:]
+    broadcast.close()
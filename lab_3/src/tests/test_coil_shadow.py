@@ -0,0 +1,67 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from src.fastapi_celery.device_pin_control import bolid_driver as driver_module
+from src.fastapi_celery.device_pin_control import coil_shadow
+from src.fastapi_celery.device_pin_control.bolid_driver import BolidDriver, BolidSession
+from src.fastapi_celery.device_pin_control.coil_shadow import (get_coil_states,
+                                                               publish_coil_states,
+                                                               refresh_coil_states)
+from src.fastapi_celery.exceptions import BolidModbusError
+
+BOLID = {"name": "bolid-1", "port": "/dev/ttyUSB0", "pin_capacity": 16,
+         "baudrate": 9600, "parity": "N", "stopbits": 1, "bytesize": 8}
+
+
+@pytest.fixture(autouse=True)
+def async_redis_client(monkeypatch, redis_client):
+    # Blocking commands bind connection to event loop, every test runs its own loop
+    server = redis_client.connection_pool.connection_kwargs["server"]
+    monkeypatch.setattr(coil_shadow, "async_redis_client", fakeredis.FakeAsyncRedis(server=server))
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    monkeypatch.setattr(driver_module, "REFRESH_REQUEST_WAIT_S", 0.05)
+    driver = BolidDriver()
+    driver.start([], poll_interval_s=60)
+    yield driver
+    driver.close_all()
+
+
+def test_published_states_are_read_back():
+    publish_coil_states("bolid-1", {1: (True, 100.0), 2: (False, 101.5)})
+
+    assert get_coil_states(["bolid-1", "bolid-2"]) == {
+        "bolid-1": {1: (True, 100.0), 2: (False, 101.5)},
+        "bolid-2": {}
+    }
+
+
+def test_refresh_is_served_by_driver(monkeypatch, driver):
+    refreshed = []
+    monkeypatch.setattr(BolidSession, "refresh", lambda session: refreshed.append(session.bolid.name))
+
+    errors = asyncio.run(refresh_coil_states([BOLID], timeout_s=5))
+
+    assert errors == {"bolid-1": None}
+    assert refreshed == ["bolid-1"]
+
+
+def test_failed_refresh_is_reported(monkeypatch, driver):
+    def refresh(session):
+        raise BolidModbusError("No response from bolid-1")
+
+    monkeypatch.setattr(BolidSession, "refresh", refresh)
+
+    errors = asyncio.run(refresh_coil_states([BOLID], timeout_s=5))
+
+    assert errors == {"bolid-1": "No response from bolid-1"}
+
+
+def test_refresh_without_driver_is_not_waited_for_longer_than_timeout():
+    errors = asyncio.run(refresh_coil_states([BOLID], timeout_s=0.1))
+
+    assert errors == {}
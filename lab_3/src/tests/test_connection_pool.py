@@ -0,0 +1,181 @@
+import threading
+
+import paramiko
+import pytest
+
+from src.fastapi_celery.device_ssh import connection_pool
+from src.fastapi_celery.device_ssh.connection_pool import (SshConnectionPool,
+                                                           get_pool_stats)
+from src.fastapi_celery.exceptions import SshPoolExhaustedError
+
+
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+
+    def is_active(self) -> bool:
+        return self.active
+
+    def send_ignore(self) -> None:
+        pass
+
+    def set_keepalive(self, interval: int) -> None:
+        pass
+
+
+class FakeSSHClient:
+    """SSH client which connects without network, connected clients are collected."""
+    clients = []
+    password = "password"
+
+    def __init__(self):
+        self.transport = None
+        self.closed = False
+
+    def set_missing_host_key_policy(self, policy) -> None:
+        pass
+
+    def connect(self, hostname: str, port: int, username: str, password: str) -> None:
+        if password != self.password:
+            raise paramiko.AuthenticationException("Authentication failed")
+
+        self.transport = FakeTransport()
+        FakeSSHClient.clients.append(self)
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def ssh_clients(monkeypatch):
+    FakeSSHClient.clients = []
+    monkeypatch.setattr(connection_pool.paramiko, "SSHClient", FakeSSHClient)
+    return FakeSSHClient.clients
+
+
+def create_pool(idle_timeout_s: float = 60, max_per_host: int = 2, acquire_timeout_s: float = 0.2) -> SshConnectionPool:
+    return SshConnectionPool(idle_timeout_s=idle_timeout_s, max_per_host=max_per_host,
+                             acquire_timeout_s=acquire_timeout_s, keepalive_s=0)
+
+
+def connect(pool: SshConnectionPool, hostname: str = "192.168.0.10", image_type: str = "dev",
+            image_id: str = None, password: str = "password"):
+    return pool.connection(hostname, 22, "root", image_type, lambda: password, image_id)
+
+
+def test_connection_is_reused(ssh_clients):
+    pool = create_pool()
+
+    with connect(pool) as first:
+        pass
+    with connect(pool) as second:
+        pass
+
+    assert first is second
+    assert len(ssh_clients) == 1
+    assert pool.stats() == {"hits": 1, "misses": 1, "evictions": 0, "idle": 1, "open": 1}
+    assert get_pool_stats() == {"hits": 1, "misses": 1}
+
+
+def test_connections_are_keyed_by_image_type(ssh_clients):
+    pool = create_pool()
+
+    with connect(pool, image_type="dev") as dev_client:
+        pass
+    with connect(pool, image_type="release") as release_client:
+        pass
+
+    assert dev_client is not release_client
+    assert pool.stats()["open"] == 2
+
+
+def test_dead_connection_is_replaced(ssh_clients):
+    pool = create_pool()
+
+    with connect(pool) as first:
+        pass
+    first.transport.active = False
+
+    with connect(pool) as second:
+        pass
+
+    assert second is not first
+    assert first.closed
+    assert pool.stats()["open"] == 1
+
+
+def test_connection_of_previous_image_is_closed(ssh_clients):
+    pool = create_pool()
+
+    with connect(pool, image_id="image-1") as first:
+        pass
+    with connect(pool, image_id="image-2") as second:
+        pass
+
+    assert second is not first
+    assert first.closed
+
+
+def test_idle_connections_are_evicted(ssh_clients):
+    pool = create_pool(idle_timeout_s=0.01)
+
+    with connect(pool) as first:
+        pass
+    threading.Event().wait(0.05)
+    with connect(pool) as second:
+        pass
+
+    assert second is not first
+    assert first.closed
+    assert pool.stats()["evictions"] == 1
+    assert get_pool_stats()["evictions"] == 1
+
+
+def test_connections_per_host_are_limited(ssh_clients):
+    pool = create_pool(max_per_host=1)
+
+    with connect(pool, image_type="dev"):
+        with pytest.raises(SshPoolExhaustedError):
+            with connect(pool, image_type="dev"):
+                pass
+
+    # Idle connection of another key is closed to free the slot
+    with connect(pool, image_type="release"):
+        pass
+
+    assert pool.stats()["open"] == 1
+
+
+def test_waiting_thread_gets_released_connection(ssh_clients):
+    pool = create_pool(max_per_host=1, acquire_timeout_s=5)
+    acquired = []
+
+    def wait_for_connection() -> None:
+        with connect(pool) as client:
+            acquired.append(client)
+
+    with connect(pool) as first:
+        thread = threading.Thread(target=wait_for_connection)
+        thread.start()
+        thread.join(0.1)
+        assert not acquired
+
+    thread.join(5)
+
+    assert acquired == [first]
+
+
+def test_failed_authentication_frees_slot(ssh_clients):
+    pool = create_pool(max_per_host=1)
+
+    with pytest.raises(paramiko.AuthenticationException):
+        with connect(pool, password="wrong"):
+            pass
+
+    with connect(pool):
+        pass
+
+    assert pool.stats()["open"] == 1
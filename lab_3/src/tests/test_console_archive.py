@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.fastapi_celery.config import server_settings
+from src.fastapi_celery.device_rs232 import console_archive, views
+from src.fastapi_celery.device_rs232.console_archive import (
+    RETENTION_CHECK_INTERVAL_S, ConsoleArchive, iter_archive_range,
+    list_segments)
+
+PORT = "/dev/ttyS0"
+# 2026-01-01T00:00:00Z
+START_TIME = 1767225600.0
+
+
+class Clock:
+    def __init__(self):
+        self.now = START_TIME
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch, tmp_path):
+    clock = Clock()
+    monkeypatch.setattr(console_archive, "time", clock)
+    monkeypatch.setattr(server_settings.RS232_SETTINGS, "ARCHIVE_FOLDER_PATH", str(tmp_path))
+    return clock
+
+
+def create_archive(**kwargs) -> ConsoleArchive:
+    settings = dict(segment_bytes=1024, index_interval_s=5, retention_bytes=1 << 20, retention_s=3600)
+    settings.update(kwargs)
+    return ConsoleArchive(PORT, **settings)
+
+
+def test_output_is_read_by_time_range(clock):
+    archive = create_archive()
+    for number in range(6):
+        archive.append(f"line {number}\n".encode(), number * 7)
+        clock.now += 5
+    archive.close()
+
+    output = b"".join(iter_archive_range(PORT, START_TIME + 10, START_TIME + 15))
+
+    assert output == b"line 2\nline 3\n"
+
+
+def test_old_segments_are_removed_on_rollover(clock):
+    archive = create_archive(segment_bytes=10, retention_bytes=25)
+    for _ in range(5):
+        archive.append(b"0123456789", 0)
+        clock.now += 1
+    archive.close()
+
+    assert len(list_segments(archive.folder)) < 5
+
+
+def test_expired_segments_of_silent_console_are_removed(clock):
+    archive = create_archive(segment_bytes=10, retention_s=3600)
+    archive.append(b"0123456789", 0)
+    clock.now += 1
+    archive.append(b"boot log", 10)
+    assert len(list_segments(archive.folder)) == 2
+
+    # Console is silent, nothing rolls over
+    clock.now += 3600
+    archive.flush_expired()
+    assert len(list_segments(archive.folder)) == 2
+
+    clock.now += RETENTION_CHECK_INTERVAL_S
+    archive.flush_expired()
+    assert len(list_segments(archive.folder)) == 1
+    archive.close()
+
+
+def test_archive_range_without_timezone_is_utc(clock, device):
+    archive = create_archive()
+    archive.append(b"before\n", 0)
+    clock.now += 10
+    archive.append(b"in range\n", 7)
+    clock.now += 10
+    archive.append(b"after\n", 16)
+    archive.close()
+
+    app = FastAPI()
+    app.include_router(views.router)
+    client = TestClient(app)
+    start = datetime.fromtimestamp(START_TIME + 10, timezone.utc)
+
+    naive = client.get("/device_rs232/console/device-1/archive", params={
+        "start": start.replace(tzinfo=None).isoformat(),
+        "end": (start + timedelta(seconds=5)).replace(tzinfo=None).isoformat()})
+    aware = client.get("/device_rs232/console/device-1/archive", params={
+        "start": start.astimezone(timezone(timedelta(hours=3))).isoformat(),
+        "end": (start + timedelta(seconds=5)).isoformat()})
+
+    assert naive.status_code == aware.status_code == 200
+    assert naive.text == aware.text == "in range\n"
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+import serial
+from serial import SerialException
+
+from src.fastapi_celery.device_rs232 import console_manager
+from src.fastapi_celery.device_rs232.console_manager import (ConsoleCursor,
+                                                             SerialConsole)
+from src.fastapi_celery.device_rs232.serial_module import read_from_serial
+from src.fastapi_celery.enums import Rs232StopReason
+
+
+class LoopSerial:
+    """Loopback port, reconfiguration of port during read is an error."""
+
+    def __init__(self, baudrate: int, timeout: float):
+        self._serial = serial.serial_for_url("loop://", baudrate=baudrate, timeout=timeout)
+        self._reading = threading.Lock()
+        self.reconfigured_during_read = False
+        self.fail_next_read = False
+
+    @property
+    def baudrate(self) -> int:
+        return self._serial.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate: int) -> None:
+        if self._reading.locked():
+            self.reconfigured_during_read = True
+        self._serial.baudrate = baudrate
+
+    @property
+    def in_waiting(self) -> int:
+        return self._serial.in_waiting
+
+    def read(self, size: int) -> bytes:
+        with self._reading:
+            if self.fail_next_read:
+                self.fail_next_read = False
+                raise SerialException("Device disconnected")
+            return self._serial.read(size)
+
+    def write(self, data: bytes) -> int:
+        return self._serial.write(data)
+
+    def close(self) -> None:
+        self._serial.close()
+
+
+@pytest.fixture
+def ports(monkeypatch):
+    """Ports opened by consoles in order of opening."""
+    opened = []
+
+    def connect_via_serial(port, baudrate, timeout):
+        opened.append(LoopSerial(baudrate, timeout=0.05))
+        return opened[-1]
+
+    monkeypatch.setattr(console_manager, "connect_via_serial", connect_via_serial)
+    monkeypatch.setattr(console_manager, "READER_TIMEOUT_S", 0.05)
+    return opened
+
+
+@pytest.fixture
+def console(ports):
+    console = SerialConsole("/dev/ttyS0", 115200, buffer_bytes=16, reopen_delay_s=0.01)
+    console.start()
+    yield console
+    console.stop()
+
+
+def wait_for_offset(console: SerialConsole, offset: int) -> None:
+    deadline = time.monotonic() + 2
+    while console.end_offset < offset and time.monotonic() < deadline:
+        console.wait_for_data(console.end_offset, 0.1)
+    assert console.end_offset >= offset
+
+
+def test_output_is_read_since_offset(console):
+    console.write(b"hello ")
+    console.write(b"world")
+    wait_for_offset(console, 11)
+
+    assert console.read_since(0) == (b"hello world", 11, 0)
+    assert console.read_since(6, max_bytes=3) == (b"wor", 9, 0)
+
+
+def test_readers_are_told_about_dropped_output(console):
+    console.write(b"0123456789abcdefXYZ")
+    wait_for_offset(console, 19)
+
+    # Buffer keeps only the last 16 bytes
+    assert console.read_since(0) == (b"3456789abcdefXYZ", 19, 3)
+
+
+def test_cursor_reads_until_terminator(console):
+    cursor = ConsoleCursor(console, timeout=1)
+    console.write(b"boot\nlogin: ")
+
+    text, stop_reason = read_from_serial(cursor, terminator="login: $", idle_timeout=1)
+
+    assert stop_reason == Rs232StopReason.TERMINATOR
+    assert text == "boot\nlogin: "
+
+
+def test_baudrate_is_changed_between_reads(console, ports):
+    console.write(b"before")
+    wait_for_offset(console, 6)
+
+    for baudrate in (9600, 57600, 115200, 9600):
+        console.set_baudrate(baudrate)
+
+    console.write(b"after")
+    wait_for_offset(console, 11)
+
+    assert ports[-1].baudrate == 9600
+    assert not ports[-1].reconfigured_during_read
+    assert console.read_since(6) == (b"after", 11, 0)
+
+
+def test_console_is_reopened_after_failure(console, ports):
+    console.write(b"first")
+    wait_for_offset(console, 5)
+
+    console.set_baudrate(9600)
+    ports[0].fail_next_read = True
+    deadline = time.monotonic() + 2
+    while len(ports) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    console.write(b"second")
+    wait_for_offset(console, 11)
+
+    # Port is reopened with the last baudrate, offsets continue
+    assert ports[1].baudrate == 9600
+    assert console.read_since(5) == (b"second", 11, 0)
@@ -0,0 +1,43 @@
+import hashlib
+
+from src.fastapi_celery.device_install.delta import (compute_block_hashes,
+                                                     get_changed_runs)
+
+
+def test_compute_block_hashes_last_block_without_padding(tmp_path):
+    data = b"a" * 4 + b"b" * 4 + b"c" * 2
+    path = tmp_path / "image.bin"
+    path.write_bytes(data)
+
+    assert compute_block_hashes(str(path), 4) == [
+        hashlib.sha256(b"aaaa").digest(),
+        hashlib.sha256(b"bbbb").digest(),
+        hashlib.sha256(b"cc").digest(),
+    ]
+
+
+def test_compute_block_hashes_of_empty_file(tmp_path):
+    path = tmp_path / "image.bin"
+    path.write_bytes(b"")
+
+    assert compute_block_hashes(str(path), 4) == []
+
+
+def test_get_changed_runs_of_equal_blocks():
+    hashes = [b"1", b"2", b"3"]
+
+    assert get_changed_runs(hashes, list(hashes)) == []
+
+
+def test_get_changed_runs_merges_adjacent_blocks():
+    image_hashes = [b"1", b"2", b"3", b"4", b"5", b"6"]
+    device_hashes = [b"1", b"x", b"x", b"4", b"x", b"6"]
+
+    assert get_changed_runs(image_hashes, device_hashes) == [(1, 2), (4, 1)]
+
+
+def test_get_changed_runs_of_blocks_missing_on_device():
+    image_hashes = [b"1", b"2", b"3", b"4"]
+    device_hashes = [b"1", b"x"]
+
+    assert get_changed_runs(image_hashes, device_hashes) == [(1, 3)]
@@ -0,0 +1,116 @@
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+from pydantic import TypeAdapter
+
+from src.fastapi_celery.device_rs232.console_manager import ConsoleCursor
+from src.fastapi_celery.device_rs232.dialog import expect, run_dialog
+from src.fastapi_celery.device_rs232.schemas import Rs232DialogStep
+
+STEPS = TypeAdapter(list[Rs232DialogStep])
+
+
+class FakeConsole:
+    """Console of device which answers to written commands."""
+    port = "/dev/ttyS0"
+
+    def __init__(self, replies: Optional[Dict[bytes, bytes]] = None):
+        self.replies = replies or {}
+        self.written = []
+        self._output = bytearray()
+        self._cond = threading.Condition()
+
+    @property
+    def end_offset(self) -> int:
+        return len(self._output)
+
+    def receive(self, data: bytes) -> None:
+        with self._cond:
+            self._output += data
+            self._cond.notify_all()
+
+    def write(self, data: bytes) -> None:
+        self.written.append(data)
+        self.receive(self.replies.get(data, b""))
+
+    def read_since(self, offset: int, max_bytes: Optional[int] = None):
+        with self._cond:
+            end = len(self._output) if max_bytes is None else offset + max_bytes
+            data = bytes(self._output[offset:end])
+        return data, offset + len(data), 0
+
+    def wait_for_data(self, offset: int, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self._output) > offset, timeout)
+
+
+def test_expect_leaves_output_after_match_unread():
+    console = FakeConsole()
+    console.receive(b"Hit any key to stop autoboot: 3\n=> ")
+    cursor = ConsoleCursor(console, offset=0)
+
+    output, match = expect(cursor, re.compile(b"autoboot"), timeout=1)
+
+    assert output == b"Hit any key to stop autoboot"
+    assert match.group() == b"autoboot"
+    assert cursor.offset == len(output)
+
+
+def test_expect_finds_pattern_split_between_reads():
+    console = FakeConsole()
+    cursor = ConsoleCursor(console, offset=0)
+    console.receive(b"log")
+    threading.Timer(0.05, console.receive, args=(b"in: ",)).start()
+
+    output, match = expect(cursor, re.compile(b"login: "), timeout=1)
+
+    assert output == b"login: "
+    assert match is not None
+
+
+def test_expect_timeout():
+    console = FakeConsole()
+    console.receive(b"Kernel panic")
+    cursor = ConsoleCursor(console, offset=0)
+
+    start = time.monotonic()
+    output, match = expect(cursor, re.compile(b"login:"), timeout=0.1)
+
+    assert match is None
+    assert output == b"Kernel panic"
+    assert 0.1 <= time.monotonic() - start < 0.5
+
+
+def test_dialog_runs_steps_in_order():
+    console = FakeConsole({b"\n": b"\n=> ", b"printenv bootdelay\n": b"bootdelay=3\n=> "})
+
+    result = run_dialog(console, STEPS.validate_python([
+        {"action": "send", "text": "\n"},
+        {"action": "expect", "pattern": "=> ", "timeout": 1},
+        {"action": "send", "text": "printenv bootdelay\n"},
+        {"action": "expect", "pattern": r"bootdelay=(\d+)", "timeout": 1},
+        {"action": "sleep", "seconds": 0.01}
+    ]))
+
+    assert console.written == [b"\n", b"printenv bootdelay\n"]
+    assert result.failed_step is None
+    assert [step.success for step in result.steps] == [True] * 5
+    assert result.steps[3].match == "bootdelay=3"
+    # Prompt after the last match wasn't consumed
+    assert result.offset == console.end_offset - len("\n=> ")
+
+
+def test_dialog_stops_on_unmatched_expect():
+    console = FakeConsole()
+
+    result = run_dialog(console, STEPS.validate_python([
+        {"action": "expect", "pattern": "login:", "timeout": 0.05},
+        {"action": "send", "text": "root\n"}
+    ]))
+
+    assert result.failed_step == 0
+    assert len(result.steps) == 1
+    assert not result.steps[0].success
+    assert console.written == []
@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from src.fastapi_celery.device_install.delta import compute_block_hashes
+from src.fastapi_celery.images.storage import ImageFileWriter, write_image_file
+
+DATA = bytes(range(256)) * 41
+
+
+def test_writer_hashes_blocks_across_writes(tmp_path):
+    writer = ImageFileWriter(str(tmp_path), block_size=1000)
+    # Writes of different size split blocks in different places
+    for offset, size in ((0, 1), (1, 999), (1000, 1500), (2500, 7), (2507, len(DATA))):
+        writer.write(DATA[offset:offset + size])
+
+    digest = writer.finish()
+    path = tmp_path / "image.bin"
+    writer.commit(str(path))
+
+    assert path.read_bytes() == DATA
+    assert digest.size == len(DATA)
+    assert digest.sha256 == hashlib.sha256(DATA).hexdigest()
+    assert digest.block_size == 1000
+    # Block hashes are the same as hashes of delta install
+    assert digest.block_hashes == compute_block_hashes(str(path), 1000)
+
+
+def test_writer_keeps_file_at_temporary_path_until_commit(tmp_path):
+    path = tmp_path / "image.bin"
+    path.write_bytes(b"previous")
+
+    writer = ImageFileWriter(str(tmp_path), block_size=1000)
+    writer.write(DATA)
+    writer.finish()
+
+    assert path.read_bytes() == b"previous"
+
+    writer.commit(str(path))
+
+    assert path.read_bytes() == DATA
+    assert not os.path.exists(writer.partial_path)
+
+
+def test_writer_discard_removes_temporary_file(tmp_path):
+    writer = ImageFileWriter(str(tmp_path), block_size=1000)
+    writer.write(DATA)
+    writer.discard()
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_write_image_file_of_chunks(tmp_path):
+    async def chunks():
+        for offset in range(0, len(DATA), 333):
+            yield DATA[offset:offset + 333]
+
+    writer = asyncio.run(write_image_file(
+        chunks(), str(tmp_path), block_size=1000, write_size=2048))
+
+    assert writer.digest.sha256 == hashlib.sha256(DATA).hexdigest()
+    assert len(writer.digest.block_hashes) == -(-len(DATA) // 1000)
+    with open(writer.partial_path, "rb") as file:
+        assert file.read() == DATA
+
+
+def test_write_image_file_removes_file_of_failed_stream(tmp_path):
+    async def chunks():
+        yield DATA
+        raise ConnectionError("client disconnected")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(write_image_file(
+            chunks(), str(tmp_path), block_size=1000, write_size=2048))
+
+    assert os.listdir(tmp_path) == []
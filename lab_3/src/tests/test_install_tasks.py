@@ -0,0 +1,175 @@
+import pytest
+from celery import states
+
+from src.fastapi_celery.device_install import tasks
+from src.fastapi_celery.device_install.schemas import (DeviceInstallResult,
+                                                       DeviceReloadResult,
+                                                       InstallTarget)
+from src.fastapi_celery.device_install.views import build_task_response
+from src.fastapi_celery.enums import DeviceTestStage, ReloadReadyCheck
+from src.fastapi_celery.exceptions import (BolidModbusError, InstallTargetError,
+                                          RecoveryFileNotFoundError)
+
+BOLID = {"name": "bolid-1", "port": "/dev/ttyUSB0", "pin_capacity": 16,
+         "baudrate": 9600, "parity": "N", "stopbits": 1, "bytesize": 8}
+
+
+def get_target(hostname: str, test_stage: str = None) -> dict:
+    return {
+        "hostname": hostname,
+        "ip": "192.168.0.10",
+        "rs232_port": "/dev/ttyS0",
+        "power_pin": {"bolid": BOLID, "number": 1},
+        "boot_pin": {"bolid": BOLID, "number": 2},
+        "test_stage": test_stage,
+        "device_type": "tedix-v2-02",
+        "image": {"id": "image-1", "type": "dev", "version": "1.0",
+                  "commit": "abc", "filename": "image.img"}
+    }
+
+
+@pytest.fixture
+def test_stages(monkeypatch):
+    test_stages = []
+    monkeypatch.setattr(tasks, "update_test_stage",
+                        lambda db, hostname, stage: test_stages.append((hostname, stage)))
+    return test_stages
+
+
+@pytest.fixture
+def store_results(monkeypatch):
+    # Option is bound to tasks when they are registered
+    for task in (tasks.device_reload_task, tasks.device_install_task, tasks.device_recovery_task):
+        monkeypatch.setattr(task, "store_eager_result", True)
+
+
+def reload(targets: list):
+    return tasks.device_reload_task.apply(kwargs=dict(
+        targets=targets, ready_check=ReloadReadyCheck.CONSOLE, ready_pattern="login:",
+        boot_pin_status=False, off_time_s=3, stagger_s=1, inrush_concurrency=4,
+        ready_timeout_s=180))
+
+
+def test_reload_task_reports_slowest_device(monkeypatch, test_stages, store_results):
+    def reload_devices(targets, *args):
+        return [DeviceReloadResult(hostname=target.hostname, ready=True, time_to_ready_s=time_to_ready_s)
+                for target, time_to_ready_s in zip(targets, (20, 35))]
+
+    monkeypatch.setattr(tasks, "reload_devices", reload_devices)
+
+    result = reload([get_target("device-1", DeviceTestStage.MANUAL_TEST), get_target("device-2")])
+
+    assert result.state == states.SUCCESS
+    assert build_task_response(result.id).result.slowest_time_to_ready_s == 35
+    assert test_stages == [("device-1", DeviceTestStage.MANUAL_TEST),
+                           ("device-2", DeviceTestStage.NONE)]
+
+
+def test_reload_task_fails_once_and_restores_stages(monkeypatch, test_stages, store_results):
+    attempts = []
+
+    def reload_devices(targets, *args):
+        attempts.append([target.hostname for target in targets])
+        raise BolidModbusError("No response from bolid-1")
+
+    monkeypatch.setattr(tasks, "reload_devices", reload_devices)
+
+    result = reload([get_target("device-1", DeviceTestStage.MANUAL_TEST)])
+
+    assert result.state == states.FAILURE
+    assert attempts == [["device-1"]]
+    assert test_stages == [("device-1", DeviceTestStage.MANUAL_TEST)]
+
+    response = build_task_response(result.id)
+    assert response.result is None
+    assert response.meta == {"exc_type": "BolidModbusError",
+                             "exc_message": "No response from bolid-1"}
+
+
+
+def test_reload_task_fails_on_invalid_targets(test_stages, store_results):
+    invalid_target = get_target("device-1", DeviceTestStage.MANUAL_TEST)
+    del invalid_target["power_pin"]
+
+    result = reload([invalid_target])
+
+    assert result.state == states.FAILURE
+    assert build_task_response(result.id).meta["exc_type"] == "InstallTargetError"
+    assert test_stages == [("device-1", DeviceTestStage.MANUAL_TEST)]
+
+class InstallRecorder:
+    def __init__(self, monkeypatch):
+        self.states = []
+        self.installed = []
+
+        monkeypatch.setattr(tasks.device_install_task, "update_state",
+                            lambda state, meta: self.states.append((state, meta)))
+        monkeypatch.setattr(tasks, "install_devices", self.install_devices)
+
+    def install_devices(self, targets, off_time_s, stagger_s, ready_timeout_s, broadcast, delta,
+                        on_stage, on_device):
+        self.installed = targets
+        results = [DeviceInstallResult(hostname=target.hostname, image_id=target.image.id,
+                                       success=True, stages=[], execution_time_s=0)
+                   for target in targets]
+        for result in results:
+            on_device(result)
+        return results
+
+
+def test_install_task_installs_targets_and_restores_stages(monkeypatch, test_stages):
+    recorder = InstallRecorder(monkeypatch)
+    targets = [get_target("device-1", DeviceTestStage.MANUAL_TEST),
+               get_target("device-2")]
+
+    result = tasks.device_install_task(targets, 3, 1, 180)
+
+    assert [device["hostname"] for device in result["devices"]] == ["device-1", "device-2"]
+    assert all(isinstance(target, InstallTarget) for target in recorder.installed)
+    assert test_stages == [("device-1", DeviceTestStage.MANUAL_TEST),
+                           ("device-2", DeviceTestStage.NONE)]
+    assert recorder.states[-1][1]["succeeded"] == 2
+
+
+def test_install_task_fails_on_invalid_targets_and_restores_stages(monkeypatch, test_stages):
+    recorder = InstallRecorder(monkeypatch)
+    invalid_target = get_target("device-1", DeviceTestStage.MANUAL_TEST)
+    del invalid_target["image"]
+
+    with pytest.raises(InstallTargetError):
+        tasks.device_install_task([invalid_target], 3, 1, 180)
+
+    assert recorder.installed == []
+    assert test_stages == [("device-1", DeviceTestStage.MANUAL_TEST)]
+
+
+def test_failed_install_task_is_reported(monkeypatch, test_stages, store_results):
+    invalid_target = get_target("device-1")
+    del invalid_target["image"]
+
+    result = tasks.device_install_task.apply(kwargs=dict(
+        targets=[invalid_target], off_time_s=3, stagger_s=1, ready_timeout_s=180))
+
+    assert result.state == states.FAILURE
+
+    response = build_task_response(result.id)
+    assert response.result is None
+    assert response.meta["exc_type"] == "InstallTargetError"
+
+
+def test_recovery_task_fails_without_recovery_file(monkeypatch, test_stages, store_results):
+    def recover_devices(targets, file_name, *args):
+        raise RecoveryFileNotFoundError(f"Recovery file {file_name} is not found")
+
+    monkeypatch.setattr(tasks, "recover_devices", recover_devices)
+    target = dict(get_target("device-1", DeviceTestStage.MANUAL_TEST), usb_path="1-1.2")
+
+    result = tasks.device_recovery_task.apply(kwargs=dict(
+        targets=[target], file_name="u-boot.imx", off_time_s=3, stagger_s=1,
+        loader_timeout_s=30, max_retries=2))
+
+    assert result.state == states.FAILURE
+    assert build_task_response(result.id).meta == {
+        "exc_type": "RecoveryFileNotFoundError",
+        "exc_message": "Recovery file u-boot.imx is not found"}
+    assert test_stages == [("device-1", DeviceTestStage.MANUAL_TEST)]
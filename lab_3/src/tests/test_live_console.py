@@ -0,0 +1,60 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from src.fastapi_celery.device_rs232 import views
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(views.router)
+    return TestClient(app)
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """Sessions opened by views, closed ones are marked."""
+    opened = []
+    session_factory = views.SessionLocal
+
+    class TrackedSession:
+        def __init__(self):
+            self.session = session_factory()
+            self.closed = False
+            opened.append(self)
+
+        def __getattr__(self, name):
+            return getattr(self.session, name)
+
+        def close(self):
+            self.closed = True
+            self.session.close()
+
+    monkeypatch.setattr(views, "SessionLocal", TrackedSession)
+    return opened
+
+
+def test_console_is_attached_without_open_session(client, device, sessions, monkeypatch):
+    attached = []
+
+    async def attach_websocket(websocket, port, history):
+        attached.append((port, history, [session.closed for session in sessions]))
+        await websocket.send_text("attached")
+
+    monkeypatch.setattr(views, "attach_websocket", attach_websocket)
+
+    with client.websocket_connect("/device_rs232/console/device-1/ws?history=10") as websocket:
+        assert websocket.receive_text() == "attached"
+
+    assert attached == [("/dev/ttyS0", 10, [True])]
+
+
+def test_console_of_unknown_device_is_closed(client, db, sessions):
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with client.websocket_connect("/device_rs232/console/device-1/ws") as websocket:
+            websocket.receive_text()
+
+    assert exc_info.value.code == 1008
+    assert [session.closed for session in sessions] == [True]
@@ -0,0 +1,47 @@
+import gzip
+
+from src.fastapi_celery.device_ssh.output_capture import (TRUNCATION_MARKER,
+                                                          OutputCapture)
+
+
+def test_capture_without_cap_keeps_whole_output():
+    capture = OutputCapture()
+    capture.write(b"a" * 1000)
+    capture.write(b"b" * 1000)
+
+    assert capture.getvalue() == "a" * 1000 + "b" * 1000
+    assert not capture.truncated
+
+
+def test_capture_below_cap_is_not_truncated():
+    capture = OutputCapture(cap_bytes=10)
+    capture.write(b"12345")
+    capture.write(b"6789")
+
+    assert capture.getvalue() == "123456789"
+    assert not capture.truncated
+
+
+def test_capture_keeps_head_and_tail():
+    capture = OutputCapture(cap_bytes=10)
+    for line in (b"head-", b"middle-", b"and-", b"tail"):
+        capture.write(line)
+
+    assert capture.truncated
+    assert capture.total_bytes == 20
+    assert capture.getvalue() == "head-" + TRUNCATION_MARKER.format(skipped=10) + "-tail"
+
+
+def test_capture_spills_whole_output_to_artifact(tmp_path):
+    artifact_path = tmp_path / "artifacts" / "output.stdout.gz"
+    capture = OutputCapture(cap_bytes=10, artifact_path=artifact_path)
+    output = b"".join(f"line {number}\n".encode() for number in range(100))
+
+    for offset in range(0, len(output), 7):
+        capture.write(output[offset:offset + 7])
+    capture.close()
+
+    assert capture.spilled
+    assert gzip.decompress(artifact_path.read_bytes()) == output
+    assert capture.getvalue().startswith(output[:5].decode())
+    assert capture.getvalue().endswith(output[-5:].decode())
@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from src.fastapi_celery.device_ssh.output_stream import (OUTPUT_STREAM_KEY,
+                                                         OutputStreamPublisher,
+                                                         read_output_events)
+
+TASK_ID = "task-1"
+
+
+def read_events(offset=None):
+    async def collect():
+        return [event async for event in read_output_events(TASK_ID, offset)]
+
+    return asyncio.run(collect())
+
+
+def parse_event(raw_event: str):
+    lines = dict(line.split(": ", 1) for line in raw_event.strip().split("\n"))
+    return lines["id"], lines["event"], json.loads(lines["data"])
+
+
+def test_output_is_streamed_until_eof():
+    publisher = OutputStreamPublisher(TASK_ID)
+    publisher.publish("stdout", b"hello ")
+    publisher.publish("stderr", b"warning")
+    publisher.publish("stdout", b"world")
+    publisher.close(0)
+
+    events = [parse_event(event)[1:] for event in read_events()]
+
+    assert events == [("stdout", {"data": "hello "}),
+                      ("stderr", {"data": "warning"}),
+                      ("stdout", {"data": "world"}),
+                      ("eof", {"retcode": 0})]
+
+
+def test_reading_resumes_after_offset():
+    publisher = OutputStreamPublisher(TASK_ID)
+    publisher.publish("stdout", b"first")
+    publisher.publish("stdout", b"second")
+    publisher.close(None)
+
+    first_id = parse_event(read_events()[0])[0]
+    events = [parse_event(event)[1:] for event in read_events(first_id)]
+
+    assert events == [("stdout", {"data": "second"}), ("eof", {"retcode": None})]
+
+
+def test_multibyte_character_split_between_chunks():
+    data = "привет".encode()
+    publisher = OutputStreamPublisher(TASK_ID)
+    publisher.publish("stdout", data[:3])
+    publisher.publish("stdout", data[3:])
+    publisher.close(0)
+
+    text = "".join(payload.get("data", "") for _, _, payload in map(parse_event, read_events()))
+
+    assert text == "привет"
+
+
+def test_output_above_cap_is_replaced_with_truncated_event(redis_client):
+    publisher = OutputStreamPublisher(TASK_ID, cap_bytes=10)
+    for _ in range(100):
+        publisher.publish("stdout", b"1234")
+    publisher.publish("stderr", b"error")
+    publisher.close(1)
+
+    events = [parse_event(event)[1:] for event in read_events()]
+
+    assert events == [("stdout", {"data": "1234"}),
+                      ("stdout", {"data": "1234"}),
+                      ("stdout", {"data": "12"}),
+                      ("truncated", {"stream": "stdout"}),
+                      ("stderr", {"data": "error"}),
+                      ("eof", {"retcode": 1})]
+    assert redis_client.xlen(OUTPUT_STREAM_KEY.format(task_id=TASK_ID)) == 6
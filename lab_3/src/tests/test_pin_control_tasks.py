@@ -0,0 +1,55 @@
+import pytest
+from celery import states
+
+from src.fastapi_celery.device_pin_control import tasks
+from src.fastapi_celery.device_pin_control.views import build_task_response
+from src.fastapi_celery.exceptions import BolidModbusError
+
+BOLID = {"name": "bolid-1", "port": "/dev/ttyUSB0", "pin_capacity": 16,
+         "baudrate": 9600, "parity": "N", "stopbits": 1, "bytesize": 8}
+
+
+@pytest.fixture
+def store_results(monkeypatch):
+    # Option is bound to tasks when they are registered
+    monkeypatch.setattr(tasks.pin_control_set_task, "store_eager_result", True)
+
+
+def test_set_task_writes_pins_of_every_bolid(monkeypatch, store_results):
+    written = []
+
+    def set_pins(bolid, pin_states):
+        written.append((bolid.name, pin_states))
+        return 1
+
+    monkeypatch.setattr(tasks.bolid_driver, "set_pins", set_pins)
+
+    result = tasks.pin_control_set_task.apply(kwargs=dict(
+        bolid_pin_states=[{"bolid": BOLID, "pin_states": {1: True, 2: False}}]))
+
+    assert result.state == states.SUCCESS
+    assert written == [("bolid-1", {1: True, 2: False})]
+
+    response = build_task_response(result.id)
+    assert response.result.bolids[0].coalesced_requests == 1
+
+
+def test_set_task_fails_after_retries(monkeypatch, store_results):
+    attempts = []
+
+    def set_pins(bolid, pin_states):
+        attempts.append(bolid.name)
+        raise BolidModbusError("No response from bolid-1")
+
+    monkeypatch.setattr(tasks.bolid_driver, "set_pins", set_pins)
+
+    result = tasks.pin_control_set_task.apply(kwargs=dict(
+        bolid_pin_states=[{"bolid": BOLID, "pin_states": {1: True}}]))
+
+    assert result.state == states.FAILURE
+    assert attempts == ["bolid-1"] * (tasks.pin_control_set_task.max_retries + 1)
+
+    response = build_task_response(result.id)
+    assert response.result is None
+    assert response.meta == {"exc_type": "BolidModbusError",
+                             "exc_message": "No response from bolid-1"}
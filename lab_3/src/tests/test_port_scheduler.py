@@ -0,0 +1,134 @@
+import time
+
+import pytest
+from celery import states
+
+from src.fastapi_celery.device_rs232 import tasks
+from src.fastapi_celery.device_rs232.port_scheduler import (PortScheduler,
+                                                            get_port_stats)
+
+PORT = "/dev/ttyS0"
+
+
+@pytest.fixture
+def scheduler():
+    return PortScheduler(claim_ttl_s=30)
+
+
+def test_free_port_is_acquired_at_once(scheduler):
+    with scheduler.acquire(PORT, "op-1") as wait_s:
+        assert wait_s is not None
+        assert wait_s < 0.1
+
+
+def test_busy_port_is_not_waited_for(scheduler):
+    with scheduler.acquire(PORT, "op-1"):
+        start = time.monotonic()
+        with scheduler.acquire(PORT, "op-2") as wait_s:
+            assert wait_s is None
+        assert time.monotonic() - start < 0.1
+
+        # Other ports are free
+        with scheduler.acquire("/dev/ttyS1", "op-3") as wait_s:
+            assert wait_s is not None
+
+    time.sleep(0.05)
+    with scheduler.acquire(PORT, "op-2") as wait_s:
+        # Time in queue is counted from the first request
+        assert wait_s >= 0.05
+
+
+def test_operations_are_granted_by_priority_then_arrival(scheduler):
+    granted = []
+
+    with scheduler.acquire(PORT, "holder"):
+        for operation_id, priority in (("low", 0), ("first-high", 5), ("second-high", 5)):
+            with scheduler.acquire(PORT, operation_id, priority) as wait_s:
+                assert wait_s is None
+
+    while len(granted) < 3:
+        for operation_id in ("low", "second-high", "first-high"):
+            if operation_id in granted:
+                continue
+            with scheduler.acquire(PORT, operation_id) as wait_s:
+                if wait_s is not None:
+                    granted.append(operation_id)
+
+    assert granted == ["first-high", "second-high", "low"]
+
+
+def test_place_of_gone_operation_is_given_up():
+    scheduler = PortScheduler(claim_ttl_s=0.05)
+
+    with scheduler.acquire(PORT, "holder"):
+        with scheduler.acquire(PORT, "revoked") as wait_s:
+            assert wait_s is None
+
+    with scheduler.acquire(PORT, "next") as wait_s:
+        assert wait_s is None
+
+    time.sleep(0.1)
+    with scheduler.acquire(PORT, "next") as wait_s:
+        assert wait_s is not None
+
+
+def test_console_input_is_rejected_while_operations_wait(scheduler):
+    with scheduler.acquire(PORT, "holder"):
+        with scheduler.try_acquire(PORT) as acquired:
+            assert not acquired
+        with scheduler.acquire(PORT, "waiting") as wait_s:
+            assert wait_s is None
+
+    with scheduler.try_acquire(PORT) as acquired:
+        assert not acquired
+
+    with scheduler.acquire(PORT, "waiting"):
+        pass
+
+    with scheduler.try_acquire(PORT) as acquired:
+        assert acquired
+
+
+def test_stats_are_published(scheduler, redis_client):
+    with scheduler.acquire(PORT, "op-1"):
+        with scheduler.acquire(PORT, "op-2"):
+            pass
+
+    deadline = time.monotonic() + 1
+    while get_port_stats(PORT).get("busy", 1) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    stats = get_port_stats(PORT)
+    assert stats["acquired"] == 1
+    assert stats["queue_depth"] == 1
+    assert stats["busy"] == 0
+
+
+def test_task_waiting_for_port_is_requeued(monkeypatch, scheduler):
+    written = []
+    requeued = []
+
+    class Console:
+        def write(self, data: bytes) -> None:
+            written.append(data)
+
+    def wait_for_port(task):
+        # Port is released before the task is executed again
+        requeued.append(task.request.id)
+        holder.__exit__(None, None, None)
+        return task.retry(countdown=0, max_retries=task.request.retries + 1)
+
+    monkeypatch.setattr(tasks, "port_scheduler", scheduler)
+    monkeypatch.setattr(tasks, "wait_for_port", wait_for_port)
+    monkeypatch.setattr(tasks.console_manager, "get_console", lambda port, baudrate: Console())
+
+    holder = scheduler.acquire(PORT, "holder")
+    holder.__enter__()
+
+    result = tasks.rs232_write_task.apply(kwargs=dict(
+        port=PORT, baudrate=115200, timeout=1, text="reboot\n"))
+
+    assert result.state == states.SUCCESS
+    assert requeued == [result.id]
+    assert written == [b"reboot\n"]
+    assert result.result["port_wait_s"] >= 0
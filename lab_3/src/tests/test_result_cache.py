@@ -0,0 +1,66 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.fastapi_celery.device_data.model import Device
+from src.fastapi_celery.device_data.service import get_device
+from src.fastapi_celery.device_ssh import views
+from src.fastapi_celery.device_ssh.result_cache import (cache_result,
+                                                        get_cache_key,
+                                                        get_cached_result)
+from src.fastapi_celery.device_ssh.schemas import SshResult
+from src.fastapi_celery.enums import DeviceTestStage, ImageType, SshUser
+from src.fastapi_celery.images.model import Image
+
+RESULT = SshResult(stdout="Linux\n", stderr="", retcode=0, execution_time_s=0.1)
+
+
+def test_result_is_cached_by_device_state(device, db):
+    cache_result("device-1", SshUser.ROOT, "uname", "image-1", RESULT, 60)
+
+    cached_result, expires_in_s = get_cached_result(
+        get_cache_key(get_device(db, "device-1"), SshUser.ROOT, "uname"))
+
+    assert cached_result == RESULT
+    assert 0 < expires_in_s <= 60
+
+
+def test_failed_and_truncated_results_are_not_cached(device, db, redis_client):
+    cache_result("device-1", SshUser.ROOT, "false", "image-1",
+                 RESULT.model_copy(update={"retcode": 1}), 60)
+    cache_result("device-1", SshUser.ROOT, "dmesg", "image-1",
+                 RESULT.model_copy(update={"truncated": True}), 60)
+
+    assert redis_client.keys("ssh_cache:*") == []
+
+
+def test_result_is_not_cached_if_device_was_reimaged(device, db, redis_client):
+    db.add(Image(id="image-2", type=ImageType.DEV, version="2.0",
+                 commit="def", filename="device-1-dev-2.0-def.img"))
+    db.query(Device).filter(Device.hostname == "device-1").update({"image_id": "image-2"})
+    db.commit()
+
+    # Command was queued before re-imaging
+    cache_result("device-1", SshUser.ROOT, "uname", "image-1", RESULT, 60)
+
+    assert redis_client.keys("ssh_cache:*") == []
+
+
+def test_test_stage_is_part_of_cache_key(device, db):
+    cache_result("device-1", SshUser.ROOT, "uname", "image-1", RESULT, 60)
+    cached_device = get_device(db, "device-1")
+
+    assert get_cached_result(get_cache_key(
+        cached_device.model_copy(update={"test_stage": DeviceTestStage.AUTO_TEST}), SshUser.ROOT, "uname")) is None
+
+
+def test_cached_result_is_returned_without_queueing(device, monkeypatch):
+    cache_result("device-1", SshUser.ROOT, "uname", "image-1", RESULT, 60)
+    monkeypatch.setattr(views.task_ssh, "delay", lambda **kwargs: 1 / 0)
+
+    app = FastAPI()
+    app.include_router(views.router)
+    response = TestClient(app).post("/device_ssh", params={
+        "cmd": "uname", "hostname": "device-1", "username": SshUser.ROOT, "cache_ttl_s": 60})
+
+    assert response.status_code == 200
+    assert response.json()["result"]["stdout"] == "Linux\n"
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+import serial
+
+from src.fastapi_celery.device_rs232.serial_module import read_from_serial
+from src.fastapi_celery.enums import Rs232StopReason
+
+
+@pytest.fixture
+def port():
+    """Loopback port, written data is read back."""
+    ser = serial.serial_for_url("loop://", timeout=0.2)
+    yield ser
+    ser.close()
+
+
+def write_later(ser: serial.Serial, data: bytes, delay_s: float) -> threading.Thread:
+    thread = threading.Timer(delay_s, ser.write, args=(data,))
+    thread.start()
+    return thread
+
+
+def test_read_stops_right_after_terminator(port):
+    port.write(b"U-Boot 2024.01\nHit any key to stop autoboot\n=> ")
+
+    start = time.monotonic()
+    text, stop_reason = read_from_serial(port, terminator="=> $", idle_timeout=5)
+
+    assert stop_reason == Rs232StopReason.TERMINATOR
+    assert text.endswith("=> ")
+    assert time.monotonic() - start < 1
+
+
+def test_terminator_split_between_bursts(port):
+    port.write(b"device log\nlog")
+    write_later(port, b"in: ", 0.05).join()
+
+    text, stop_reason = read_from_serial(port, terminator="login: ", idle_timeout=1)
+
+    assert stop_reason == Rs232StopReason.TERMINATOR
+    assert text == "device log\nlogin: "
+
+
+def test_read_stops_after_idle_gap(port):
+    port.write(b"first burst\n")
+    write_later(port, b"second burst\n", 0.05)
+
+    text, stop_reason = read_from_serial(port, idle_timeout=0.3)
+
+    assert stop_reason == Rs232StopReason.IDLE
+    assert text == "first burst\nsecond burst\n"
+
+
+def test_read_stops_at_max_bytes(port):
+    port.write(b"0123456789")
+
+    text, stop_reason = read_from_serial(port, max_bytes=4)
+
+    assert stop_reason == Rs232StopReason.MAX_BYTES
+    assert text == "0123"
+    assert port.read(6) == b"456789"
+
+
+def test_read_stops_at_deadline_of_endless_output(port):
+    stop = threading.Event()
+
+    def chatter():
+        while not stop.is_set():
+            port.write(b".")
+            time.sleep(0.01)
+
+    thread = threading.Thread(target=chatter)
+    thread.start()
+    try:
+        start = time.monotonic()
+        _, stop_reason = read_from_serial(port, idle_timeout=1, deadline=0.2)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert stop_reason == Rs232StopReason.DEADLINE
+    assert time.monotonic() - start < 0.5
+
+
+def test_timeout_of_port_is_restored(port):
+    port.write(b"data")
+
+    read_from_serial(port, idle_timeout=0.05)
+
+    assert port.timeout == 0.2
+
+
+def test_zero_timeouts_read_only_received_data(port):
+    port.write(b"received")
+
+    text, stop_reason = read_from_serial(port, idle_timeout=0)
+
+    assert text == "received"
+    assert stop_reason == Rs232StopReason.IDLE
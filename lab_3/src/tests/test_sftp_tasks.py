@@ -0,0 +1,165 @@
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+import paramiko
+import pytest
+from celery import states
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.fastapi_celery.config import server_settings
+from src.fastapi_celery.device_ssh import tasks, views
+from src.fastapi_celery.device_ssh.sftp_module import (
+    get_download_partial_path, get_transfer_path, remove_expired_transfers)
+from src.fastapi_celery.enums import DeviceType, ImageType, SshUser
+
+TRANSFER = {"size_bytes": 4, "resumed_from": 0, "sha256": "digest"}
+
+
+@pytest.fixture(autouse=True)
+def transfer_folder(monkeypatch, tmp_path):
+    monkeypatch.setattr(server_settings.SSH_SETTINGS, "TRANSFER_FOLDER_PATH", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def device_files(monkeypatch):
+    """Files on device, transfer fails with errors queued in `errors`."""
+    files = {"/data/log.txt": b"data"}
+    errors = []
+    partial_paths = []
+
+    @contextmanager
+    def device_connection(*args):
+        yield object()
+
+    def upload_file(ssh_client, local_path, remote_path, on_progress):
+        assert os.path.exists(local_path)
+        if errors:
+            raise errors.pop(0)
+        with open(local_path, "rb") as local_file:
+            files[remote_path] = local_file.read()
+        return TRANSFER
+
+    def download_file(ssh_client, remote_path, local_path, partial_path, resume, on_progress):
+        partial_paths.append(partial_path)
+        with open(partial_path, "wb") as partial_file:
+            partial_file.write(files[remote_path][:2])
+        if errors:
+            raise errors.pop(0)
+        os.replace(partial_path, local_path)
+        return TRANSFER
+
+    monkeypatch.setattr(tasks, "device_connection", device_connection)
+    monkeypatch.setattr(tasks, "upload_file", upload_file)
+    monkeypatch.setattr(tasks, "download_file", download_file)
+    monkeypatch.setattr(tasks, "verify_remote_sha256", lambda *args: True)
+    return files, errors, partial_paths
+
+
+def run_upload(local_path):
+    return tasks.task_sftp_upload.apply(kwargs=dict(
+        local_path=str(local_path), remote_path="/data/new.txt", hostname="192.168.0.10",
+        username=SshUser.ROOT, device_type=DeviceType.V2, image_type=ImageType.DEV))
+
+
+def run_download():
+    return tasks.task_sftp_download.apply(kwargs=dict(
+        remote_path="/data/log.txt", hostname="192.168.0.10",
+        username=SshUser.ROOT, device_type=DeviceType.V2, image_type=ImageType.DEV),
+        task_id=str(uuid.uuid4()))
+
+
+@pytest.fixture
+def staged_file(transfer_folder):
+    path = transfer_folder / "staged.upload"
+    path.write_bytes(b"new!")
+    return path
+
+
+def test_upload_removes_staged_file(device_files, staged_file):
+    files, _, _ = device_files
+
+    result = run_upload(staged_file)
+
+    assert result.state == states.SUCCESS
+    assert files["/data/new.txt"] == b"new!"
+    assert not staged_file.exists()
+
+
+def test_interrupted_upload_is_retried(device_files, staged_file):
+    files, errors, _ = device_files
+    errors.extend([paramiko.SSHException("Connection lost"), EOFError()])
+
+    result = run_upload(staged_file)
+
+    assert result.state == states.SUCCESS
+    assert files["/data/new.txt"] == b"new!"
+    assert not staged_file.exists()
+
+
+def test_failed_upload_removes_staged_file(device_files, staged_file):
+    _, errors, _ = device_files
+    errors.extend([paramiko.SSHException("Connection lost")] * (tasks.task_sftp_upload.max_retries + 1))
+
+    result = run_upload(staged_file)
+
+    assert result.state == states.FAILURE
+    assert isinstance(result.result, paramiko.SSHException)
+    assert not staged_file.exists()
+
+
+def test_download_partial_file_belongs_to_task(device_files):
+    _, errors, partial_paths = device_files
+    errors.append(EOFError())
+
+    result = run_download()
+
+    assert result.state == states.SUCCESS
+    # Retry of the task resumes the same partial file
+    assert partial_paths == [str(get_download_partial_path(result.id))] * 2
+    assert get_transfer_path(result.id).read_bytes() == b"da"
+    assert not get_download_partial_path(result.id).exists()
+
+
+def test_failed_download_removes_partial_file(device_files):
+    _, errors, _ = device_files
+    errors.append(ValueError("Unexpected error"))
+
+    result = run_download()
+
+    assert result.state == states.FAILURE
+    assert not get_download_partial_path(result.id).exists()
+    assert not get_transfer_path(result.id).exists()
+
+
+def test_expired_transfers_are_removed(transfer_folder):
+    expired = transfer_folder / f"{uuid.uuid4()}"
+    fresh = transfer_folder / f"{uuid.uuid4()}"
+    expired.write_bytes(b"old")
+    fresh.write_bytes(b"new")
+    expire_time = time.time() - server_settings.SSH_SETTINGS.TRANSFER_TTL_S - 1
+    os.utime(expired, (expire_time, expire_time))
+
+    remove_expired_transfers()
+
+    assert not expired.exists()
+    assert fresh.exists()
+
+
+def test_sftp_status_of_failed_task(monkeypatch, device_files):
+    _, errors, _ = device_files
+    errors.append(ValueError("Unexpected error"))
+    monkeypatch.setattr(tasks.task_sftp_download, "store_eager_result", True)
+    task_id = run_download().id
+
+    app = FastAPI()
+    app.include_router(views.router)
+    response = TestClient(app).get(f"/device_ssh/sftp/queue/{task_id}")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "id": task_id, "status": states.FAILURE, "result": None,
+        "meta": {"exc_type": "ValueError", "exc_message": "Unexpected error"}}
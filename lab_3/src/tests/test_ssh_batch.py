@@ -0,0 +1,198 @@
+import socket
+from contextlib import contextmanager
+
+import pytest
+from celery import states
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from paramiko.ssh_exception import NoValidConnectionsError
+
+from src.fastapi_celery.device_ssh import tasks, views
+from src.fastapi_celery.device_ssh.schemas import SshResult
+from src.fastapi_celery.enums import DeviceType, ImageType, SshUser
+
+
+class FakeTask:
+    def __init__(self, task_id: str):
+        self.id = task_id
+
+
+class FakeAsyncResult:
+    """Result of task as stored by worker."""
+    results = {}
+
+    def __init__(self, task_id: str, app=None):
+        self.state, self.info = self.results[task_id]
+        self.result = self.info
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(views.router)
+    return TestClient(app)
+
+
+@pytest.fixture
+def task_states(monkeypatch):
+    reported = []
+    monkeypatch.setattr(tasks.task_ssh_batch, "update_state",
+                        lambda state, meta: reported.append((state, meta)))
+    return reported
+
+
+@pytest.fixture
+def device_commands(monkeypatch):
+    """Commands executed on device, command 'false' fails and command 'sleep' times out."""
+    executed = []
+
+    @contextmanager
+    def device_connection(*args):
+        yield object()
+
+    def execute_command(ssh_client, command: str, cmd_timeout: int) -> SshResult:
+        executed.append(command)
+        if command == "sleep":
+            raise socket.timeout()
+        return SshResult(stdout=f"{command}\n", stderr="", retcode=1 if command == "false" else 0,
+                         execution_time_s=0.5)
+
+    monkeypatch.setattr(tasks, "device_connection", device_connection)
+    monkeypatch.setattr(tasks, "execute_command", execute_command)
+    return executed
+
+
+def run_batch(commands, stop_on_error: bool = True):
+    return tasks.task_ssh_batch.apply(kwargs=dict(
+        steps=[{"cmd": command, "cmd_timeout": 5} for command in commands],
+        hostname="192.168.0.10",
+        username=SshUser.ROOT,
+        device_type=DeviceType.V2,
+        image_type=ImageType.DEV,
+        stop_on_error=stop_on_error
+    ))
+
+
+def test_batch_executes_steps_in_order(device_commands, task_states):
+    result = run_batch(["uname", "uptime"]).get()
+
+    assert device_commands == ["uname", "uptime"]
+    assert [step["stdout"] for step in result["steps"]] == ["uname\n", "uptime\n"]
+    assert result["failed_step"] is None
+    assert result["commands_time_s"] == 1.0
+    assert task_states[-1][1] == {"step": 1, "steps_total": 2, "cmd": "uptime"}
+
+
+def test_batch_stops_on_failed_step(device_commands, task_states):
+    result = run_batch(["uname", "false", "uptime"]).get()
+
+    assert device_commands == ["uname", "false"]
+    assert result["failed_step"] == 1
+
+
+def test_batch_continues_after_failed_step(device_commands, task_states):
+    result = run_batch(["sleep", "false", "uptime"], stop_on_error=False).get()
+
+    assert device_commands == ["sleep", "false", "uptime"]
+    # The first failed step is reported
+    assert result["failed_step"] == 0
+    assert result["steps"][0]["retcode"] is None
+    assert result["steps"][0]["stderr"] == "Command timed out after 5 s"
+
+
+def test_batch_is_retried_and_fails_if_device_is_unreachable(monkeypatch, task_states):
+    attempts = []
+
+    def device_connection(*args):
+        attempts.append(args)
+        raise NoValidConnectionsError({("192.168.0.10", 22): ConnectionRefusedError()})
+
+    monkeypatch.setattr(tasks, "device_connection", device_connection)
+
+    result = run_batch(["uname"])
+
+    assert result.state == states.FAILURE
+    assert isinstance(result.result, NoValidConnectionsError)
+    assert len(attempts) == tasks.task_ssh_batch.max_retries + 1
+
+
+def test_batch_fails_on_unexpected_error(monkeypatch, device_commands, task_states):
+    def execute_command(*args):
+        raise ValueError("Unexpected output")
+
+    monkeypatch.setattr(tasks, "execute_command", execute_command)
+
+    result = run_batch(["uname", "uptime"])
+
+    assert result.state == states.FAILURE
+    assert isinstance(result.result, ValueError)
+
+
+def test_post_batch_queues_steps_for_device(client, device, monkeypatch):
+    queued = []
+
+    def delay(**kwargs):
+        queued.append(kwargs)
+        return FakeTask("task-1")
+
+    monkeypatch.setattr(views.task_ssh_batch, "delay", delay)
+
+    response = client.post("/device_ssh/batch", json={
+        "hostname": "device-1",
+        "username": SshUser.ROOT,
+        "steps": [{"cmd": "uname"}, {"cmd": "reboot", "cmd_timeout": 1}]
+    })
+
+    assert response.status_code == 202
+    assert response.json() == {"id": "task-1", "location": "/batch/queue/task-1"}
+    assert queued == [dict(
+        steps=[{"cmd": "uname", "cmd_timeout": 5}, {"cmd": "reboot", "cmd_timeout": 1}],
+        hostname="192.168.0.10",
+        username=SshUser.ROOT,
+        device_type=DeviceType.V2,
+        image_type=ImageType.DEV,
+        stop_on_error=True,
+        image_id="image-1"
+    )]
+
+
+def test_post_batch_of_unknown_device(client, db):
+    response = client.post("/device_ssh/batch", json={
+        "hostname": "device-1", "username": SshUser.ROOT, "steps": [{"cmd": "uname"}]})
+
+    assert response.status_code == 404
+
+
+def test_post_batch_without_steps(client, device):
+    response = client.post("/device_ssh/batch", json={
+        "hostname": "device-1", "username": SshUser.ROOT, "steps": []})
+
+    assert response.status_code == 422
+
+
+def test_batch_status_of_finished_task(client, monkeypatch):
+    result = {"steps": [{"stdout": "", "stderr": "", "retcode": 0, "execution_time_s": 0.1}],
+              "failed_step": None, "execution_time_s": 0.2, "commands_time_s": 0.1}
+    FakeAsyncResult.results = {"task-1": (states.SUCCESS, result)}
+    monkeypatch.setattr(views, "AsyncResult", FakeAsyncResult)
+
+    response = client.get("/device_ssh/batch/queue/task-1")
+
+    assert response.status_code == 200
+    assert response.json()["result"]["steps"][0]["retcode"] == 0
+
+
+def test_batch_status_of_failed_task(client, monkeypatch):
+    FakeAsyncResult.results = {
+        "task-1": (states.FAILURE, NoValidConnectionsError({("192.168.0.10", 22): ConnectionRefusedError()})),
+        "task-2": (states.SUCCESS, None)
+    }
+    monkeypatch.setattr(views, "AsyncResult", FakeAsyncResult)
+
+    failed = client.get("/device_ssh/batch/queue/task-1").json()
+    without_result = client.get("/device_ssh/batch/queue/task-2").json()
+
+    assert failed["status"] == states.FAILURE
+    assert failed["meta"]["exc_type"] == "NoValidConnectionsError"
+    assert failed["result"] is None
+    assert without_result == {"id": "task-2", "status": states.SUCCESS, "meta": None, "result": None}
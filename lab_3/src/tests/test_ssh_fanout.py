@@ -0,0 +1,128 @@
+import gc
+from contextlib import contextmanager
+
+import pytest
+from celery import Signature, states
+
+from src.fastapi_celery.device_data.model import Device
+from src.fastapi_celery.device_ssh import service, tasks
+from src.fastapi_celery.device_ssh.schemas import SshFanoutRequest, SshResult
+from src.fastapi_celery.device_ssh.service import (create_fanout,
+                                                   get_fanout_status)
+from src.fastapi_celery.device_ssh.tasks import (FANOUT_PENDING_KEY,
+                                                 ssh_worker,
+                                                 task_ssh_fanout_next)
+from src.fastapi_celery.enums import DeviceType, ImageType, SshUser
+from src.fastapi_celery.exceptions import (DeviceNotFoundError,
+                                           SshFanoutNotFoundError)
+from src.fastapi_celery.images.model import Image
+
+HOSTNAMES = [f"device-{number}" for number in range(1, 6)]
+
+
+@pytest.fixture(autouse=True)
+def collect_group_results():
+    """
+    Results of group unsubscribe from backend when they are collected,
+    which deadlocks if it happens inside a command of fake redis.
+    """
+    yield
+    gc.collect()
+
+
+@pytest.fixture
+def devices(db):
+    for number, hostname in enumerate(HOSTNAMES, start=1):
+        image = Image(id=f"image-{number}", type=ImageType.DEV, version="1.0",
+                      commit="abc", filename=f"{hostname}-dev-1.0-abc.img")
+        db.add(Device(hostname=hostname, mac=f"00:00:00:00:00:0{number}", ip=f"192.168.0.{number}",
+                      type=DeviceType.V2, https_port=443, ws_port=8080,
+                      rs232_port=f"/dev/ttyS{number}", output_power_id=f"power-{number}",
+                      output_boot_id=f"boot-{number}", image=image))
+    db.commit()
+
+    return HOSTNAMES
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """IDs of tasks sent to broker."""
+    sent_ids = []
+
+    def apply_async(signature, *args, **kwargs):
+        sent_ids.append(signature.id)
+
+    monkeypatch.setattr(Signature, "apply_async", apply_async)
+    monkeypatch.setattr(service, "group", lambda signatures: type(
+        "Group", (), {"apply_async": lambda self: [signature.apply_async() for signature in signatures]})())
+    return sent_ids
+
+
+@pytest.fixture
+def executed(monkeypatch):
+    """Devices on which command was executed by eager tasks, command fails on device 192.168.0.2."""
+    hostnames = []
+
+    @contextmanager
+    def device_connection(hostname, *args):
+        if hostname == "192.168.0.2":
+            raise RuntimeError("Device is broken")
+        yield hostname
+
+    def execute_command(ssh_client, command, cmd_timeout, **kwargs) -> SshResult:
+        hostnames.append(ssh_client)
+        return SshResult(stdout=ssh_client, stderr="", retcode=0, execution_time_s=0.1)
+
+    monkeypatch.setattr(tasks, "device_connection", device_connection)
+    monkeypatch.setattr(tasks, "execute_command", execute_command)
+    monkeypatch.setattr(ssh_worker.conf, "task_always_eager", True)
+    # Option is bound to tasks when they are registered
+    for task in (tasks.task_ssh, task_ssh_fanout_next):
+        monkeypatch.setattr(task, "store_eager_result", True)
+    return hostnames
+
+
+def test_only_concurrency_tasks_are_sent_at_once(devices, sent, redis_client, db):
+    group_id = create_fanout(db, SshFanoutRequest(
+        cmd="uname", username=SshUser.ROOT, hostnames=devices, concurrency=2))
+
+    status = get_fanout_status(group_id)
+    task_ids = [device.id for device in status.devices]
+
+    assert [device.hostname for device in status.devices] == devices
+    assert status.status == states.PENDING
+    assert sent == task_ids[:2]
+    assert redis_client.llen(FANOUT_PENDING_KEY.format(group_id=group_id)) == 3
+
+    # Every finished task sends the next one in order of devices
+    for _ in range(4):
+        task_ssh_fanout_next(group_id)
+
+    assert sent == task_ids
+    assert redis_client.llen(FANOUT_PENDING_KEY.format(group_id=group_id)) == 0
+
+
+def test_fanout_runs_command_on_every_device(devices, executed, db):
+    group_id = create_fanout(db, SshFanoutRequest(
+        cmd="uname", username=SshUser.ROOT, hostnames=devices, concurrency=2))
+
+    status = get_fanout_status(group_id)
+
+    # Failed device doesn't stop devices which wait for its slot
+    assert sorted(executed) == ["192.168.0.1", "192.168.0.3", "192.168.0.4", "192.168.0.5"]
+    assert status.completed == status.total == 5
+    assert status.status == states.FAILURE
+    assert [device.status for device in status.devices] == [
+        states.SUCCESS, states.FAILURE, states.SUCCESS, states.SUCCESS, states.SUCCESS]
+    assert status.devices[0].result.stdout == "192.168.0.1"
+    assert status.devices[1].meta == {"exc_type": "RuntimeError", "exc_message": "Device is broken"}
+
+
+def test_fanout_of_reservation_without_devices(db):
+    with pytest.raises(DeviceNotFoundError):
+        create_fanout(db, SshFanoutRequest(cmd="uname", username=SshUser.ROOT, hostnames=["device-1"]))
+
+
+def test_status_of_unknown_fanout():
+    with pytest.raises(SshFanoutNotFoundError):
+        get_fanout_status("unknown")
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from src.fastapi_celery.config import server_settings
+from src.fastapi_celery.device_ssh import ssh_password
+from src.fastapi_celery.enums import DeviceType, ImageType, SshUser
+from src.fastapi_celery.exceptions import ReceivingPasswordError
+
+
+@pytest.fixture
+def uploader(monkeypatch):
+    """Password uploader which counts requests, every request takes a while."""
+    requests = []
+
+    def get_release_password(device_type: DeviceType) -> str:
+        requests.append(device_type)
+        time.sleep(0.1)
+        return f"password-{device_type}"
+
+    monkeypatch.setattr(ssh_password, "get_release_password", get_release_password)
+    return requests
+
+
+def test_dev_password_is_taken_from_settings(uploader):
+    password = ssh_password.get_password(SshUser.ROOT, ImageType.DEV, DeviceType.V2)
+
+    assert password == server_settings.SSH_SETTINGS.DEV_PASSWORD
+    assert uploader == []
+
+
+def test_release_password_is_cached(uploader):
+    first = ssh_password.get_password(SshUser.ROOT, ImageType.RELEASE, DeviceType.V2)
+    second = ssh_password.get_password(SshUser.ROOT, ImageType.RELEASE, DeviceType.V2)
+
+    assert first == second == f"password-{DeviceType.V2}"
+    assert uploader == [DeviceType.V2]
+
+
+def test_release_passwords_are_cached_per_device_type(uploader):
+    ssh_password.get_password(SshUser.ROOT, ImageType.RELEASE, DeviceType.V1)
+    ssh_password.get_password(SshUser.ROOT, ImageType.RELEASE, DeviceType.V2)
+
+    assert uploader == [DeviceType.V1, DeviceType.V2]
+
+
+def test_concurrent_requests_call_uploader_once(uploader):
+    passwords = []
+
+    def request_password() -> None:
+        passwords.append(ssh_password.get_cached_release_password(DeviceType.V2))
+
+    threads = [threading.Thread(target=request_password) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert passwords == [f"password-{DeviceType.V2}"] * 8
+    assert uploader == [DeviceType.V2]
+
+
+def test_invalidated_password_is_requested_again(uploader):
+    ssh_password.get_password(SshUser.ROOT, ImageType.RELEASE, DeviceType.V2)
+    ssh_password.invalidate_password(SshUser.ROOT, ImageType.RELEASE, DeviceType.V2)
+    ssh_password.get_password(SshUser.ROOT, ImageType.RELEASE, DeviceType.V2)
+
+    assert uploader == [DeviceType.V2, DeviceType.V2]
+
+
+def test_password_is_requested_directly_without_redis(uploader, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("Connection refused")
+
+    monkeypatch.setattr(ssh_password.redis_client, "get", unavailable)
+
+    assert ssh_password.get_cached_release_password(DeviceType.V2) == f"password-{DeviceType.V2}"
+
+
+def test_unknown_image_type_is_rejected(uploader):
+    with pytest.raises(ReceivingPasswordError):
+        ssh_password.get_password(SshUser.ROOT, ImageType.NONE, DeviceType.V2)
@@ -0,0 +1,102 @@
+import asyncio
+
+from celery import states
+from celery.result import AsyncResult
+from pydantic import BaseModel
+
+from src.fastapi_celery.device_ssh.worker import ssh_worker
+from src.fastapi_celery.task_status import (get_task_meta, get_task_state,
+                                            iter_task_updates,
+                                            wait_for_task_ready,
+                                            wait_for_task_update)
+
+TASK_ID = "task-1"
+
+
+class StatusResponse(BaseModel):
+    status: str
+
+
+def store_state(state: str, result=None) -> None:
+    ssh_worker.backend.store_result(TASK_ID, result, state)
+
+
+async def store_later(state: str, delay_s: float = 0.05) -> None:
+    await asyncio.sleep(delay_s)
+    store_state(state)
+
+
+def test_task_state_is_read_from_backend():
+    assert asyncio.run(get_task_state(ssh_worker, TASK_ID)) == states.PENDING
+
+    store_state(states.STARTED, {"cmd": "uname"})
+
+    assert asyncio.run(get_task_state(ssh_worker, TASK_ID)) == states.STARTED
+
+
+def test_wait_returns_at_once_for_finished_task():
+    store_state(states.SUCCESS)
+
+    asyncio.run(asyncio.wait_for(wait_for_task_update(ssh_worker, TASK_ID, 30), 1))
+
+
+def test_wait_returns_at_once_if_state_differs_from_known_one():
+    store_state(states.STARTED)
+
+    asyncio.run(asyncio.wait_for(
+        wait_for_task_update(ssh_worker, TASK_ID, 30, since=states.PENDING), 1))
+
+
+def test_wait_returns_on_task_update():
+    async def wait():
+        waiter = asyncio.create_task(wait_for_task_update(ssh_worker, TASK_ID, 30))
+        await store_later(states.STARTED)
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(wait())
+
+
+def test_wait_ends_by_timeout():
+    asyncio.run(asyncio.wait_for(wait_for_task_update(ssh_worker, TASK_ID, 0.1), 1))
+
+
+def test_wait_for_ready_skips_intermediate_updates():
+    async def wait():
+        waiter = asyncio.create_task(wait_for_task_ready(ssh_worker, TASK_ID, 30))
+        await store_later(states.STARTED)
+        await store_later(states.RETRY)
+        await store_later(states.SUCCESS)
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(wait()) == states.SUCCESS
+
+
+def test_updates_are_yielded_until_task_is_finished():
+    async def build_response():
+        return StatusResponse(status=await get_task_state(ssh_worker, TASK_ID))
+
+    async def collect():
+        updates = []
+        producer = asyncio.create_task(store_later(states.STARTED))
+        async for response in iter_task_updates(ssh_worker, TASK_ID, build_response):
+            updates.append(response.status)
+            if response.status == states.STARTED:
+                await store_later(states.SUCCESS)
+        await producer
+        return updates
+
+    assert asyncio.run(asyncio.wait_for(collect(), 2)) == [
+        states.PENDING, states.STARTED, states.SUCCESS]
+
+
+def test_meta_of_failed_task_is_exception():
+    ssh_worker.backend.mark_as_failure(TASK_ID, ValueError("Unexpected output"))
+
+    assert get_task_meta(AsyncResult(TASK_ID, app=ssh_worker)) == {
+        "exc_type": "ValueError", "exc_message": "Unexpected output"}
+
+
+def test_meta_of_running_task():
+    store_state(states.STARTED, {"cmd": "uname"})
+
+    assert get_task_meta(AsyncResult(TASK_ID, app=ssh_worker)) == {"cmd": "uname"}